@@ -0,0 +1,100 @@
+"""
+Revenue by month from the billing rollups vs from raw check-ins
+
+Seeds a temporary database with check-ins spread over a school year, then
+times "revenue by month" and "sessions per student this term" three ways:
+through GET /api/checkins/ summed client-side (what billing needed before),
+as a SQL aggregate over check_in, and through GET /api/reports/billing.
+
+Usage: python benchmarks/bench_billing_report.py [--checkins 200000] [--customers 300]
+"""
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def timed(fn, repeat=3):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--checkins", type=int, default=200000)
+    parser.add_argument("--customers", type=int, default=300)
+    args = parser.parse_args()
+
+    db_path = tempfile.mkdtemp(prefix="qr-bench-billing-")
+    os.environ.update(QR_CHECKIN_DB_PATH=db_path, EMAIL_OUTBOX_DISPATCHER="0", METRICS_ENABLED="0")
+    sys.path.insert(0, ROOT)
+    try:
+        from sqlalchemy import func, insert
+        from main import app
+        from db import db
+        from models.models import CheckIn, Customer, SessionType
+        from utils.billing_rollups import rebuild_rollups
+
+        client = app.test_client()
+        rng = random.Random(7)
+        start = datetime(2025, 9, 1)
+        with app.app_context():
+            db.session.execute(insert(Customer), [
+                {"firstName": "Bench", "lastName": str(i), "email": f"bench{i}@example.com", "qrCodeData": f"B-{i}"}
+                for i in range(args.customers)
+            ])
+            db.session.execute(insert(CheckIn), [
+                {"customer_id": rng.randrange(1, args.customers + 1), "session_type_id": rng.randrange(1, 4),
+                 "check_in_time": start + timedelta(minutes=rng.randrange(300 * 24 * 60))}
+                for _ in range(args.checkins)
+            ])
+            db.session.commit()
+            with db.engine.begin() as connection:
+                rollup_rows = rebuild_rollups(connection)
+        print(f"{args.checkins} check-ins, {args.customers} customers -> {rollup_rows} rollup rows")
+
+        def client_side():
+            totals = defaultdict(float)
+            for row in client.get("/api/checkins/").get_json():
+                totals[row["checkInTime"][:7]] += row["price"] or 0
+            return len(totals)
+
+        def sql_aggregate():
+            with app.app_context():
+                month = func.strftime("%Y-%m", CheckIn.check_in_time)
+                return len(db.session.query(month, func.sum(SessionType.price))
+                           .join(SessionType, CheckIn.session_type_id == SessionType.id)
+                           .group_by(month).all())
+
+        def rollup_report():
+            return len(client.get("/api/reports/billing?group_by=month").get_json()["groups"])
+
+        def term_report():
+            return len(client.get(
+                "/api/reports/billing?group_by=customer&start=2025-09-01&end=2025-12-19"
+            ).get_json()["groups"])
+
+        for label, fn in (("GET /api/checkins/ + client sum", client_side),
+                          ("SQL aggregate over check_in", sql_aggregate),
+                          ("GET /api/reports/billing month", rollup_report),
+                          ("GET /api/reports/billing term", term_report)):
+            elapsed, groups = timed(fn, repeat=1 if fn is client_side else 3)
+            print(f"{label:<34} {elapsed * 1000:>10.1f} ms  {groups:>5} groups")
+    finally:
+        shutil.rmtree(db_path, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
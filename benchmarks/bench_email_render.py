@@ -0,0 +1,60 @@
+"""
+Email body rendering and payload construction cost
+
+Compares the precompiled templates in utils/email_service.py against compiling
+the same template on every call, and reports render plus payload construction,
+for each registered email template. Nothing is queued or sent.
+
+Usage: python benchmarks/bench_email_render.py [--iterations 20000]
+"""
+import argparse
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CONTEXTS = {
+    "qr_welcome": {"customer_name": "Ada Lovelace", "qr_src": "cid:qrcode"},
+    "qr_attachment": {"customer_name": "Ada Lovelace"},
+    "simple_test": {"customer_name": "Ada Lovelace"},
+    "registration_link": {"customer_name": "Ada Lovelace", "qr_code_data": "CUSTOMER-42-AdaLovelace"},
+}
+
+
+def _timed(fn, iterations):
+    started = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - started) / iterations * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=20000)
+    args = parser.parse_args()
+
+    os.environ.setdefault("QR_CHECKIN_DB_PATH", "/tmp/qr-bench-email")
+    sys.path.insert(0, ROOT)
+    from utils import email_service
+
+    print(f"{'template':<20} {'precompiled us':>15} {'compile per call us':>20} {'+ payload us':>13}")
+    for name, context in CONTEXTS.items():
+        spec = email_service.EMAIL_TEMPLATES[name]
+        source_name = spec.get("html") or spec.get("text")
+        with open(os.path.join(email_service.EMAIL_TEMPLATE_DIR, source_name)) as f:
+            source = f.read()
+
+        precompiled = _timed(lambda: email_service.render_email(name, **context), args.iterations)
+        per_call = _timed(lambda: email_service._env.from_string(source).render(**context), max(1, args.iterations // 20))
+
+        def render_and_build():
+            subject, content = email_service.render_email(name, **context)
+            email_service.build_payload("ada@example.com", subject, content)
+
+        with_payload = _timed(render_and_build, args.iterations)
+        print(f"{name:<20} {precompiled:>15.1f} {per_call:>20.1f} {with_payload:>13.1f}")
+
+
+if __name__ == "__main__":
+    main()
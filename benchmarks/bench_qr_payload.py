@@ -0,0 +1,58 @@
+"""
+Registration-page QR payloads (CUSTOMER-<id>-<name>) vs compact signed payloads:
+QR version, module count and render time, plus the cost of verifying a scan
+
+Usage: python benchmarks/bench_qr_payload.py [--customers 500]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def describe(label, payloads, render_uncached):
+    import qrcode
+
+    versions = []
+    for payload in payloads:
+        qr = qrcode.QRCode(version=1)
+        qr.add_data(payload)
+        qr.make(fit=True)
+        versions.append(qr.version)
+    started = time.perf_counter()
+    sizes = [len(render_uncached(payload, 10, 4, "png")) for payload in payloads]
+    elapsed = time.perf_counter() - started
+    print(f"{label:<10} avg {sum(map(len, payloads)) / len(payloads):5.1f} chars  "
+          f"version {min(versions)}-{max(versions)} ({17 + 4 * max(versions)} modules)  "
+          f"render {elapsed / len(payloads) * 1000:5.2f} ms  png {sum(sizes) / len(sizes) / 1024:4.1f} KiB")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--customers", type=int, default=500)
+    args = parser.parse_args()
+
+    os.environ.setdefault("QR_SIGNING_KEY", "benchmark-key")
+    os.environ.setdefault("QR_CHECKIN_DB_PATH", tempfile.mkdtemp(prefix="qr-bench-payload-"))
+    sys.path.insert(0, ROOT)
+    from utils.qr_payload import check_qr_value, issue_signed_qr
+    from utils.qr_render import render_uncached
+
+    names = [("Alexandra", "Montgomery-Whitfield"), ("Jo", "Li"), ("Christopher", "Vanderberg")]
+    ids = range(1000, 1000 + args.customers)
+    legacy = [f"CUSTOMER-{i}-{names[i % 3][0]}{names[i % 3][1]}" for i in ids]
+    signed = [issue_signed_qr(i) for i in ids]
+    describe("legacy", legacy, render_uncached)
+    describe("signed", signed, render_uncached)
+
+    started = time.perf_counter()
+    for payload in signed:
+        check_qr_value(payload)
+    print(f"verify     {(time.perf_counter() - started) / len(signed) * 1e6:.1f} us per scan, no database access")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""
+Concurrent slow-upstream requests under the sync and gthread gunicorn profiles
+
+Starts gunicorn with gunicorn.conf.py against a copy of the app whose QuickBooks
+calls are replaced by a fixed delay (standing in for a slow API), fires a burst
+of concurrent create-invoice requests, and meanwhile measures check-in latency.
+
+Usage: python benchmarks/bench_serving.py [--invoices 24] [--delay 0.5]
+"""
+import argparse
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROFILES = [
+    {"name": "sync 2x1", "GUNICORN_WORKER_CLASS": "sync", "WEB_CONCURRENCY": "2", "GUNICORN_THREADS": "1"},
+    {"name": "gthread 2x8", "GUNICORN_WORKER_CLASS": "gthread", "WEB_CONCURRENCY": "2", "GUNICORN_THREADS": "8"},
+]
+
+
+class _FakeResponse:
+    status_code = 200
+
+    def json(self):
+        return {"Invoice": {"Id": "1"}}
+
+
+def slow_upstream_app():
+    """App factory used by gunicorn in this benchmark: QuickBooks calls just sleep"""
+    from main import app
+    import routes.quickbooks_routes as quickbooks_routes
+
+    delay = float(os.environ.get("BENCH_UPSTREAM_DELAY", "0.5"))
+    token = {"access_token": "bench", "realm_id": "bench", "refresh_token": None,
+             "expires_at": __import__("datetime").datetime(2099, 1, 1)}
+    quickbooks_routes.token_manager.get_token = lambda: token
+    quickbooks_routes.token_manager.get_valid_token = lambda: token
+
+    def slow_qbo_request(method, api_url, token_data, path, params=None, json=None):
+        time.sleep(delay)
+        return _FakeResponse()
+
+    quickbooks_routes.qbo_request = slow_qbo_request
+    return app
+
+
+def _wait_ready(base_url, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if requests.get(f"{base_url}/api/sessions/", timeout=1).status_code == 200:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError("gunicorn did not start")
+
+
+def run(profile, invoices, delay, port):
+    db_path = tempfile.mkdtemp(prefix="qr-bench-serving-")
+    env = dict(os.environ, PORT=str(port), QR_CHECKIN_DB_PATH=db_path, EMAIL_OUTBOX_DISPATCHER="0",
+               BENCH_UPSTREAM_DELAY=str(delay), **{k: v for k, v in profile.items() if k != "name"})
+    server = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "--access-logfile", "/dev/null",
+         "benchmarks.bench_serving:slow_upstream_app()"],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        _wait_ready(base_url)
+        requests.post(f"{base_url}/api/customers/register", json={
+            "firstName": "Bench", "lastName": "Serving", "email": "bench@example.com", "qrCodeData": "BENCH-1"
+        })
+
+        def invoice(_):
+            return requests.post(f"{base_url}/api/quickbooks/create-invoice", json={
+                "customer_name": "Bench Serving", "amount": 50, "description": "Bench"
+            }).status_code
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=invoices) as pool:
+            futures = [pool.submit(invoice, i) for i in range(invoices)]
+            checkin_latencies = []
+            time.sleep(0.05)
+            while not all(f.done() for f in futures):
+                t = time.perf_counter()
+                requests.post(f"{base_url}/api/checkins/", json={"qrCodeValue": "BENCH-1", "sessionTypeId": 1})
+                checkin_latencies.append(time.perf_counter() - t)
+            statuses = [f.result() for f in futures]
+        elapsed = time.perf_counter() - started
+    finally:
+        server.terminate()
+        server.wait()
+        shutil.rmtree(db_path, ignore_errors=True)
+
+    return {
+        "invoices_ok": statuses.count(200),
+        "invoices_503": statuses.count(503),
+        "elapsed": elapsed,
+        "checkins": len(checkin_latencies),
+        "checkin_p50_ms": statistics.median(checkin_latencies) * 1000 if checkin_latencies else 0,
+        "checkin_max_ms": max(checkin_latencies) * 1000 if checkin_latencies else 0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--invoices", type=int, default=24)
+    parser.add_argument("--delay", type=float, default=0.5)
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    print(f"{args.invoices} concurrent invoices, {args.delay}s simulated QuickBooks latency")
+    print(f"{'profile':<14} {'ok':>4} {'503':>4} {'elapsed s':>10} {'check-ins':>10} {'p50 ms':>8} {'max ms':>8}")
+    for profile in PROFILES:
+        result = run(profile, args.invoices, args.delay, args.port)
+        print(f"{profile['name']:<14} {result['invoices_ok']:>4} {result['invoices_503']:>4} "
+              f"{result['elapsed']:>10.2f} {result['checkins']:>10} "
+              f"{result['checkin_p50_ms']:>8.1f} {result['checkin_max_ms']:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
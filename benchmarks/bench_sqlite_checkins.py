@@ -0,0 +1,97 @@
+"""
+Concurrent check-in throughput with and without the SQLite production profile
+
+Spawns several processes (standing in for gunicorn workers), each posting
+check-ins through the Flask test client against a shared temporary database,
+and reports check-ins per second and failed requests for each profile.
+
+Usage: python benchmarks/bench_sqlite_checkins.py [--workers 4] [--checkins 300]
+"""
+import argparse
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _load_app(db_path, profile):
+    os.environ["QR_CHECKIN_DB_PATH"] = db_path
+    os.environ["SQLITE_PROFILE"] = profile
+    sys.path.insert(0, ROOT)
+    from main import app
+    return app
+
+
+def _prepare(db_path, profile, customers):
+    app = _load_app(db_path, profile)
+    client = app.test_client()
+    for i in range(customers):
+        client.post("/api/customers/register", json={
+            "firstName": "Bench",
+            "lastName": str(i),
+            "email": f"bench{i}@example.com",
+            "qrCodeData": f"BENCH-{i}"
+        })
+
+
+def _worker(db_path, profile, worker_id, checkins, customers, start_event, results):
+    app = _load_app(db_path, profile)
+    client = app.test_client()
+    start_event.wait()
+    failures = 0
+    started = time.perf_counter()
+    for i in range(checkins):
+        response = client.post("/api/checkins/", json={
+            "qrCodeValue": f"BENCH-{(worker_id + i) % customers}",
+            "sessionTypeId": 1
+        })
+        if response.status_code != 201:
+            failures += 1
+    results.put((time.perf_counter() - started, failures))
+
+
+def run(profile, workers, checkins, customers):
+    db_path = tempfile.mkdtemp(prefix=f"qr-bench-{profile}-")
+    try:
+        ctx = multiprocessing.get_context("spawn")
+        setup = ctx.Process(target=_prepare, args=(db_path, profile, customers))
+        setup.start()
+        setup.join()
+
+        start_event = ctx.Event()
+        results = ctx.Queue()
+        procs = [
+            ctx.Process(target=_worker, args=(db_path, profile, w, checkins, customers, start_event, results))
+            for w in range(workers)
+        ]
+        for proc in procs:
+            proc.start()
+        # Give workers time to import the app before releasing them together
+        time.sleep(3)
+        wall_start = time.perf_counter()
+        start_event.set()
+        outcomes = [results.get() for _ in procs]
+        wall = time.perf_counter() - wall_start
+        for proc in procs:
+            proc.join()
+    finally:
+        shutil.rmtree(db_path, ignore_errors=True)
+
+    total = workers * checkins
+    failures = sum(f for _, f in outcomes)
+    print(f"{profile:>10}: {total} check-ins from {workers} workers in {wall:.2f}s "
+          f"-> {(total - failures) / wall:.0f} check-ins/s, {failures} failed")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--checkins", type=int, default=300)
+    parser.add_argument("--customers", type=int, default=50)
+    args = parser.parse_args()
+    for profile in ("default", "production"):
+        run(profile, args.workers, args.checkins, args.customers)
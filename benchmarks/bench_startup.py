@@ -0,0 +1,93 @@
+"""
+Worker cold start: time to import main and build the app in a fresh interpreter
+
+Each run is a new Python process (as a gunicorn worker or a Railway restart
+would be). "fresh db" starts from an empty data directory, "initialized db"
+reuses one that an earlier process already created and stamped. The slowest
+imports of the last run are listed from python -X importtime.
+
+Usage: python benchmarks/bench_startup.py [--runs 5] [--lazy 1]
+"""
+import argparse
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+BOOT_SCRIPT = """
+import time
+started = time.perf_counter()
+from main import app
+booted = time.perf_counter()
+client = app.test_client()
+client.get("/api/quickbooks/scheduler")
+first_lazy = time.perf_counter()
+print(f"BOOT {booted - started:.6f} {first_lazy - booted:.6f}")
+"""
+
+
+def boot_once(db_path, lazy, importtime=False):
+    env = dict(os.environ, QR_CHECKIN_DB_PATH=db_path, EMAIL_OUTBOX_DISPATCHER="0", LAZY_BLUEPRINTS=lazy)
+    command = [sys.executable] + (["-X", "importtime"] if importtime else []) + ["-c", BOOT_SCRIPT]
+    result = subprocess.run(command, cwd=ROOT, env=env, capture_output=True, text=True, check=True)
+    line = next(l for l in result.stdout.splitlines() if l.startswith("BOOT "))
+    boot, first_lazy = (float(v) for v in line.split()[1:])
+    return boot, first_lazy, result.stderr
+
+
+def slowest_imports(importtime_output, top=10):
+    rows = []
+    for line in importtime_output.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative_us, name = line[len("import time:"):].split("|")
+        # Children are listed before their parent: anything before the last
+        # top-level import ahead of main (e.g. site startup) is not under main
+        if name.strip() == "main":
+            break
+        if not name.startswith("  "):
+            rows = []
+        # Only direct imports of main (one level of indent under it) are interesting
+        elif name.startswith("   ") and not name.startswith("    "):
+            rows.append((int(cumulative_us), name.strip()))
+    return sorted(rows, reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--lazy", default="1", help="LAZY_BLUEPRINTS value for the app")
+    args = parser.parse_args()
+
+    print(f"{args.runs} runs per case, LAZY_BLUEPRINTS={args.lazy}")
+    print(f"{'case':<16} {'boot p50 ms':>12} {'boot min ms':>12} {'1st QB request ms':>18}")
+    for case in ("fresh db", "initialized db"):
+        boots, first_lazy = [], []
+        shared_path = tempfile.mkdtemp(prefix="qr-bench-startup-")
+        try:
+            if case == "initialized db":
+                boot_once(shared_path, args.lazy)
+            for _ in range(args.runs):
+                db_path = tempfile.mkdtemp(prefix="qr-bench-startup-") if case == "fresh db" else shared_path
+                boot, lazy_request, _ = boot_once(db_path, args.lazy)
+                boots.append(boot)
+                first_lazy.append(lazy_request)
+                if db_path != shared_path:
+                    shutil.rmtree(db_path, ignore_errors=True)
+            _, _, importtime_output = boot_once(shared_path, args.lazy, importtime=True)
+        finally:
+            shutil.rmtree(shared_path, ignore_errors=True)
+        print(f"{case:<16} {statistics.median(boots) * 1000:>12.1f} {min(boots) * 1000:>12.1f} "
+              f"{statistics.median(first_lazy) * 1000:>18.1f}")
+
+    print("\nslowest imports under main (cumulative ms, initialized db):")
+    for cumulative_us, name in slowest_imports(importtime_output):
+        print(f"  {cumulative_us / 1000:>8.1f}  {name}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,29 @@
+from threading import Lock
+
 from flask_sqlalchemy import SQLAlchemy
 
-db = SQLAlchemy()
 
+class SharedEngineSQLAlchemy(SQLAlchemy):
+    """
+    SQLAlchemy extension whose apps share one Engine per bind and database URL
+    main.py serves rarely used route groups from lazily built sub-apps (see
+    utils/lazy_blueprints.py); each calls init_app, and without this each would
+    get its own engine and connection pool to the same file.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._shared_engines = {}
+        self._shared_engines_lock = Lock()
+
+    def _make_engine(self, bind_key, options, app):
+        url = options["url"]
+        key = (bind_key, url if isinstance(url, str) else url.render_as_string(hide_password=False))
+        with self._shared_engines_lock:
+            engine = self._shared_engines.get(key)
+            if engine is None:
+                engine = self._shared_engines[key] = super()._make_engine(bind_key, options, app)
+            return engine
+
+
+db = SharedEngineSQLAlchemy()
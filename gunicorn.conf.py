@@ -0,0 +1,26 @@
+"""
+Gunicorn serving profile (used by the Procfile and railway.json)
+Default is the threaded "gthread" worker: each worker process serves several
+requests at once on OS threads, so a request waiting on SendGrid or QuickBooks
+blocks only its own thread instead of the whole worker. Threads (rather than
+gevent) keep working with everything the app already relies on: the outbox
+dispatcher and token refresher threads, fcntl locks and the QR render process
+pool. Slow QuickBooks endpoints are additionally capped per worker by
+utils.concurrency so check-ins always have threads available.
+
+Tested setting for a small (1 vCPU / 512 MB) container: 2 workers x 8 threads.
+With GUNICORN_WORKER_CLASS=sync the app behaves exactly as before.
+"""
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+worker_class = os.environ.get("GUNICORN_WORKER_CLASS", "gthread")
+# SQLite allows a single writer, so a few workers with many threads beats many workers
+workers = int(os.environ.get("WEB_CONCURRENCY", "2"))
+# Gunicorn silently turns "sync" into gthread when threads > 1, so sync gets one thread
+threads = int(os.environ.get("GUNICORN_THREADS", "8" if worker_class == "gthread" else "1"))
+# A QuickBooks sync run paces itself under the API rate limits and can take a minute or two
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", "180"))
+graceful_timeout = 30
+keepalive = 5
+accesslog = "-"
@@ -20,49 +20,86 @@ try:
 except ImportError:
     pass  # dotenv not available, using hardcoded defaults
 
-# Create Flask app with explicit instance_path to avoid conflicts
-app = Flask(__name__, 
-            static_folder="static", 
-            static_url_path="/",
-            instance_path="/tmp/flask_instance")
-CORS(app)
-
-# Configure the database - use /tmp for Railway (always writable)
-database_path = os.environ.get("QR_CHECKIN_DB_PATH", "/tmp/data")
-if not os.path.exists(database_path):
-    os.makedirs(database_path, exist_ok=True)
-app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{os.path.join(database_path, 'app.db')}"
-print(f"Database path: {os.path.join(database_path, 'app.db')}")
-app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
-app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {"pool_pre_ping": True}
-db.init_app(app)
-
-# Import models after db is defined to avoid circular imports
-from models.models import Customer, SessionType, CheckIn, QuickBooksToken
-
-# Register blueprints
-from routes.customer_routes import customer_bp
-from routes.session_routes import session_bp
-from routes.checkin_routes import checkin_bp
-from routes.quickbooks_routes import quickbooks_bp
-from routes.email_routes import email_bp
-from routes.email_routes_v2 import email_bp_v2
-from routes.email_routes_simple import email_simple_bp
-from routes.email_routes_attachment import email_attachment_bp
-from routes.email_routes_improved import email_improved_bp
-
-app.register_blueprint(customer_bp, url_prefix="/api/customers")
-app.register_blueprint(session_bp, url_prefix="/api/sessions")
-app.register_blueprint(checkin_bp, url_prefix="/api/checkins")
-app.register_blueprint(quickbooks_bp, url_prefix="/api/quickbooks")
-app.register_blueprint(email_bp, url_prefix="/api/email")
-app.register_blueprint(email_bp_v2, url_prefix="/api/email")
-app.register_blueprint(email_simple_bp, url_prefix="/api/email")
-app.register_blueprint(email_attachment_bp, url_prefix="/api/email")
-app.register_blueprint(email_improved_bp, url_prefix="/api/email")
-
-def create_tables_and_initial_data():
-    db.create_all()
+from utils.sqlite_tuning import sqlite_engine_options, apply_sqlite_pragmas
+from utils.metrics import METRICS_ENABLED, MetricsMiddleware, instrument_app, instrument_sql, start_metrics_flusher
+
+STATIC_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+
+# QuickBooks, email and report routes are imported on their first request (see
+# utils/lazy_blueprints.py); set LAZY_BLUEPRINTS=0 to register everything at boot
+LAZY_BLUEPRINTS = os.environ.get("LAZY_BLUEPRINTS", "1").lower() not in ("0", "false", "no")
+
+
+def _base_app(name, static_folder=None, static_url_path=None):
+    """Flask app with CORS and the shared database configuration"""
+    # Explicit instance_path to avoid conflicts
+    flask_app = Flask(name,
+                      static_folder=static_folder,
+                      static_url_path=static_url_path,
+                      instance_path="/tmp/flask_instance")
+    CORS(flask_app)
+    instrument_app(flask_app)
+
+    # Configure the database - use /tmp for Railway (always writable)
+    database_path = os.environ.get("QR_CHECKIN_DB_PATH", "/tmp/data")
+    if not os.path.exists(database_path):
+        os.makedirs(database_path, exist_ok=True)
+    flask_app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{os.path.join(database_path, 'app.db')}"
+    flask_app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    # SQLite tuning (WAL, busy timeout, pragmas, pooling) - see utils/sqlite_tuning.py
+    flask_app.config["SQLALCHEMY_ENGINE_OPTIONS"] = sqlite_engine_options()
+    db.init_app(flask_app)
+    with flask_app.app_context():
+        apply_sqlite_pragmas(db.engine)
+
+    @flask_app.errorhandler(404)
+    def not_found(e):
+        return send_from_directory(STATIC_FOLDER, "index.html")
+
+    return flask_app
+
+
+def _register_quickbooks(flask_app):
+    from routes.quickbooks_routes import quickbooks_bp
+    flask_app.register_blueprint(quickbooks_bp, url_prefix="/api/quickbooks")
+
+
+def _register_email(flask_app):
+    from routes.email_routes import email_bp
+    from routes.email_routes_v2 import email_bp_v2
+    from routes.email_routes_simple import email_simple_bp
+    from routes.email_routes_attachment import email_attachment_bp
+    from routes.email_routes_improved import email_improved_bp
+    flask_app.register_blueprint(email_bp, url_prefix="/api/email")
+    flask_app.register_blueprint(email_bp_v2, url_prefix="/api/email")
+    flask_app.register_blueprint(email_simple_bp, url_prefix="/api/email")
+    flask_app.register_blueprint(email_attachment_bp, url_prefix="/api/email")
+    flask_app.register_blueprint(email_improved_bp, url_prefix="/api/email")
+
+
+def _register_reports(flask_app):
+    from routes.report_routes import report_bp
+    flask_app.register_blueprint(report_bp, url_prefix="/api/reports")
+
+
+# URL prefix -> function registering that group's blueprints
+LAZY_GROUPS = {
+    "/api/quickbooks": _register_quickbooks,
+    "/api/email": _register_email,
+    "/api/reports": _register_reports,
+}
+
+
+def _lazy_group_app(register):
+    def build():
+        group_app = _base_app(__name__)
+        register(group_app)
+        return group_app
+    return build
+
+
+def _seed_session_types():
+    from models.models import SessionType
     # Add initial session types if they don't exist
     if not SessionType.query.first():
         initial_session_types = [
@@ -73,16 +110,64 @@ def create_tables_and_initial_data():
         db.session.add_all(initial_session_types)
         db.session.commit()
 
-@app.route("/")
-def serve_index():
-    return send_from_directory(app.static_folder, "index.html")
 
-@app.errorhandler(404)
-def not_found(e):
-    return send_from_directory(app.static_folder, "index.html")
+def create_app():
+    # On Railway a generated QR signing key would be lost on redeploy; fail the deploy instead
+    from utils.qr_payload import require_signing_key
+    require_signing_key()
+
+    flask_app = _base_app(__name__, static_folder=STATIC_FOLDER, static_url_path="/")
+    print(f"Database path: {flask_app.config['SQLALCHEMY_DATABASE_URI'][len('sqlite:///'):]}")
+
+    # Import models after db is defined to avoid circular imports
+    import models.models  # noqa: F401
+
+    # Register blueprints
+    from routes.customer_routes import customer_bp
+    from routes.session_routes import session_bp
+    from routes.checkin_routes import checkin_bp
+
+    flask_app.register_blueprint(customer_bp, url_prefix="/api/customers")
+    flask_app.register_blueprint(session_bp, url_prefix="/api/sessions")
+    flask_app.register_blueprint(checkin_bp, url_prefix="/api/checkins")
+
+    if LAZY_BLUEPRINTS:
+        from utils.lazy_blueprints import LazyPrefixDispatcher
+        flask_app.wsgi_app = LazyPrefixDispatcher(flask_app.wsgi_app, {
+            prefix: _lazy_group_app(register) for prefix, register in LAZY_GROUPS.items()
+        })
+    else:
+        for register in LAZY_GROUPS.values():
+            register(flask_app)
+
+    if METRICS_ENABLED:
+        from routes.metrics_routes import metrics_bp
+        flask_app.register_blueprint(metrics_bp)
+        instrument_sql()
+        # Outermost wrapper, so it also times the lazily mounted groups
+        flask_app.wsgi_app = MetricsMiddleware(flask_app.wsgi_app)
+        start_metrics_flusher()
+
+    @flask_app.route("/")
+    def serve_index():
+        return send_from_directory(flask_app.static_folder, "index.html")
+
+    # Schema, migrations and seed data run once per schema version, not once per worker
+    from utils.db_init import initialize_database
+    with flask_app.app_context():
+        initialize_database(seed=_seed_session_types)
+
+    # Background delivery for queued emails (disable with EMAIL_OUTBOX_DISPATCHER=0)
+    from utils.email_outbox import start_outbox_dispatcher
+    start_outbox_dispatcher(flask_app)
+
+    return flask_app
+
 
-with app.app_context():
-    create_tables_and_initial_data()
+# Render pool processes re-run this file as __mp_main__ (multiprocessing's spawn/forkserver
+# bootstrap); they only need utils.qr_render, not a second app with its own DB and threads
+if __name__ != "__mp_main__":
+    app = create_app()
 
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", 5000))
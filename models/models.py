@@ -32,10 +32,141 @@ class CheckIn(db.Model):
     check_in_time = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
     notes = db.Column(db.String(500), nullable=True)
 
+    # Existing databases get these through utils/migrations.py
+    __table_args__ = (
+        db.Index("ix_check_in_customer_time", "customer_id", "check_in_time"),
+        db.Index("ix_check_in_session_type_time", "session_type_id", "check_in_time"),
+        db.Index("ix_check_in_check_in_time", "check_in_time"),
+    )
+
     def __repr__(self):
         return f"<CheckIn {self.customer_id} at {self.check_in_time}>"
 
+class CheckInIdempotencyKey(db.Model):
+    """Client-supplied key recorded for each check-in synced from an offline kiosk"""
+    key = db.Column(db.String(128), primary_key=True)
+    checkin_id = db.Column(db.Integer, db.ForeignKey("check_in.id"), nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<CheckInIdempotencyKey {self.key} -> {self.checkin_id}>"
+
+
+class RecentScan(db.Model):
+    """Latest check-in per customer and session type, for the duplicate-scan window (utils/scan_dedupe.py)"""
+    customer_id = db.Column(db.Integer, db.ForeignKey("customer.id"), primary_key=True)
+    session_type_id = db.Column(db.Integer, db.ForeignKey("session_type.id"), primary_key=True)
+    checkin_id = db.Column(db.Integer, db.ForeignKey("check_in.id"), nullable=False)
+    check_in_time = db.Column(db.DateTime, nullable=False)
+
+    def __repr__(self):
+        return f"<RecentScan {self.customer_id}/{self.session_type_id} -> {self.checkin_id}>"
+
+
+class CheckInDailyRollup(db.Model):
+    """Check-in count and revenue per customer, session type and UTC day (utils/billing_rollups.py)"""
+    customer_id = db.Column(db.Integer, db.ForeignKey("customer.id"), primary_key=True)
+    session_type_id = db.Column(db.Integer, db.ForeignKey("session_type.id"), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    checkin_count = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Float, nullable=False, default=0.0)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index("ix_check_in_daily_rollup_day", "day"),
+    )
+
+    def __repr__(self):
+        return f"<CheckInDailyRollup {self.customer_id}/{self.session_type_id} {self.day}: {self.checkin_count}>"
+
+
+class CheckInMonthlyRollup(db.Model):
+    """Check-in count and revenue per customer, session type and UTC month ("YYYY-MM")"""
+    customer_id = db.Column(db.Integer, db.ForeignKey("customer.id"), primary_key=True)
+    session_type_id = db.Column(db.Integer, db.ForeignKey("session_type.id"), primary_key=True)
+    month = db.Column(db.String(7), primary_key=True)
+    checkin_count = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Float, nullable=False, default=0.0)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index("ix_check_in_monthly_rollup_month", "month"),
+    )
+
+    def __repr__(self):
+        return f"<CheckInMonthlyRollup {self.customer_id}/{self.session_type_id} {self.month}: {self.checkin_count}>"
+
+
+class CheckInSync(db.Model):
+    """QuickBooks sync state for one check-in (utils/quickbooks_sync.py)"""
+    checkin_id = db.Column(db.Integer, db.ForeignKey("check_in.id"), primary_key=True)
+    status = db.Column(db.String(20), nullable=False, default="pending")  # pending, synced, failed, unmapped, skipped
+    qbo_entity = db.Column(db.String(20), nullable=True)
+    qbo_id = db.Column(db.String(50), nullable=True)
+    doc_number = db.Column(db.String(21), nullable=False)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    last_error = db.Column(db.String(1000), nullable=True)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index("ix_check_in_sync_status", "status"),
+    )
+
+    def __repr__(self):
+        return f"<CheckInSync {self.checkin_id} {self.status}>"
+
+class QuickBooksCustomerMap(db.Model):
+    """Local customer -> QuickBooks Customer Id (utils/quickbooks_mapping.py)"""
+    customer_id = db.Column(db.Integer, db.ForeignKey("customer.id"), primary_key=True)
+    qbo_id = db.Column(db.String(50), nullable=False)
+    qbo_display_name = db.Column(db.String(200), nullable=True)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class QuickBooksItemMap(db.Model):
+    """Local session type -> QuickBooks Item Id (utils/quickbooks_mapping.py)"""
+    session_type_id = db.Column(db.Integer, db.ForeignKey("session_type.id"), primary_key=True)
+    qbo_id = db.Column(db.String(50), nullable=False)
+    qbo_name = db.Column(db.String(200), nullable=True)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class QuickBooksSyncState(db.Model):
+    """Small key/value store for QuickBooks watermarks such as the last CDC time"""
+    key = db.Column(db.String(100), primary_key=True)
+    value = db.Column(db.String(500), nullable=True)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class EmailOutbox(db.Model):
+    """Email waiting to be delivered by the background dispatcher (utils/email_outbox.py)"""
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)
+    to_email = db.Column(db.String(120), nullable=False)
+    subject = db.Column(db.String(200), nullable=True)
+    payload = db.Column(db.Text, nullable=False)  # SendGrid mail/send JSON body
+    status = db.Column(db.String(20), nullable=False, default="queued")  # queued, sending, sent, failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    locked_until = db.Column(db.DateTime, nullable=True)
+    last_error = db.Column(db.String(1000), nullable=True)
+    sent_at = db.Column(db.DateTime, nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index("ix_email_outbox_status_next_attempt", "status", "next_attempt_at"),
+    )
 
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "to_email": self.to_email,
+            "status": self.status,
+            "attempts": self.attempts,
+            "next_attempt_at": self.next_attempt_at.isoformat() if self.next_attempt_at else None,
+            "last_error": self.last_error,
+            "sent_at": self.sent_at.isoformat() if self.sent_at else None,
+            "created_at": self.created_at.isoformat()
+        }
 
 class QuickBooksToken(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -1,11 +1,33 @@
 
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, Response, stream_with_context
 from db import db
-from models.models import CheckIn, Customer, SessionType
-from datetime import datetime
+from models.models import CheckIn, CheckInIdempotencyKey, Customer
+from datetime import datetime, timezone
+import csv
+import io
+import json
+from sqlalchemy import and_, or_, insert
+from sqlalchemy.exc import IntegrityError
+from utils.checkin_queries import (
+    joined_checkins_query, apply_checkin_filters, serialize_checkin_row,
+    encode_cursor, decode_cursor
+)
+from utils.lookup_cache import resolve_customer_by_qr, get_session_type
+from utils.billing_rollups import record_checkins
+from utils.scan_dedupe import recent_checkin, claim_scan, record_scans, remember_scan, checkin_payload
+from utils.qr_payload import check_qr_value
 
 checkin_bp = Blueprint("checkin_bp", __name__)
 
+HISTORY_DEFAULT_LIMIT = 50
+HISTORY_MAX_LIMIT = 200
+EXPORT_BATCH_SIZE = 1000
+BATCH_MAX_SCANS = 1000
+EXPORT_CSV_FIELDS = [
+    "id", "customerId", "customerName", "sessionTypeId", "sessionType",
+    "checkInTime", "price", "notes"
+]
+
 @checkin_bp.route("/", methods=["POST"])
 def create_checkin():
     data = request.get_json()
@@ -16,45 +38,296 @@ def create_checkin():
     if not all([qrCodeValue, sessionTypeId]):
         return jsonify({"error": "Missing required fields"}), 400
 
-    customer = Customer.query.filter_by(qrCodeData=qrCodeValue).first()
+    # Forged or garbled codes are rejected by signature before any query
+    qr_check = check_qr_value(qrCodeValue)
+    if qr_check.error:
+        return jsonify({"error": qr_check.error}), 400
+
+    customer = resolve_customer_by_qr(qr_check.value, qr_check.customer_id)
     if not customer:
         return jsonify({"error": "Customer not found for this QR code"}), 404
 
-    session_type = SessionType.query.get(sessionTypeId)
+    session_type = get_session_type(sessionTypeId)
     if not session_type:
         return jsonify({"error": "Session type not found"}), 404
 
+    # Repeat scans inside the dedupe window get the existing check-in, with no write
+    now = datetime.utcnow()
+    duplicate = recent_checkin(customer["id"], session_type["id"], now)
+    if duplicate:
+        return jsonify({"message": "Already checked in", "duplicate": True, "checkin": duplicate}), 200
+
     new_checkin = CheckIn(
-        customer_id=customer.id,
-        session_type_id=session_type.id,
+        customer_id=customer["id"],
+        session_type_id=session_type["id"],
         notes=notes,
-        check_in_time=datetime.utcnow()
+        check_in_time=now
     )
     db.session.add(new_checkin)
+    db.session.flush()
+    duplicate = claim_scan(new_checkin)
+    if duplicate:
+        # Another worker recorded this scan a moment ago
+        db.session.rollback()
+        return jsonify({"message": "Already checked in", "duplicate": True, "checkin": duplicate}), 200
+    record_checkins([(customer["id"], session_type["id"], now, session_type["price"])])
+    # Built before commit, which would expire the instance and cost a refresh query
+    payload = checkin_payload(new_checkin.id, customer["id"], session_type["id"], now, notes)
     db.session.commit()
 
-    return jsonify({"message": "Check-in successful", "checkin": {
-        "id": new_checkin.id,
-        "customer_id": new_checkin.customer_id,
-        "session_type_id": new_checkin.session_type_id,
-        "check_in_time": new_checkin.check_in_time.isoformat(),
-        "notes": new_checkin.notes
-    }}), 201
+    remember_scan(payload, now)
+    return jsonify({"message": "Check-in successful", "checkin": payload}), 201
+
+@checkin_bp.route("/batch", methods=["POST"])
+def create_checkins_batch():
+    """
+    Record a queue of scans synced from an offline kiosk in one transaction
+    Body: {"scans": [{"qrCodeValue", "sessionTypeId", "notes", "checkInTime", "idempotencyKey"}]}
+    Scans whose idempotencyKey was already recorded are reported as duplicates.
+    Scans are not checked against the duplicate-scan window (each one happened at
+    the kiosk), but ones inside it are recorded there, so a live scan right after
+    the sync gets the synced check-in instead of a new one.
+    """
+    data = request.get_json(silent=True) or {}
+    scans = data.get("scans")
+    if not isinstance(scans, list) or not scans:
+        return jsonify({"error": "scans must be a non-empty list"}), 400
+    if len(scans) > BATCH_MAX_SCANS:
+        return jsonify({"error": f"Too many scans: at most {BATCH_MAX_SCANS} per request"}), 400
+
+    try:
+        results = _record_scan_batch(scans)
+    except IntegrityError:
+        # A concurrent sync recorded some of the same keys; they now resolve as duplicates
+        db.session.rollback()
+        try:
+            results = _record_scan_batch(scans)
+        except IntegrityError:
+            # Still racing another sync; nothing was recorded, so resending the same batch is safe
+            db.session.rollback()
+            return jsonify({"error": "Conflicting concurrent sync; retry this batch", "retryable": True}), 409
+
+    summary = {"created": 0, "duplicate": 0, "error": 0}
+    for result in results:
+        summary[result["status"]] += 1
+    return jsonify({"results": results, "summary": summary}), 200
+
+def _parse_scan_time(value):
+    """Parse a client ISO timestamp into naive UTC, matching check_in_time storage"""
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+def _record_scan_batch(scans):
+    results = [None] * len(scans)
+    pending = []
+
+    dict_scans = [scan for scan in scans if isinstance(scan, dict)]
+    qr_checks = {
+        scan["qrCodeValue"]: check_qr_value(scan["qrCodeValue"])
+        for scan in dict_scans if isinstance(scan.get("qrCodeValue"), str)
+    }
+    qr_values = {value for value, check in qr_checks.items() if check.kind == "unsigned"}
+    signed_ids = {check.customer_id for check in qr_checks.values() if check.kind == "signed"}
+    keys = {scan.get("idempotencyKey") for scan in dict_scans if isinstance(scan.get("idempotencyKey"), str)}
+
+    # One IN query each for unsigned QR values, signed customer ids and previously recorded keys
+    customer_ids = dict(
+        db.session.query(Customer.qrCodeData, Customer.id)
+        .filter(Customer.qrCodeData.in_(qr_values)).all()
+    ) if qr_values else {}
+    # Signed codes by primary key; a code only counts while it is the customer's stored one
+    stored_signed_codes = dict(
+        db.session.query(Customer.id, Customer.qrCodeData).filter(Customer.id.in_(signed_ids)).all()
+    ) if signed_ids else {}
+    for value, check in qr_checks.items():
+        if check.kind == "signed" and stored_signed_codes.get(check.customer_id) == check.value:
+            customer_ids[value] = check.customer_id
+    existing_keys = dict(
+        db.session.query(CheckInIdempotencyKey.key, CheckInIdempotencyKey.checkin_id)
+        .filter(CheckInIdempotencyKey.key.in_(keys)).all()
+    ) if keys else {}
+
+    seen_keys = {}
+    for index, scan in enumerate(scans):
+        if not isinstance(scan, dict):
+            results[index] = {"index": index, "status": "error", "error": "Scan must be an object"}
+            continue
+        key = scan.get("idempotencyKey")
+        if key is not None and (not isinstance(key, str) or len(key) > 128):
+            results[index] = {"index": index, "status": "error", "error": "Invalid idempotencyKey"}
+            continue
+        if key in existing_keys:
+            results[index] = {"index": index, "status": "duplicate", "checkinId": existing_keys[key]}
+            continue
+        if key in seen_keys:
+            # Resolved to the first scan's id once it is inserted
+            results[index] = {"index": index, "status": "duplicate", "duplicateOf": seen_keys[key]}
+            continue
+
+        qr_value = scan.get("qrCodeValue")
+        session_type_id = scan.get("sessionTypeId")
+        if not all([qr_value, session_type_id]) or not isinstance(qr_value, str):
+            results[index] = {"index": index, "status": "error", "error": "Missing required fields"}
+            continue
+        if qr_checks[qr_value].error:
+            results[index] = {"index": index, "status": "error", "error": qr_checks[qr_value].error}
+            continue
+        customer_id = customer_ids.get(qr_value)
+        if customer_id is None:
+            results[index] = {"index": index, "status": "error", "error": "Customer not found for this QR code"}
+            continue
+        session_type = get_session_type(session_type_id)
+        if not session_type:
+            results[index] = {"index": index, "status": "error", "error": "Session type not found"}
+            continue
+        try:
+            check_in_time = _parse_scan_time(scan["checkInTime"]) if scan.get("checkInTime") else datetime.utcnow()
+        except (TypeError, ValueError):
+            results[index] = {"index": index, "status": "error", "error": "Invalid checkInTime"}
+            continue
+
+        if key is not None:
+            seen_keys[key] = index
+        pending.append((index, key, {
+            "customer_id": customer_id,
+            "session_type_id": session_type["id"],
+            "check_in_time": check_in_time,
+            "notes": scan.get("notes")
+        }, session_type["price"]))
+
+    if pending:
+        # executemany-style bulk insert; RETURNING gives ids in parameter order
+        inserted_ids = db.session.execute(
+            insert(CheckIn).returning(CheckIn.id, sort_by_parameter_order=True),
+            [values for _, _, values, _ in pending]
+        ).scalars().all()
+        key_rows = []
+        for (index, key, values, _), checkin_id in zip(pending, inserted_ids):
+            results[index] = {
+                "index": index,
+                "status": "created",
+                "checkinId": checkin_id,
+                "checkInTime": values["check_in_time"].isoformat()
+            }
+            if key is not None:
+                key_rows.append({"key": key, "checkin_id": checkin_id})
+        if key_rows:
+            db.session.execute(insert(CheckInIdempotencyKey), key_rows)
+        record_checkins(
+            (values["customer_id"], values["session_type_id"], values["check_in_time"], price)
+            for _, _, values, price in pending
+        )
+        record_scans((
+            (checkin_id, values["customer_id"], values["session_type_id"], values["check_in_time"])
+            for (_, _, values, _), checkin_id in zip(pending, inserted_ids)
+        ), datetime.utcnow())
+        db.session.commit()
+
+    for result in results:
+        if "duplicateOf" in result:
+            result["checkinId"] = results[result.pop("duplicateOf")].get("checkinId")
+    return results
 
 @checkin_bp.route("/", methods=["GET"])
 def get_checkins():
-    checkins = CheckIn.query.all()
-    result = []
-    for checkin in checkins:
-        customer = Customer.query.get(checkin.customer_id)
-        session_type = SessionType.query.get(checkin.session_type_id)
-        result.append({
-            "id": checkin.id,
-            "customerName": f"{customer.firstName} {customer.lastName}" if customer else "Unknown",
-            "sessionType": session_type.name if session_type else "Unknown",
-            "checkInTime": checkin.check_in_time.isoformat(),
-            "notes": checkin.notes,
-            "price": session_type.price if session_type else 0.0
-        })
-    return jsonify(result), 200
+    rows = joined_checkins_query().order_by(CheckIn.id).all()
+    return jsonify([serialize_checkin_row(row) for row in rows]), 200
+
+@checkin_bp.route("/history", methods=["GET"])
+def get_checkin_history():
+    """
+    Cursor-paginated check-in history, newest first
+    Query params: limit, cursor, start, end, customer_id, session_type_id
+    """
+    try:
+        limit = int(request.args.get("limit", HISTORY_DEFAULT_LIMIT))
+    except ValueError:
+        return jsonify({"error": "Invalid limit: expected an integer"}), 400
+    limit = max(1, min(limit, HISTORY_MAX_LIMIT))
+
+    try:
+        query = apply_checkin_filters(joined_checkins_query(), request.args)
+        cursor = request.args.get("cursor")
+        if cursor:
+            cursor_time, cursor_id = decode_cursor(cursor)
+            query = query.filter(or_(
+                CheckIn.check_in_time < cursor_time,
+                and_(CheckIn.check_in_time == cursor_time, CheckIn.id < cursor_id)
+            ))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    # Fetch one extra row to know whether another page exists
+    rows = query.order_by(CheckIn.check_in_time.desc(), CheckIn.id.desc()).limit(limit + 1).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    next_cursor = None
+    if has_more:
+        last = rows[-1]
+        next_cursor = encode_cursor(last.check_in_time, last.id)
+
+    return jsonify({
+        "checkins": [serialize_checkin_row(row) for row in rows],
+        "nextCursor": next_cursor,
+        "hasMore": has_more
+    }), 200
+
+@checkin_bp.route("/export", methods=["GET"])
+def export_checkins():
+    """
+    Stream check-ins as NDJSON or CSV, oldest first
+    Query params: format (ndjson|csv), start, end, customer_id, session_type_id
+    """
+    export_format = request.args.get("format", "ndjson").lower()
+    if export_format not in ("ndjson", "csv"):
+        return jsonify({"error": "Invalid format: expected ndjson or csv"}), 400
+
+    try:
+        query = apply_checkin_filters(joined_checkins_query(), request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    # yield_per streams rows from the cursor in batches instead of loading them all
+    rows = query.order_by(CheckIn.check_in_time, CheckIn.id).execution_options(
+        yield_per=EXPORT_BATCH_SIZE
+    )
+
+    if export_format == "csv":
+        generator = _generate_csv(rows)
+        mimetype = "text/csv"
+    else:
+        generator = _generate_ndjson(rows)
+        mimetype = "application/x-ndjson"
+
+    filename = f"checkins-{datetime.utcnow().strftime('%Y%m%d-%H%M%S')}.{export_format}"
+    return Response(
+        stream_with_context(generator),
+        mimetype=mimetype,
+        headers={"Content-Disposition": f"attachment; filename={filename}"}
+    )
+
+def _generate_ndjson(rows):
+    chunk = []
+    for row in rows:
+        chunk.append(json.dumps(serialize_checkin_row(row)))
+        # Send rows in batches so each write on the wire carries many lines
+        if len(chunk) == EXPORT_BATCH_SIZE:
+            yield "\n".join(chunk) + "\n"
+            chunk = []
+    if chunk:
+        yield "\n".join(chunk) + "\n"
 
+def _generate_csv(rows):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_CSV_FIELDS)
+    writer.writeheader()
+    for count, row in enumerate(rows, start=1):
+        writer.writerow(serialize_checkin_row(row))
+        if count % EXPORT_BATCH_SIZE == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate(0)
+    yield buffer.getvalue()
@@ -1,10 +1,23 @@
 
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, make_response, Response, stream_with_context
+import io
+import os
+from datetime import datetime
 from db import db
 from models.models import Customer
+from utils.lookup_cache import resolve_customer_by_qr, invalidate_qr, customer_to_cache_entry
+from utils.qr_render import render_qr, FORMATS, DEFAULT_BOX_SIZE
+from utils.qr_batch import stream_qr_zip, stream_qr_sheet_pdf
+from utils.customer_import import ImportFormatError, import_customers, read_rows
+from utils.customer_search import search_customers, SEARCH_DEFAULT_LIMIT, SEARCH_MAX_LIMIT
+from utils.qr_payload import check_qr_value, issue_signed_qr
 
 customer_bp = Blueprint("customer_bp", __name__)
 
+QR_IMAGE_MAX_AGE = int(os.environ.get("QR_IMAGE_MAX_AGE", "300"))
+QR_IMAGE_MAX_BOX_SIZE = 40
+QR_BATCH_MAX_CUSTOMERS = 2000
+
 @customer_bp.route("/register", methods=["POST"])
 def register_customer():
     data = request.get_json()
@@ -30,7 +43,12 @@ def register_customer():
         qrCodeData=qrCodeData
     )
     db.session.add(new_customer)
+    if not qrCodeData:
+        # Issue a compact signed code; the id is assigned on flush
+        db.session.flush()
+        new_customer.qrCodeData = issue_signed_qr(new_customer.id)
     db.session.commit()
+    invalidate_qr(new_customer.qrCodeData)
 
     return jsonify({"message": "Customer registered successfully", "customer": {
         "id": new_customer.id,
@@ -40,23 +58,75 @@ def register_customer():
         "qrCodeData": new_customer.qrCodeData
     }}), 201
 
+@customer_bp.route("/import", methods=["POST"])
+def import_customer_roster():
+    """
+    Register many customers from a CSV or JSON-lines roster in chunked transactions
+    Send the file as the request body (Content-Type text/csv or application/x-ndjson)
+    or as a multipart "file" field; ?format=csv|ndjson overrides detection.
+    Columns: firstName, lastName, email, phone, address, qrCodeData (generated when empty).
+    ?dry_run=1 validates without inserting. Rejected rows are listed in "errors".
+    """
+    upload = request.files.get("file")
+    if upload is not None:
+        stream = upload.stream
+        hint = f"{upload.filename or ''} {upload.mimetype or ''}".lower()
+    else:
+        stream = io.BufferedReader(request.stream)
+        hint = (request.mimetype or "").lower()
+
+    import_format = request.args.get("format", "").lower()
+    if not import_format:
+        if "csv" in hint:
+            import_format = "csv"
+        elif "ndjson" in hint or "jsonl" in hint or "json" in hint:
+            import_format = "ndjson"
+    if import_format not in ("csv", "ndjson"):
+        return jsonify({"error": "Unknown format: send text/csv or application/x-ndjson, or set format=csv|ndjson"}), 400
+
+    dry_run = request.args.get("dry_run", "").lower() in ("1", "true", "yes")
+    try:
+        result = import_customers(read_rows(stream, import_format), dry_run=dry_run)
+    except (ImportFormatError, UnicodeDecodeError) as e:
+        db.session.rollback()
+        return jsonify({"error": str(e)}), 400
+
+    print(f"[IMPORT] {result['summary']['created']} customers {'validated' if dry_run else 'imported'}, "
+          f"{result['summary']['error']} rows rejected")
+    return jsonify(result), 200
+
+@customer_bp.route("/search", methods=["GET"])
+def search_customer_directory():
+    """
+    Typeahead lookup by name, email or phone (e.g. for a student without their QR code)
+    Query params: q, limit (default 10, max 50)
+    """
+    query = request.args.get("q", "").strip()
+    if not query:
+        return jsonify({"error": "q is required"}), 400
+    try:
+        limit = int(request.args.get("limit", SEARCH_DEFAULT_LIMIT))
+    except ValueError:
+        return jsonify({"error": "Invalid limit: expected an integer"}), 400
+    limit = max(1, min(limit, SEARCH_MAX_LIMIT))
+
+    return jsonify({"query": query, "customers": search_customers(query, limit)}), 200
+
 @customer_bp.route("/by-qr-data", methods=["GET"])
 def get_customer_by_qr_data():
     qr_data = request.args.get("qr_data")
     if not qr_data:
         return jsonify({"error": "QR data is required"}), 400
 
-    customer = Customer.query.filter_by(qrCodeData=qr_data).first()
+    qr_check = check_qr_value(qr_data)
+    if qr_check.error:
+        return jsonify({"error": qr_check.error}), 400
+
+    customer = resolve_customer_by_qr(qr_check.value, qr_check.customer_id)
     if not customer:
         return jsonify({"error": "Customer not found"}), 404
 
-    return jsonify({
-        "id": customer.id,
-        "firstName": customer.firstName,
-        "lastName": customer.lastName,
-        "email": customer.email,
-        "qrCodeData": customer.qrCodeData
-    }), 200
+    return jsonify(customer), 200
 
 @customer_bp.route("/<int:customer_id>", methods=["PUT"])
 def update_customer(customer_id):
@@ -65,6 +135,7 @@ def update_customer(customer_id):
         return jsonify({"error": "Customer not found"}), 404
 
     data = request.get_json()
+    old_qr_code_data = customer.qrCodeData
     customer.firstName = data.get("firstName", customer.firstName)
     customer.lastName = data.get("lastName", customer.lastName)
     customer.email = data.get("email", customer.email)
@@ -73,6 +144,8 @@ def update_customer(customer_id):
     customer.qrCodeData = data.get("qrCodeData", customer.qrCodeData)
 
     db.session.commit()
+    # Drop both the old and new QR values so a reissued code never resolves to a stale entry
+    invalidate_qr(old_qr_code_data, customer.qrCodeData)
     return jsonify({"message": "Customer updated successfully", "customer": {
         "id": customer.id,
         "firstName": customer.firstName,
@@ -81,3 +154,83 @@ def update_customer(customer_id):
         "qrCodeData": customer.qrCodeData
     }}), 200
 
+@customer_bp.route("/<int:customer_id>/qr-code", methods=["POST"])
+def reissue_customer_qr_code(customer_id):
+    """Issue a new compact signed QR code (e.g. for a lost card); the old code stops working"""
+    customer = Customer.query.get(customer_id)
+    if not customer:
+        return jsonify({"error": "Customer not found"}), 404
+
+    old_qr_code_data = customer.qrCodeData
+    customer.qrCodeData = issue_signed_qr(customer.id)
+    db.session.commit()
+    invalidate_qr(old_qr_code_data, customer.qrCodeData)
+    return jsonify({"message": "QR code reissued", "customer": customer_to_cache_entry(customer)}), 200
+
+@customer_bp.route("/<int:customer_id>/qr.<fmt>", methods=["GET"])
+def get_customer_qr_image(customer_id, fmt):
+    """Serve a customer's QR code as PNG or SVG from the render cache"""
+    if fmt not in FORMATS:
+        return jsonify({"error": "Unsupported format: expected png or svg"}), 404
+
+    customer = Customer.query.get(customer_id)
+    if not customer:
+        return jsonify({"error": "Customer not found"}), 404
+    if not customer.qrCodeData:
+        return jsonify({"error": "Customer has no QR code"}), 404
+
+    try:
+        box_size = int(request.args.get("size", DEFAULT_BOX_SIZE))
+    except ValueError:
+        return jsonify({"error": "Invalid size: expected an integer"}), 400
+    box_size = max(1, min(box_size, QR_IMAGE_MAX_BOX_SIZE))
+
+    etag, image = render_qr(customer.qrCodeData, box_size=box_size, fmt=fmt)
+    response = make_response(image)
+    response.mimetype = FORMATS[fmt]
+    response.set_etag(etag)
+    response.cache_control.public = True
+    response.cache_control.max_age = QR_IMAGE_MAX_AGE
+    # Answers If-None-Match with 304 Not Modified and no body
+    return response.make_conditional(request)
+
+@customer_bp.route("/qr-batch", methods=["POST"])
+def export_qr_batch():
+    """
+    Render QR codes for many customers as a streamed ZIP or a printable PDF sheet
+    Body: {"customer_ids": [...], "format": "zip"|"pdf", "size": box size}
+    """
+    data = request.get_json(silent=True) or {}
+    customer_ids = data.get("customer_ids")
+    export_format = data.get("format", "zip")
+    if not isinstance(customer_ids, list) or not customer_ids:
+        return jsonify({"error": "customer_ids must be a non-empty list"}), 400
+    if len(customer_ids) > QR_BATCH_MAX_CUSTOMERS:
+        return jsonify({"error": f"Too many customers: at most {QR_BATCH_MAX_CUSTOMERS} per request"}), 400
+    if export_format not in ("zip", "pdf"):
+        return jsonify({"error": "Invalid format: expected zip or pdf"}), 400
+    try:
+        ids = list(dict.fromkeys(int(customer_id) for customer_id in customer_ids))
+        box_size = max(1, min(int(data.get("size", DEFAULT_BOX_SIZE)), QR_IMAGE_MAX_BOX_SIZE))
+    except (TypeError, ValueError):
+        return jsonify({"error": "customer_ids and size must be integers"}), 400
+
+    rows = {c.id: c for c in Customer.query.filter(Customer.id.in_(ids)).all()}
+    missing = [customer_id for customer_id in ids if customer_id not in rows or not rows[customer_id].qrCodeData]
+    if missing:
+        return jsonify({"error": "Customers not found or without a QR code", "customer_ids": missing}), 404
+    # Plain dicts so rendering never touches the session after the request's query
+    customers = [customer_to_cache_entry(rows[customer_id]) for customer_id in ids]
+
+    stamp = datetime.utcnow().strftime("%Y%m%d-%H%M%S")
+    if export_format == "pdf":
+        return Response(
+            stream_with_context(stream_qr_sheet_pdf(customers, box_size)),
+            mimetype="application/pdf",
+            headers={"Content-Disposition": f"attachment; filename=qr-codes-{stamp}.pdf"}
+        )
+    return Response(
+        stream_with_context(stream_qr_zip(customers, box_size)),
+        mimetype="application/zip",
+        headers={"Content-Disposition": f"attachment; filename=qr-codes-{stamp}.zip"}
+    )
@@ -1,50 +1,14 @@
 from flask import Blueprint, request, jsonify
 import os
-import requests
-import json
+from jinja2 import UndefinedError
+from models.models import EmailOutbox
+from utils.email_service import render_email, queue_email, email_configured, is_bulk_template
+from utils.bulk_email import send_bulk
+from utils.email_transports import get_transport
+from utils.concurrency import io_bound
 
 email_bp = Blueprint("email_bp", __name__)
 
-def send_email_with_sendgrid_http(to_email, subject, html_content):
-    """
-    Send an email using SendGrid HTTP API (no SDK required)
-    Returns (success: bool, message: str)
-    """
-    sendgrid_api_key = os.environ.get("SENDGRID_API_KEY")
-    from_email = os.environ.get("SENDGRID_FROM_EMAIL", "noreply@qrcheckin.app")
-    
-    if not sendgrid_api_key:
-        return False, "SendGrid API key not configured"
-    
-    try:
-        url = "https://api.sendgrid.com/v3/mail/send"
-        headers = {
-            "Authorization": f"Bearer {sendgrid_api_key}",
-            "Content-Type": "application/json"
-        }
-        
-        payload = {
-            "personalizations": [{
-                "to": [{"email": to_email}],
-                "subject": subject
-            }],
-            "from": {"email": from_email},
-            "content": [{
-                "type": "text/html",
-                "value": html_content
-            }]
-        }
-        
-        response = requests.post(url, headers=headers, json=payload, timeout=10)
-        
-        if response.status_code in [200, 201, 202]:
-            return True, f"Email sent successfully via SendGrid (status: {response.status_code})"
-        else:
-            return False, f"SendGrid returned status code: {response.status_code} - {response.text}"
-            
-    except Exception as e:
-        return False, f"Error sending email: {str(e)}"
-
 def simulate_email(to_email, subject, html_content):
     """Simulate email sending by printing to console"""
     print("=" * 80)
@@ -66,85 +30,87 @@ def send_qr_code_email():
     if not all([recipient_email, customer_name, qr_code_url]):
         return jsonify({"error": "Missing required email data"}), 400
 
-    # Create HTML email content
-    html_content = f"""
-    <!DOCTYPE html>
-    <html>
-    <head>
-        <style>
-            body {{ font-family: Arial, sans-serif; line-height: 1.6; color: #333; }}
-            .container {{ max-width: 600px; margin: 0 auto; padding: 20px; }}
-            .header {{ background-color: #4CAF50; color: white; padding: 20px; text-align: center; }}
-            .content {{ padding: 20px; background-color: #f9f9f9; }}
-            .qr-code {{ text-align: center; margin: 20px 0; }}
-            .qr-code img {{ max-width: 300px; border: 2px solid #ddd; padding: 10px; background: white; }}
-            .footer {{ text-align: center; padding: 20px; font-size: 12px; color: #666; }}
-        </style>
-    </head>
-    <body>
-        <div class="container">
-            <div class="header">
-                <h1>Welcome to Doulos Education!</h1>
-            </div>
-            <div class="content">
-                <p>Dear {customer_name},</p>
-                <p>Thank you for registering with our tutoring program. We're excited to have you!</p>
-                <p>Here is your unique QR code for quick and easy check-ins:</p>
-                <div class="qr-code">
-                    <img src="{qr_code_url}" alt="Your QR Code" />
-                </div>
-                <p><strong>Important:</strong> Please save this QR code to your phone or print it out. You will need to show it to check in for tutoring sessions.</p>
-                <p>If you have any questions, please don't hesitate to contact us.</p>
-                <p>Best regards,<br>The Doulos Education Team</p>
-            </div>
-            <div class="footer">
-                <p>This is an automated message. Please do not reply to this email.</p>
-            </div>
-        </div>
-    </body>
-    </html>
-    """
-
-    # Check if SendGrid is configured
-    sendgrid_api_key = os.environ.get("SENDGRID_API_KEY")
-    
-    if not sendgrid_api_key:
+    context = {"customer_name": customer_name, "qr_src": qr_code_url}
+
+    if not email_configured():
         # Fallback to simulated email
-        success, message = simulate_email(recipient_email, "Your QR Code for Doulos Education", html_content)
+        subject, content = render_email("qr_welcome", **context)
+        success, message = simulate_email(recipient_email, subject, content[0]["value"])
         return jsonify({"message": message, "simulated": True}), 200
-    
-    # Try to send real email via SendGrid HTTP API
-    success, message = send_email_with_sendgrid_http(
-        recipient_email,
-        "Your QR Code for Doulos Education",
-        html_content
-    )
-    
+
+    success, message, outbox_id = queue_email(recipient_email, "qr_welcome", context, kind="qr_code_html")
+
     if success:
-        return jsonify({"message": message, "simulated": False}), 200
+        return jsonify({"message": message, "simulated": False, "outbox_id": outbox_id}), 202
     else:
-        # If SendGrid fails, fall back to simulation
-        success, sim_message = simulate_email(recipient_email, "Your QR Code for Doulos Education", html_content)
+        # If queueing fails, fall back to simulation
+        subject, content = render_email("qr_welcome", **context)
+        success, sim_message = simulate_email(recipient_email, subject, content[0]["value"])
         return jsonify({
             "message": f"SendGrid failed ({message}), email simulated instead",
             "simulated": True
         }), 200
 
+@email_bp.route("/bulk", methods=["POST"])
+@io_bound
+def send_bulk_email():
+    """Queue an announcement (e.g. term start) to all or selected customers"""
+    data = request.get_json(silent=True) or {}
+    template = data.get("template", "term_start")
+    context = data.get("context") or {}
+    customer_ids = data.get("customer_ids")
+    attach_qr = bool(data.get("attach_qr", False))
+
+    if not is_bulk_template(template):
+        return jsonify({"error": f"Template '{template}' cannot be bulk sent"}), 400
+    if not isinstance(context, dict):
+        return jsonify({"error": "context must be an object"}), 400
+    if customer_ids is not None and (
+        not isinstance(customer_ids, list) or not all(isinstance(i, int) for i in customer_ids)
+    ):
+        return jsonify({"error": "customer_ids must be a list of integers"}), 400
+
+    if not email_configured():
+        return jsonify({"message": "SendGrid not configured", "simulated": True}), 200
+
+    try:
+        summary = send_bulk(template, context, customer_ids=customer_ids, attach_qr=attach_qr,
+                            subject=data.get("subject"))
+    except UndefinedError as e:
+        return jsonify({"error": f"Missing template value: {e}"}), 400
+
+    return jsonify({
+        "message": f"Queued {summary['recipients']} emails in {summary['requests']} SendGrid requests",
+        "simulated": False,
+        **summary
+    }), 202
+
 @email_bp.route("/test", methods=["GET"])
 def test_email():
     """Test endpoint to verify email configuration"""
     sendgrid_api_key = os.environ.get("SENDGRID_API_KEY")
     from_email = os.environ.get("SENDGRID_FROM_EMAIL")
-    
-    if not sendgrid_api_key:
+    transport = get_transport()
+
+    if not transport.configured():
         return jsonify({
             "configured": False,
-            "message": "SendGrid API key not set"
+            "transport": transport.name,
+            "message": "SendGrid API key not set" if transport.name == "sendgrid" else f"{transport.label} transport not configured"
         }), 200
-    
+
     return jsonify({
         "configured": True,
+        "transport": transport.name,
         "from_email": from_email,
         "api_key_present": bool(sendgrid_api_key),
         "api_key_preview": sendgrid_api_key[:10] + "..." if sendgrid_api_key else None
     }), 200
+
+@email_bp.route("/outbox/<int:outbox_id>", methods=["GET"])
+def get_outbox_status(outbox_id):
+    """Poll the delivery status of a queued email"""
+    message = EmailOutbox.query.get(outbox_id)
+    if not message:
+        return jsonify({"error": "Email not found"}), 404
+    return jsonify(message.to_dict()), 200
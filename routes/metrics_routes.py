@@ -0,0 +1,9 @@
+from flask import Blueprint, Response
+from utils.metrics import render_prometheus
+
+metrics_bp = Blueprint("metrics_bp", __name__)
+
+@metrics_bp.route("/metrics", methods=["GET"])
+def metrics():
+    """Prometheus scrape endpoint: request latency, SQL per request, outbound calls"""
+    return Response(render_prometheus(), mimetype="text/plain; version=0.0.4")
@@ -1,11 +1,21 @@
 from flask import Blueprint, request, jsonify
-import requests
 import os
 import json
 from datetime import datetime, timedelta
 from db import db
 from models.models import QuickBooksToken
-from utils.token_storage import save_token_to_file, load_token_from_file, delete_token_file, is_token_valid
+from utils.token_storage import save_token_to_file, load_token_from_file, delete_token_file
+from utils.token_manager import TokenManager
+from utils.http_clients import quickbooks_session, QB_TIMEOUT
+from utils.qbo_scheduler import qbo_scheduler
+from utils.concurrency import io_bound
+from utils.quickbooks_api import qbo_request
+from utils.quickbooks_mapping import (
+    refresh_mappings, mapping_status, qbo_customer_ref, qbo_item_ref, QuickBooksMappingError
+)
+from utils.quickbooks_sync import (
+    run_sync, sync_status_counts, sync_lock, SyncAlreadyRunning, QB_SYNC_MAX_PER_RUN
+)
 
 quickbooks_bp = Blueprint("quickbooks_bp", __name__)
 
@@ -25,6 +35,9 @@ else:
     QB_TOKEN_URL = "https://oauth.platform.intuit.com/oauth2/v1/tokens/bearer"
     QB_API_URL = "https://sandbox-quickbooks.api.intuit.com"
 
+# Cached token with proactive refresh; avoids reading qb_token.json on every request
+token_manager = TokenManager(QB_TOKEN_URL, QB_CLIENT_ID, QB_CLIENT_SECRET)
+
 def get_qb_token():
     """Get the latest QuickBooks token from database"""
     return QuickBooksToken.query.order_by(QuickBooksToken.updated_at.desc()).first()
@@ -34,6 +47,7 @@ def save_qb_token(access_token, refresh_token, realm_id, expires_in):
     try:
         print(f"Saving token for realm {realm_id}")
         success = save_token_to_file(access_token, refresh_token, realm_id, expires_in)
+        token_manager.invalidate()
         if success:
             print(f"Token saved successfully for realm {realm_id}")
             # Verify it was saved
@@ -82,6 +96,7 @@ def redirect_to_quickbooks():
     return redirect(auth_url, code=302)
 
 @quickbooks_bp.route("/callback", methods=["GET"])
+@io_bound
 def quickbooks_callback():
     """Handle OAuth callback from QuickBooks"""
     code = request.args.get("code")
@@ -102,7 +117,7 @@ def quickbooks_callback():
     
     # Exchange authorization code for access token
     try:
-        token_response = requests.post(
+        token_response = qbo_scheduler.request("oauth", lambda: quickbooks_session.post(
             QB_TOKEN_URL,
             headers={
                 "Accept": "application/json",
@@ -113,8 +128,9 @@ def quickbooks_callback():
                 "grant_type": "authorization_code",
                 "code": code,
                 "redirect_uri": dynamic_redirect_uri  # Use dynamic URI to match authorization request
-            }
-        )
+            },
+            timeout=QB_TIMEOUT
+        ))
         
         if token_response.status_code == 200:
             tokens = token_response.json()
@@ -153,11 +169,13 @@ def quickbooks_callback():
         return f"<html><body><h1>Error during OAuth</h1><p>{str(e)}</p></body></html>", 500
 
 @quickbooks_bp.route("/status", methods=["GET"])
+@io_bound
 def get_quickbooks_status():
     """Check QuickBooks connection status"""
-    token_data = load_token_from_file()
+    token_data = token_manager.get_token()
     if token_data and token_data.get('access_token'):
-        if is_token_valid(token_data):
+        # Refreshes the access token first if it is about to expire
+        if token_manager.get_valid_token():
             return jsonify({
                 "status": "connected",
                 "message": "QuickBooks is connected and active",
@@ -179,40 +197,94 @@ def get_quickbooks_status():
 def disconnect_quickbooks():
     """Disconnect from QuickBooks"""
     delete_token_file()
+    token_manager.invalidate()
     return jsonify({"message": "Disconnected from QuickBooks"}), 200
 
 @quickbooks_bp.route("/sync", methods=["POST"])
+@io_bound
 def sync_quickbooks():
     """Sync check-in data to QuickBooks"""
-    token_data = load_token_from_file()
+    token_data = token_manager.get_token()
     if not token_data or not token_data.get('access_token'):
         return jsonify({"error": "Not connected to QuickBooks"}), 401
     
-    # Check if token is expired
-    if not is_token_valid(token_data):
+    # Check if token is expired (refreshing it first if it is about to)
+    token_data = token_manager.get_valid_token()
+    if not token_data:
         return jsonify({"error": "QuickBooks token expired. Please reconnect."}), 401
     
-    data = request.get_json()
-    
-    # This is a placeholder for actual sync logic
-    # In a real implementation, you would:
-    # 1. Fetch check-in data from database
-    # 2. Create invoices or sales receipts in QuickBooks
-    # 3. Handle errors and retries
-    
+    data = request.get_json(silent=True) or {}
+    try:
+        max_checkins = int(data.get("max_checkins", QB_SYNC_MAX_PER_RUN))
+    except (TypeError, ValueError):
+        return jsonify({"error": "max_checkins must be an integer"}), 400
+
+    try:
+        with sync_lock():
+            summary = run_sync(QB_API_URL, token_data, max_checkins=max(1, max_checkins))
+    except SyncAlreadyRunning as e:
+        return jsonify({"error": str(e)}), 409
+    summary["pending"] = sync_status_counts()
+    if summary["error"]:
+        status_code = 401 if summary.get("status_code") == 401 else 502
+        return jsonify({
+            "error": summary["error"],
+            "message": "QuickBooks sync stopped early; progress was saved and the next sync resumes from here",
+            "status": "connected",
+            "realm_id": token_data.get('realm_id'),
+            "summary": summary
+        }), status_code
+
     return jsonify({
-        "message": "QuickBooks sync initiated successfully",
+        "message": f"QuickBooks sync complete: {summary['synced']} check-ins synced",
         "status": "connected",
         "realm_id": token_data.get('realm_id'),
-        "note": "Sync functionality is a placeholder. Implement actual invoice/sales receipt creation as needed."
+        "summary": summary
     }), 200
 
+@quickbooks_bp.route("/sync/status", methods=["GET"])
+def get_sync_status():
+    """Counts of check-ins by QuickBooks sync status"""
+    return jsonify(sync_status_counts()), 200
+
+@quickbooks_bp.route("/scheduler", methods=["GET"])
+def get_scheduler_stats():
+    """Per-realm QuickBooks request queue depth, in-flight calls and throttling"""
+    return jsonify(qbo_scheduler.stats()), 200
+
+@quickbooks_bp.route("/mappings/refresh", methods=["POST"])
+@io_bound
+def refresh_quickbooks_mappings():
+    """Refresh local customer/session type -> QuickBooks id mappings (CDC unless full=true)"""
+    token_data = token_manager.get_token()
+    if not token_data or not token_data.get('access_token'):
+        return jsonify({"error": "Not connected to QuickBooks"}), 401
+    token_data = token_manager.get_valid_token()
+    if not token_data:
+        return jsonify({"error": "QuickBooks token expired. Please reconnect."}), 401
+
+    data = request.get_json(silent=True) or {}
+    try:
+        summary = refresh_mappings(QB_API_URL, token_data, full=bool(data.get("full")))
+    except QuickBooksMappingError as e:
+        return jsonify({"error": str(e)}), 401 if e.status_code == 401 else 502
+    return jsonify({"message": "QuickBooks mappings refreshed", "summary": summary}), 200
+
+@quickbooks_bp.route("/mappings", methods=["GET"])
+def get_quickbooks_mappings():
+    """Mapped and unmapped customer/session type counts"""
+    return jsonify(mapping_status()), 200
+
 @quickbooks_bp.route("/create-invoice", methods=["POST"])
+@io_bound
 def create_invoice():
     """Create an invoice in QuickBooks"""
-    token_data = load_token_from_file()
+    token_data = token_manager.get_token()
     if not token_data or not token_data.get('access_token'):
         return jsonify({"error": "Not connected to QuickBooks"}), 401
+    token_data = token_manager.get_valid_token()
+    if not token_data:
+        return jsonify({"error": "QuickBooks token expired. Please reconnect."}), 401
     
     data = request.get_json()
     customer_name = data.get("customer_name")
@@ -221,6 +293,19 @@ def create_invoice():
     
     if not all([customer_name, amount, description]):
         return jsonify({"error": "Missing required fields"}), 400
+
+    # Refs come from the local mapping table; no lookup calls to QuickBooks
+    try:
+        customer_id = int(data.get("customer_id"))
+        session_type_id = int(data.get("session_type_id"))
+    except (TypeError, ValueError):
+        return jsonify({"error": "customer_id and session_type_id must be integers"}), 400
+    customer_ref = qbo_customer_ref(customer_id)
+    if customer_ref is None:
+        return jsonify({"error": "No QuickBooks customer mapped; refresh mappings", "customer_id": customer_id}), 409
+    item_ref = qbo_item_ref(session_type_id)
+    if item_ref is None:
+        return jsonify({"error": "No QuickBooks item mapped; refresh mappings", "session_type_id": session_type_id}), 409
     
     try:
         # Create invoice in QuickBooks
@@ -230,26 +315,19 @@ def create_invoice():
                 "DetailType": "SalesItemLineDetail",
                 "SalesItemLineDetail": {
                     "ItemRef": {
-                        "value": "1",  # Default item, should be configured
+                        "value": item_ref,
                         "name": "Services"
                     }
                 },
                 "Description": description
             }],
             "CustomerRef": {
-                "value": "1"  # This should be looked up or created
+                "value": customer_ref
             }
         }
         
-        response = requests.post(
-            f"{QB_API_URL}/v3/company/{token_data.get('realm_id')}/invoice",
-            headers={
-                "Authorization": f"Bearer {token_data.get('access_token')}",
-                "Accept": "application/json",
-                "Content-Type": "application/json"
-            },
-            json=invoice_data
-        )
+        # Paced and retried on throttling by the shared per-realm scheduler
+        response = qbo_request("POST", QB_API_URL, token_data, "/invoice", json=invoice_data)
         
         if response.status_code in [200, 201]:
             return jsonify({
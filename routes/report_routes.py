@@ -0,0 +1,80 @@
+from flask import Blueprint, request, jsonify
+from datetime import date
+from db import db
+from utils.billing_rollups import GROUP_DIMENSIONS, billing_report, rebuild_rollups
+
+report_bp = Blueprint("report_bp", __name__)
+
+def _parse_date(value, name):
+    try:
+        return date.fromisoformat(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid {name}: expected an ISO date (YYYY-MM-DD)")
+
+def _parse_optional_int(value, name):
+    if value in (None, ""):
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid {name}: expected an integer")
+
+def _date_range(args):
+    start = args.get("start")
+    end = args.get("end")
+    return (
+        _parse_date(start, "start") if start else None,
+        _parse_date(end, "end") if end else None
+    )
+
+@report_bp.route("/billing", methods=["GET"])
+def get_billing_report():
+    """
+    Sessions and revenue from the daily rollups, grouped by any of day, month, year,
+    customer, session_type (comma separated group_by, default month)
+    Query params: group_by, start, end (inclusive dates, UTC), customer_id, session_type_id
+    e.g. revenue by month: group_by=month; sessions per student this term:
+    group_by=customer&start=2026-09-01&end=2026-12-19
+    """
+    group_by = [name.strip() for name in request.args.get("group_by", "month").split(",") if name.strip()]
+    unknown = [name for name in group_by if name not in GROUP_DIMENSIONS]
+    if unknown:
+        return jsonify({
+            "error": f"Invalid group_by: {', '.join(unknown)}; expected any of {', '.join(GROUP_DIMENSIONS)}"
+        }), 400
+
+    try:
+        start, end = _date_range(request.args)
+        customer_id = _parse_optional_int(request.args.get("customer_id"), "customer_id")
+        session_type_id = _parse_optional_int(request.args.get("session_type_id"), "session_type_id")
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    groups = billing_report(group_by, start, end, customer_id, session_type_id)
+    return jsonify({
+        "groupBy": group_by,
+        "start": start.isoformat() if start else None,
+        "end": end.isoformat() if end else None,
+        "groups": groups,
+        "totals": {
+            "sessions": sum(group["sessions"] for group in groups),
+            "revenue": round(sum(group["revenue"] for group in groups), 2)
+        }
+    }), 200
+
+@report_bp.route("/billing/rebuild", methods=["POST"])
+def rebuild_billing_rollups():
+    """
+    Recompute the rollups from check-ins (optionally only for start..end), e.g. after
+    editing check-ins directly in the database. Uses current session type prices.
+    """
+    data = request.get_json(silent=True) or {}
+    try:
+        start, end = _date_range(data)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    with db.engine.begin() as connection:
+        rows = rebuild_rollups(connection, start, end)
+    print(f"[REPORTS] Rebuilt {rows} billing rollup rows")
+    return jsonify({"message": "Rollups rebuilt", "rows": rows}), 200
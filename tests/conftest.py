@@ -0,0 +1,36 @@
+import os
+import sys
+import tempfile
+import uuid
+
+import pytest
+
+# Configuration is read at import time, so it is set before the app is imported
+os.environ["QR_CHECKIN_DB_PATH"] = tempfile.mkdtemp(prefix="qr-checkin-tests-")
+os.environ.setdefault("QR_SIGNING_KEY", "test-signing-key")
+os.environ.setdefault("EMAIL_OUTBOX_DISPATCHER", "0")
+os.environ.setdefault("METRICS_ENABLED", "0")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope="session")
+def app():
+    from main import app as flask_app
+    return flask_app
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def make_customer(client):
+    """Register a customer with a unique email; returns the customer dict"""
+    def make(**fields):
+        body = {"firstName": "Test", "lastName": "Student", "email": f"{uuid.uuid4().hex}@example.com"}
+        body.update(fields)
+        response = client.post("/api/customers/register", json=body)
+        assert response.status_code == 201
+        return response.get_json()["customer"]
+    return make
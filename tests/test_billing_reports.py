@@ -0,0 +1,66 @@
+import pytest
+
+from db import db
+from models.models import SessionType
+
+
+@pytest.fixture
+def prices(app):
+    with app.app_context():
+        return dict(db.session.query(SessionType.id, SessionType.price).all())
+
+
+def report(client, customer_id, group_by):
+    response = client.get("/api/reports/billing", query_string={"group_by": group_by, "customer_id": customer_id})
+    assert response.status_code == 200
+    return response.get_json()["groups"]
+
+
+@pytest.mark.parametrize("body", [{"start": 5}, {"end": ["2026-01-01"]}, {"start": "January"}])
+def test_rebuild_rejects_bad_dates(client, body):
+    response = client.post("/api/reports/billing/rebuild", json=body)
+    assert response.status_code == 400
+    assert "expected an ISO date" in response.get_json()["error"]
+
+
+def test_report_rejects_bad_parameters(client):
+    assert client.get("/api/reports/billing", query_string={"customer_id": "abc"}).status_code == 400
+    assert client.get("/api/reports/billing", query_string={"group_by": "week"}).status_code == 400
+
+
+def test_rollups_match_checkins_and_rebuild(client, make_customer, prices):
+    customer = make_customer()
+    customer_id, code = customer["id"], customer["qrCodeData"]
+    client.post("/api/checkins/batch", json={"scans": [
+        {"qrCodeValue": code, "sessionTypeId": 1, "checkInTime": "2026-03-02T09:00:00"},
+        {"qrCodeValue": code, "sessionTypeId": 1, "checkInTime": "2026-03-02T15:00:00"},
+        {"qrCodeValue": code, "sessionTypeId": 2, "checkInTime": "2026-03-20T09:00:00"},
+        {"qrCodeValue": code, "sessionTypeId": 1, "checkInTime": "2026-04-01T09:00:00"},
+    ]})
+    # Two check-ins in one batch share a daily row; the upsert adds them together
+    expected_days = [
+        {"day": "2026-03-02", "sessionTypeId": 1, "sessions": 2, "revenue": round(2 * prices[1], 2)},
+        {"day": "2026-03-20", "sessionTypeId": 2, "sessions": 1, "revenue": round(prices[2], 2)},
+        {"day": "2026-04-01", "sessionTypeId": 1, "sessions": 1, "revenue": round(prices[1], 2)},
+    ]
+    expected_months = [
+        {"month": "2026-03", "sessions": 3, "revenue": round(2 * prices[1] + prices[2], 2)},
+        {"month": "2026-04", "sessions": 1, "revenue": round(prices[1], 2)},
+    ]
+
+    def strip(groups):
+        return [{key: value for key, value in group.items() if key != "sessionType"} for group in groups]
+
+    assert strip(report(client, customer_id, "day,session_type")) == expected_days
+    assert report(client, customer_id, "month") == expected_months
+
+    # A live check-in adds to the existing rollups rather than replacing them
+    client.post("/api/checkins/", json={"qrCodeValue": code, "sessionTypeId": 2})
+    totals = client.get("/api/reports/billing", query_string={"group_by": "", "customer_id": customer_id}).get_json()
+    assert totals["totals"]["sessions"] == 5
+
+    before = report(client, customer_id, "day,session_type")
+    response = client.post("/api/reports/billing/rebuild", json={"start": "2026-03-01", "end": "2026-04-30"})
+    assert response.status_code == 200
+    assert report(client, customer_id, "day,session_type") == before
+    assert report(client, customer_id, "month")[:2] == expected_months
@@ -0,0 +1,46 @@
+import json
+
+import pytest
+
+import utils.email_transports as email_transports
+from db import db
+from models.models import EmailOutbox
+from utils.email_service import queue_bulk_email
+
+CONTEXT = {"term_name": "Spring term", "start_date": "March 2", "message": "", "attach_qr": False}
+
+
+def recipients(count):
+    return [
+        (f"student{i}@example.com", {"customer_name": f"Student {i}", "first_name": "Student", "qr_code_data": f"Q{i}"})
+        for i in range(count)
+    ]
+
+
+@pytest.fixture
+def queued_payloads(app, monkeypatch):
+    """Queue a bulk send through the given transport and return the stored payloads"""
+    def queue(transport_class, count):
+        monkeypatch.setitem(email_transports._transport, "instance", transport_class())
+        with app.app_context():
+            outbox_ids = queue_bulk_email("term_start", CONTEXT, recipients(count), kind="bulk_test")
+            rows = EmailOutbox.query.filter(EmailOutbox.id.in_(outbox_ids)).order_by(EmailOutbox.id).all()
+            payloads = [json.loads(row.payload) for row in rows]
+            EmailOutbox.query.filter(EmailOutbox.id.in_(outbox_ids)).delete()
+            db.session.commit()
+        return payloads
+    return queue
+
+
+def test_sendgrid_bulk_is_one_request_per_thousand(queued_payloads):
+    payloads = queued_payloads(email_transports.SendGridTransport, 1001)
+    assert [len(p["personalizations"]) for p in payloads] == [1000, 1]
+
+
+def test_smtp_bulk_is_one_outbox_row_per_recipient(queued_payloads):
+    # One row per recipient, so a lease expiry or failure only resends that recipient's mail
+    payloads = queued_payloads(email_transports.SmtpTransport, 3)
+    assert [p["personalizations"][0]["to"][0]["email"] for p in payloads] == [
+        "student0@example.com", "student1@example.com", "student2@example.com"
+    ]
+    assert all(len(p["personalizations"]) == 1 for p in payloads)
@@ -0,0 +1,48 @@
+from sqlalchemy.exc import IntegrityError
+
+import routes.checkin_routes as checkin_routes
+
+
+def test_idempotency_keys_make_resends_duplicates(client, make_customer):
+    code = make_customer()["qrCodeData"]
+    scans = [
+        {"qrCodeValue": code, "sessionTypeId": 1, "checkInTime": "2026-01-05T10:00:00", "idempotencyKey": "k-1"},
+        {"qrCodeValue": code, "sessionTypeId": 2, "checkInTime": "2026-01-05T11:00:00", "idempotencyKey": "k-2"},
+        # Same key twice in one batch: the second resolves to the first's check-in
+        {"qrCodeValue": code, "sessionTypeId": 2, "checkInTime": "2026-01-05T11:00:00", "idempotencyKey": "k-2"},
+    ]
+    first = client.post("/api/checkins/batch", json={"scans": scans}).get_json()
+    assert first["summary"] == {"created": 2, "duplicate": 1, "error": 0}
+    assert first["results"][2]["checkinId"] == first["results"][1]["checkinId"]
+
+    resent = client.post("/api/checkins/batch", json={"scans": scans}).get_json()
+    assert resent["summary"] == {"created": 0, "duplicate": 3, "error": 0}
+    assert [r["checkinId"] for r in resent["results"]] == [r["checkinId"] for r in first["results"]]
+
+
+def test_per_scan_errors_do_not_fail_the_batch(client, make_customer):
+    code = make_customer()["qrCodeData"]
+    results = client.post("/api/checkins/batch", json={"scans": [
+        "not an object",
+        {"qrCodeValue": "CUSTOMER-0-Nobody", "sessionTypeId": 1},
+        {"qrCodeValue": code, "sessionTypeId": 999},
+        {"qrCodeValue": code, "sessionTypeId": 1, "checkInTime": "yesterday"},
+        {"qrCodeValue": code, "sessionTypeId": 1, "checkInTime": "2026-01-05T10:00:00+02:00"},
+    ]}).get_json()["results"]
+    assert [r["status"] for r in results] == ["error"] * 4 + ["created"]
+    # Client offsets are stored as naive UTC
+    assert results[4]["checkInTime"] == "2026-01-05T08:00:00"
+
+
+def test_repeated_conflict_returns_retryable_409(client, make_customer, monkeypatch):
+    calls = []
+
+    def conflicting(scans):
+        calls.append(scans)
+        raise IntegrityError("INSERT", {}, Exception("UNIQUE constraint failed"))
+
+    monkeypatch.setattr(checkin_routes, "_record_scan_batch", conflicting)
+    response = client.post("/api/checkins/batch", json={"scans": [{"qrCodeValue": "x", "sessionTypeId": 1}]})
+    assert response.status_code == 409
+    assert response.get_json()["retryable"] is True
+    assert len(calls) == 2
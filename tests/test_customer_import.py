@@ -0,0 +1,70 @@
+import uuid
+
+import pytest
+from sqlalchemy.exc import IntegrityError
+
+import utils.customer_import as customer_import
+
+
+@pytest.fixture
+def post_csv(client):
+    def post(lines, **params):
+        body = "firstName,lastName,email,qrCodeData\n" + "".join(line + "\n" for line in lines)
+        response = client.post("/api/customers/import", data=body, content_type="text/csv", query_string=params)
+        assert response.status_code == 200
+        return response.get_json()
+    return post
+
+
+def unique_email():
+    return f"{uuid.uuid4().hex}@example.com"
+
+
+def test_rows_are_validated_across_chunks(post_csv, make_customer, monkeypatch):
+    # Chunks of two, so each duplicate below is caught against an earlier chunk
+    monkeypatch.setattr(customer_import, "IMPORT_CHUNK_SIZE", 2)
+    existing = make_customer()["email"]
+    first, qr_value = unique_email(), f"IMPORT-{uuid.uuid4().hex}"
+    result = post_csv([
+        f"Ann,One,{first},{qr_value}",
+        f"Bob,Two,{unique_email()},",
+        f"Ann,Again,{first},",
+        f"Cat,Three,{unique_email()},{qr_value}",
+        f"Dan,Four,{existing},",
+        f"Eve,,{unique_email()},",
+        f"Fay,Five,not-an-email,",
+    ])
+    assert result["summary"]["created"] == 2
+    assert [(e["row"], e["error"]) for e in result["errors"]] == [
+        (3, "Duplicate email in file (row 1)"),
+        (4, "Duplicate qrCodeData in file (row 1)"),
+        (5, "Customer with this email already exists"),
+        (6, "Missing required fields: lastName"),
+        (7, "Invalid email"),
+    ]
+    created = result["created"]
+    assert created[0]["qrCodeData"] == qr_value
+    # Rows without a QR value get a signed one
+    assert created[1]["qrCodeData"].startswith("DQ1-")
+
+
+def test_dry_run_inserts_nothing(post_csv):
+    email = unique_email()
+    dry = post_csv([f"Ann,One,{email},"], dry_run="1")
+    assert dry["summary"]["created"] == 1 and dry["created"][0].get("id") is None
+    assert post_csv([f"Ann,One,{email},"])["summary"]["created"] == 1
+
+
+def test_repeated_conflict_reports_chunk_rows_as_errors(post_csv, monkeypatch):
+    calls = []
+
+    def conflicting(chunk, *args):
+        calls.append(chunk)
+        raise IntegrityError("INSERT", {}, Exception("UNIQUE constraint failed: customer.email"))
+
+    monkeypatch.setattr(customer_import, "_import_chunk", conflicting)
+    email = unique_email()
+    result = post_csv([f"Ann,One,{email},", "Bob,Two,,"])
+    assert len(calls) == 2
+    assert result["summary"]["created"] == 0
+    assert [(e["row"], e["email"]) for e in result["errors"]] == [(1, email), (2, None)]
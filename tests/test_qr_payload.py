@@ -0,0 +1,74 @@
+import itertools
+
+from utils.qr_payload import check_qr_value, issue_signed_qr
+
+_emails = itertools.count()
+
+
+def register(client, **fields):
+    body = {"firstName": "Ada", "lastName": "Lovelace", "email": f"student{next(_emails)}@example.com"}
+    body.update(fields)
+    response = client.post("/api/customers/register", json=body)
+    assert response.status_code == 201
+    return response.get_json()["customer"]
+
+
+def lookup(client, qr_data):
+    return client.get("/api/customers/by-qr-data", query_string={"qr_data": qr_data})
+
+
+def test_registration_issues_compact_signed_code(client):
+    customer = register(client)
+    code = customer["qrCodeData"]
+    assert code.startswith("DQ1-") and len(code) <= 20
+    assert check_qr_value(code).customer_id == customer["id"]
+    assert lookup(client, code).get_json()["id"] == customer["id"]
+    # Scanners may lowercase the payload
+    assert lookup(client, code.lower()).status_code == 200
+
+
+def test_forged_code_rejected_before_lookup(client):
+    code = register(client)["qrCodeData"]
+    forged = code[:-1] + ("A" if code[-1] != "A" else "B")
+    assert lookup(client, forged).status_code == 400
+    response = client.post("/api/checkins/", json={"qrCodeValue": forged, "sessionTypeId": 1})
+    assert response.status_code == 400
+    assert response.get_json()["error"] == "Invalid QR code"
+
+
+def test_each_issue_is_a_different_code():
+    assert issue_signed_qr(7) != issue_signed_qr(7)
+
+
+def test_reissue_revokes_old_code(client):
+    customer = register(client)
+    old_code = customer["qrCodeData"]
+    assert lookup(client, old_code).status_code == 200  # cached before the reissue
+
+    response = client.post(f"/api/customers/{customer['id']}/qr-code")
+    assert response.status_code == 200
+    new_code = response.get_json()["customer"]["qrCodeData"]
+    assert new_code != old_code
+
+    assert lookup(client, old_code).status_code == 404
+    assert lookup(client, new_code).get_json()["id"] == customer["id"]
+    response = client.post("/api/checkins/", json={"qrCodeValue": old_code, "sessionTypeId": 1})
+    assert response.status_code == 404
+    batch = client.post("/api/checkins/batch", json={"scans": [
+        {"qrCodeValue": old_code, "sessionTypeId": 1},
+        {"qrCodeValue": new_code, "sessionTypeId": 1},
+    ]}).get_json()
+    assert [result["status"] for result in batch["results"]] == ["error", "created"]
+
+
+def test_put_replacing_code_revokes_signed_code(client):
+    customer = register(client)
+    signed_code = customer["qrCodeData"]
+    assert lookup(client, signed_code).status_code == 200
+
+    legacy_code = f"CUSTOMER-{customer['id']}-AdaLovelace"
+    response = client.put(f"/api/customers/{customer['id']}", json={"qrCodeData": legacy_code})
+    assert response.status_code == 200
+
+    assert lookup(client, signed_code).status_code == 404
+    assert lookup(client, legacy_code).get_json()["id"] == customer["id"]
@@ -0,0 +1,15 @@
+import utils.qr_render as qr_render
+
+
+def test_image_etag_answers_if_none_match(client, make_customer):
+    customer = make_customer()
+    first = client.get(f"/api/customers/{customer['id']}/qr.png")
+    assert first.status_code == 200 and first.mimetype == "image/png"
+    again = client.get(f"/api/customers/{customer['id']}/qr.png", headers={"If-None-Match": first.headers["ETag"]})
+    assert again.status_code == 304
+
+
+def test_renderer_upgrade_changes_key(monkeypatch):
+    before = qr_render.render_key("DQ1-1-AAAAAAAAAAAA")
+    monkeypatch.setitem(qr_render._renderer_version, "value", "1;qrcode=99.0;pillow=99.0")
+    assert qr_render.render_key("DQ1-1-AAAAAAAAAAAA") != before
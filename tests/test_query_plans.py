@@ -0,0 +1,86 @@
+"""
+Query-plan assertions for the hot check-in queries
+EXPLAIN QUERY PLAN on the queries issued by the history, export and
+per-customer endpoints must use the expected index and never fall back to a
+full scan of check_in.
+"""
+from datetime import datetime, timedelta
+
+import pytest
+
+from db import db
+from models.models import CheckIn, Customer
+from utils.checkin_queries import joined_checkins_query, apply_checkin_filters
+
+NEWEST_FIRST = (CheckIn.check_in_time.desc(), CheckIn.id.desc())
+
+
+def explain(connection, query):
+    compiled = query.statement.compile(dialect=connection.dialect)
+    params = []
+    for name in compiled.positiontup:
+        value = compiled.params[name]
+        if isinstance(value, datetime):
+            value = value.isoformat(" ")
+        params.append(value)
+    rows = connection.exec_driver_sql("EXPLAIN QUERY PLAN " + str(compiled), tuple(params)).fetchall()
+    return [row[-1] for row in rows]
+
+
+@pytest.fixture(scope="module")
+def seeded(app):
+    """Enough check-ins for ANALYZE statistics to reflect a real term"""
+    with app.app_context():
+        customers = [
+            Customer(firstName="Plan", lastName=str(i), email=f"plan{i}@example.com", qrCodeData=f"PLAN-{i}")
+            for i in range(200)
+        ]
+        db.session.add_all(customers)
+        db.session.flush()
+        ids = [customer.id for customer in customers]
+        start = datetime(2026, 1, 1)
+        db.session.add_all([
+            CheckIn(customer_id=ids[i % len(ids)], session_type_id=1 + i % 3, check_in_time=start + timedelta(minutes=i))
+            for i in range(20000)
+        ])
+        db.session.commit()
+        db.session.execute(db.text("ANALYZE"))
+        yield ids
+        # Other tests share the database; these rows bypass the rollups, so remove them
+        db.session.query(CheckIn).filter(CheckIn.customer_id.in_(ids)).delete(synchronize_session=False)
+        db.session.query(Customer).filter(Customer.id.in_(ids)).delete(synchronize_session=False)
+        db.session.commit()
+
+
+CASES = {
+    "history page": (
+        lambda ids: joined_checkins_query().order_by(*NEWEST_FIRST).limit(51),
+        "ix_check_in_check_in_time",
+    ),
+    "history by customer": (
+        lambda ids: apply_checkin_filters(joined_checkins_query(), {"customer_id": str(ids[7])})
+        .order_by(*NEWEST_FIRST).limit(51),
+        "ix_check_in_customer_time",
+    ),
+    "history by session type and range": (
+        lambda ids: apply_checkin_filters(joined_checkins_query(), {
+            "session_type_id": "2", "start": "2026-01-05", "end": "2026-01-06"
+        }).order_by(*NEWEST_FIRST).limit(51),
+        "ix_check_in_session_type_time",
+    ),
+    "export date range": (
+        lambda ids: apply_checkin_filters(joined_checkins_query(), {"start": "2026-01-05", "end": "2026-01-06"})
+        .order_by(CheckIn.check_in_time, CheckIn.id),
+        "ix_check_in_check_in_time",
+    ),
+}
+
+
+@pytest.mark.parametrize("name", CASES)
+def test_checkin_query_uses_index(app, seeded, name):
+    build, expected_index = CASES[name]
+    with app.app_context(), db.engine.connect() as connection:
+        plan = explain(connection, build(seeded))
+    # A bare "SCAN check_in" (no index) means a full table scan
+    assert not any(step.split()[:2] == ["SCAN", "check_in"] and "INDEX" not in step for step in plan), plan
+    assert any(expected_index in step for step in plan), plan
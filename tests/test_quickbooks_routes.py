@@ -0,0 +1,74 @@
+import json
+
+import pytest
+
+import routes.quickbooks_routes as quickbooks_routes
+
+INVOICE = {"customer_name": "Test Student", "amount": 50, "description": "Tutoring"}
+
+
+class FakeResponse:
+    def __init__(self, status_code, body):
+        self.status_code = status_code
+        self.body = body
+        self.text = json.dumps(body)
+
+    def json(self):
+        return self.body
+
+
+class FakeTokenManager:
+    def get_token(self):
+        return {"access_token": "token", "realm_id": "realm"}
+
+    def get_valid_token(self):
+        return self.get_token()
+
+
+@pytest.fixture
+def sent_invoices(monkeypatch):
+    """Connected QuickBooks with customer 1 -> "C1" and session type 1 -> "I1" mapped"""
+    sent = []
+
+    def fake_request(method, api_url, token_data, path, **kwargs):
+        sent.append(kwargs["json"])
+        return FakeResponse(200, {"Invoice": {"Id": "900"}})
+
+    monkeypatch.setattr(quickbooks_routes, "token_manager", FakeTokenManager())
+    monkeypatch.setattr(quickbooks_routes, "qbo_request", fake_request)
+    monkeypatch.setattr(quickbooks_routes, "qbo_customer_ref", {1: "C1"}.get)
+    monkeypatch.setattr(quickbooks_routes, "qbo_item_ref", {1: "I1"}.get)
+    return sent
+
+
+def create_invoice(client, **ids):
+    return client.post("/api/quickbooks/create-invoice", json={**INVOICE, **ids})
+
+
+def test_mapped_ids_are_used_even_as_strings(client, sent_invoices):
+    response = create_invoice(client, customer_id="1", session_type_id=1)
+    assert response.status_code == 200
+    line = sent_invoices[0]["Line"][0]
+    assert sent_invoices[0]["CustomerRef"]["value"] == "C1"
+    assert line["SalesItemLineDetail"]["ItemRef"]["value"] == "I1"
+
+
+@pytest.mark.parametrize("ids", [
+    {},
+    {"customer_id": "abc", "session_type_id": 1},
+    {"customer_id": 1, "session_type_id": [1]},
+])
+def test_missing_or_non_integer_ids_are_rejected(client, sent_invoices, ids):
+    assert create_invoice(client, **ids).status_code == 400
+    assert sent_invoices == []
+
+
+@pytest.mark.parametrize("ids, unmapped", [
+    ({"customer_id": 2, "session_type_id": 1}, "customer_id"),
+    ({"customer_id": 1, "session_type_id": 2}, "session_type_id"),
+])
+def test_unmapped_ids_are_refused_instead_of_billing_a_default(client, sent_invoices, ids, unmapped):
+    response = create_invoice(client, **ids)
+    assert response.status_code == 409
+    assert response.get_json()[unmapped] == 2
+    assert sent_invoices == []
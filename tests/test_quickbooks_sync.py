@@ -0,0 +1,71 @@
+import json
+
+import pytest
+
+import utils.quickbooks_sync as quickbooks_sync
+from db import db
+from models.models import CheckInSync
+
+
+class FakeResponse:
+    def __init__(self, status_code, body):
+        self.status_code = status_code
+        self.body = body
+        self.text = json.dumps(body)
+
+    def json(self):
+        return self.body
+
+
+@pytest.fixture
+def pending_syncs(app, client, make_customer):
+    """Three check-ins with "pending" sync rows, as left by an interrupted run"""
+    code = make_customer()["qrCodeData"]
+    results = client.post("/api/checkins/batch", json={"scans": [
+        {"qrCodeValue": code, "sessionTypeId": 1, "checkInTime": f"2026-02-0{day}T10:00:00"} for day in (1, 2, 3)
+    ]}).get_json()["results"]
+    ids = [r["checkinId"] for r in results]
+    with app.app_context():
+        for checkin_id in ids:
+            db.session.add(CheckInSync(
+                checkin_id=checkin_id, status="pending", doc_number=quickbooks_sync.doc_number(checkin_id), attempts=1
+            ))
+        db.session.commit()
+        yield ids
+        CheckInSync.query.filter(CheckInSync.checkin_id.in_(ids)).delete()
+        db.session.commit()
+
+
+def reconcile_with(monkeypatch, item):
+    monkeypatch.setattr(quickbooks_sync, "qbo_request", lambda *args, **kwargs: FakeResponse(
+        200, {"BatchItemResponse": [item] if item is not None else []}
+    ))
+    summary = {"reconciled": 0}
+    quickbooks_sync._reconcile_pending("https://qbo.test", {}, summary)
+    return summary
+
+
+def statuses(ids):
+    return [db.session.get(CheckInSync, checkin_id).status for checkin_id in ids]
+
+
+def test_reconcile_marks_found_synced_and_missing_failed(monkeypatch, pending_syncs):
+    first = pending_syncs[0]
+    summary = reconcile_with(monkeypatch, {"bId": "reconcile", "QueryResponse": {
+        quickbooks_sync.QB_SYNC_ENTITY: [{"DocNumber": quickbooks_sync.doc_number(first), "Id": "501"}]
+    }})
+    assert summary["reconciled"] == 1
+    assert statuses(pending_syncs) == ["synced", "failed", "failed"]
+    assert db.session.get(CheckInSync, first).qbo_id == "501"
+
+
+@pytest.mark.parametrize("item", [
+    {"bId": "reconcile", "Fault": {"Error": [{"Message": "Throttled", "Detail": "Try later"}]}},
+    None,
+])
+def test_reconcile_without_query_response_leaves_rows_pending(monkeypatch, pending_syncs, item):
+    # Marking these failed would resend invoices that may already exist in QuickBooks
+    with pytest.raises(quickbooks_sync.QuickBooksSyncError):
+        reconcile_with(monkeypatch, item)
+    db.session.rollback()
+    assert statuses(pending_syncs) == ["pending"] * 3
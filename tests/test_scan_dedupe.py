@@ -0,0 +1,61 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import utils.scan_dedupe as scan_dedupe
+from utils.lookup_cache import TTLCache
+
+
+@pytest.fixture(autouse=True)
+def empty_scan_cache(monkeypatch):
+    """Answer repeats from recent_scan, as another worker would, not this process's cache"""
+    monkeypatch.setattr(scan_dedupe, "recent_scans", TTLCache(100, 60))
+
+
+def seconds_ago(seconds):
+    return (datetime.utcnow() - timedelta(seconds=seconds)).isoformat()
+
+
+def live_scan(client, code, session_type_id=1):
+    return client.post("/api/checkins/", json={"qrCodeValue": code, "sessionTypeId": session_type_id})
+
+
+def sync_batch(client, code, *times):
+    results = client.post("/api/checkins/batch", json={"scans": [
+        {"qrCodeValue": code, "sessionTypeId": 1, "checkInTime": time} for time in times
+    ]}).get_json()["results"]
+    assert all(result["status"] == "created" for result in results)
+    return [result["checkinId"] for result in results]
+
+
+def test_repeat_live_scan_returns_first_checkin(client, make_customer):
+    code = make_customer()["qrCodeData"]
+    first = live_scan(client, code)
+    assert first.status_code == 201
+    repeat = live_scan(client, code)
+    assert repeat.status_code == 200 and repeat.get_json()["duplicate"]
+    assert repeat.get_json()["checkin"]["id"] == first.get_json()["checkin"]["id"]
+    # Another session type is a separate check-in
+    assert live_scan(client, code, session_type_id=2).status_code == 201
+
+
+def test_live_scan_after_batch_sync_returns_newest_synced_checkin(client, make_customer):
+    code = make_customer()["qrCodeData"]
+    # Out of order on purpose: the newest in-window scan is recorded, not the last one sent
+    newest, _ = sync_batch(client, code, seconds_ago(10), seconds_ago(30))
+    response = live_scan(client, code)
+    assert response.status_code == 200
+    assert response.get_json()["checkin"]["id"] == newest
+
+
+def test_batch_scans_outside_window_do_not_suppress_live_scan(client, make_customer):
+    code = make_customer()["qrCodeData"]
+    sync_batch(client, code, seconds_ago(scan_dedupe.CHECKIN_DEDUPE_SECONDS + 30))
+    assert live_scan(client, code).status_code == 201
+
+
+def test_older_batch_scan_does_not_replace_newer_live_scan(client, make_customer):
+    code = make_customer()["qrCodeData"]
+    live = live_scan(client, code).get_json()["checkin"]["id"]
+    sync_batch(client, code, seconds_ago(20))
+    assert live_scan(client, code).get_json()["checkin"]["id"] == live
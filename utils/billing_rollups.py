@@ -0,0 +1,219 @@
+"""
+Billing rollups: check-in counts and revenue per customer x session type x day/month
+Every check-in insert upserts its daily and monthly rollup rows in the same
+transaction, so the rollups are always consistent with check_in and billing
+reports read one row per group instead of every check-in. A student rarely has
+two sessions of one type on the same day, so the daily table is about as large
+as check_in itself; reports that do not need days read the monthly table.
+
+Days and months are UTC, like check_in_time. Revenue uses the session type's
+price at check-in time; rebuild_rollups() recomputes from check_in at current
+prices, since check-ins do not store the price they were billed at.
+"""
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, text
+
+from db import db
+from models.models import CheckInDailyRollup, CheckInMonthlyRollup, Customer, SessionType
+
+GROUP_DIMENSIONS = ("day", "month", "year", "customer", "session_type")
+
+# Response key for each dimension
+DIMENSION_KEYS = {
+    "day": "day",
+    "month": "month",
+    "year": "year",
+    "customer": "customerId",
+    "session_type": "sessionTypeId",
+}
+
+# (model, period column, SQL computing the period from check_in.check_in_time)
+ROLLUP_TABLES = (
+    (CheckInDailyRollup, "day", "date(check_in.check_in_time)"),
+    (CheckInMonthlyRollup, "month", "strftime('%Y-%m', check_in.check_in_time)"),
+)
+
+REBUILD_SQL = """
+INSERT INTO {table} (customer_id, session_type_id, {period}, checkin_count, revenue, updated_at)
+SELECT check_in.customer_id, check_in.session_type_id, {period_expression},
+       count(*), coalesce(sum(session_type.price), 0), :now
+FROM check_in JOIN session_type ON session_type.id = check_in.session_type_id
+{where}
+GROUP BY check_in.customer_id, check_in.session_type_id, {period_expression}
+"""
+
+
+# Plain SQL: the equivalent ORM on_conflict_do_update statement is recompiled on
+# every call, which made a check-in about twice as slow
+UPSERT_SQL = {
+    period: text(f"""
+INSERT INTO {model.__tablename__} (customer_id, session_type_id, {period}, checkin_count, revenue, updated_at)
+VALUES (:customer_id, :session_type_id, :period, :checkin_count, :revenue, :updated_at)
+ON CONFLICT (customer_id, session_type_id, {period}) DO UPDATE SET
+    checkin_count = checkin_count + excluded.checkin_count,
+    revenue = revenue + excluded.revenue,
+    updated_at = excluded.updated_at
+""")
+    for model, period, _ in ROLLUP_TABLES
+}
+
+
+def record_checkins(checkins):
+    """
+    Add check-ins to their rollup rows in the current session (caller commits)
+    checkins: iterable of (customer_id, session_type_id, check_in_time, price).
+    Check-ins sharing a row are summed first, so a batch is one upsert per group.
+    """
+    days = defaultdict(lambda: [0, 0.0])
+    for customer_id, session_type_id, check_in_time, price in checkins:
+        group = days[(customer_id, session_type_id, check_in_time.date())]
+        group[0] += 1
+        group[1] += price or 0.0
+    if not days:
+        return
+    months = defaultdict(lambda: [0, 0.0])
+    for (customer_id, session_type_id, day), (count, revenue) in days.items():
+        group = months[(customer_id, session_type_id, day.strftime("%Y-%m"))]
+        group[0] += count
+        group[1] += revenue
+
+    # Stored the way SQLAlchemy's Date/DateTime types store them
+    now = datetime.utcnow().isoformat(" ", "microseconds")
+    for (_, period, _), groups in zip(ROLLUP_TABLES, (days, months)):
+        db.session.execute(UPSERT_SQL[period], [
+            {"customer_id": customer_id, "session_type_id": session_type_id,
+             "period": value.isoformat() if period == "day" else value,
+             "checkin_count": count, "revenue": revenue, "updated_at": now}
+            for (customer_id, session_type_id, value), (count, revenue) in groups.items()
+        ])
+
+
+def _month_end(day):
+    return (day.replace(day=28) + timedelta(days=4)).replace(day=1) - timedelta(days=1)
+
+
+def _period_value(day, period):
+    """How a date is stored in the period column (YYYY-MM-DD or YYYY-MM)"""
+    return day.strftime("%Y-%m") if period == "month" else day.isoformat()
+
+
+def rebuild_rollups(connection, start=None, end=None):
+    """
+    Recompute rollup rows from check_in for [start, end] (dates; None = unbounded)
+    Monthly rows are rebuilt for every month the range touches. Takes a
+    Connection inside a transaction so migrations can call it too. Returns the
+    number of daily rollup rows written.
+    """
+    if start is not None and end is not None and end < start:
+        return 0
+    written = 0
+    for model, period, period_expression in ROLLUP_TABLES:
+        range_start, range_end = start, end
+        if period == "month":
+            # Whole months, so partial-range rebuilds do not drop the rest of a month
+            range_start = start.replace(day=1) if start is not None else None
+            range_end = _month_end(end) if end is not None else None
+
+        params = {"now": datetime.utcnow()}
+        conditions, checkin_conditions = [], []
+        if range_start is not None:
+            params["start_period"] = _period_value(range_start, period)
+            params["start_time"] = datetime.combine(range_start, datetime.min.time())
+            conditions.append(f"{period} >= :start_period")
+            checkin_conditions.append("check_in.check_in_time >= :start_time")
+        if range_end is not None:
+            params["end_period"] = _period_value(range_end, period)
+            params["end_time"] = datetime.combine(range_end + timedelta(days=1), datetime.min.time())
+            conditions.append(f"{period} <= :end_period")
+            checkin_conditions.append("check_in.check_in_time < :end_time")
+
+        table = model.__tablename__
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        connection.execute(text(f"DELETE FROM {table} {where}"), params)
+        checkin_where = f"WHERE {' AND '.join(checkin_conditions)}" if checkin_conditions else ""
+        result = connection.execute(text(REBUILD_SQL.format(
+            table=table, period=period, period_expression=period_expression, where=checkin_where
+        )), params)
+        if period == "day":
+            written = result.rowcount
+    return written
+
+
+def _whole_months(start, end):
+    """True if [start, end] covers whole calendar months (None = unbounded)"""
+    if start is not None and start.day != 1:
+        return False
+    return end is None or (end + timedelta(days=1)).day == 1
+
+
+def billing_report(group_by, start=None, end=None, customer_id=None, session_type_id=None):
+    """
+    Sessions and revenue per group, read from the monthly rollups when the
+    grouping and date range allow it, otherwise from the daily rollups
+    group_by: list of GROUP_DIMENSIONS names; start/end: dates (inclusive).
+    """
+    if "day" not in group_by and _whole_months(start, end):
+        model = CheckInMonthlyRollup
+        period_columns = {"month": model.month, "year": func.substr(model.month, 1, 4)}
+        lower = start.strftime("%Y-%m") if start is not None else None
+        upper = end.strftime("%Y-%m") if end is not None else None
+        period = model.month
+    else:
+        model = CheckInDailyRollup
+        period_columns = {
+            "day": model.day,
+            "month": func.strftime("%Y-%m", model.day),
+            "year": func.strftime("%Y", model.day),
+        }
+        lower, upper, period = start, end, model.day
+    dimension_columns = dict(period_columns, customer=model.customer_id, session_type=model.session_type_id)
+
+    columns = [dimension_columns[name].label(name) for name in group_by]
+    query = db.session.query(
+        *columns,
+        func.sum(model.checkin_count).label("sessions"),
+        func.sum(model.revenue).label("revenue"),
+    )
+    if lower is not None:
+        query = query.filter(period >= lower)
+    if upper is not None:
+        query = query.filter(period <= upper)
+    if customer_id is not None:
+        query = query.filter(model.customer_id == customer_id)
+    if session_type_id is not None:
+        query = query.filter(model.session_type_id == session_type_id)
+    if columns:
+        query = query.group_by(*columns).order_by(*columns)
+    rows = query.all()
+
+    # Names for the ids in the result, one IN query each
+    customer_names, session_type_names = {}, {}
+    if "customer" in group_by:
+        ids = {row.customer for row in rows}
+        customer_names = {
+            c.id: f"{c.firstName} {c.lastName}"
+            for c in db.session.query(Customer.id, Customer.firstName, Customer.lastName)
+            .filter(Customer.id.in_(ids))
+        } if ids else {}
+    if "session_type" in group_by:
+        ids = {row.session_type for row in rows}
+        session_type_names = dict(
+            db.session.query(SessionType.id, SessionType.name).filter(SessionType.id.in_(ids)).all()
+        ) if ids else {}
+
+    groups = []
+    for row in rows:
+        group = {}
+        for name in group_by:
+            value = getattr(row, name)
+            group[DIMENSION_KEYS[name]] = value.isoformat() if name == "day" else value
+        if "customer" in group_by:
+            group["customerName"] = customer_names.get(row.customer)
+        if "session_type" in group_by:
+            group["sessionType"] = session_type_names.get(row.session_type)
+        group["sessions"] = row.sessions or 0
+        group["revenue"] = round(row.revenue or 0.0, 2)
+        groups.append(group)
+    return groups
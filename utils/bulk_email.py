@@ -0,0 +1,68 @@
+"""
+Bulk announcements to customers (e.g. term start)
+Plain announcements are rendered once and sent as SendGrid personalizations,
+up to 1000 recipients per mail/send request, with each recipient's name and QR
+id filled in by substitutions. Attachments are shared by every personalization
+in a request, so emails carrying each customer's own QR code fall back to one
+message per recipient; those images are rendered together via utils.qr_batch.
+"""
+from db import db
+from models.models import Customer
+from utils.email_service import (
+    queue_bulk_email, queue_email, render_bulk_email, png_attachment, qr_attachment_filename
+)
+from utils.qr_batch import render_batch
+from utils.qr_render import DEFAULT_BOX_SIZE
+
+
+def recipient_fields(row):
+    return {
+        "customer_name": f"{row.firstName} {row.lastName}",
+        "first_name": row.firstName,
+        "qr_code_data": row.qrCodeData,
+    }
+
+
+def select_recipients(customer_ids=None):
+    query = db.session.query(
+        Customer.id, Customer.firstName, Customer.lastName, Customer.email, Customer.qrCodeData
+    ).filter(Customer.email != "")
+    if customer_ids:
+        query = query.filter(Customer.id.in_(customer_ids))
+    return query.order_by(Customer.id).all()
+
+
+def send_bulk(template, context, customer_ids=None, attach_qr=False, subject=None):
+    """
+    Queue a bulk template for every selected customer with an email address
+    Returns a summary dict. Raises ValueError for a non-bulk template and
+    jinja2 UndefinedError if context is missing a template value.
+    """
+    rows = select_recipients(customer_ids)
+    context = {"message": "", **context, "attach_qr": attach_qr}
+
+    if not attach_qr:
+        outbox_ids = queue_bulk_email(
+            template, context, ((row.email, recipient_fields(row)) for row in rows),
+            kind=f"bulk_{template}", subject=subject
+        )
+        return {"recipients": len(rows), "requests": len(outbox_ids), "outbox_ids": outbox_ids, "skipped": []}
+
+    # Fail on a bad template or missing context before rendering any images
+    render_bulk_email(template, context)
+    skipped = [row.id for row in rows if not row.qrCodeData]
+    rows = [row for row in rows if row.qrCodeData]
+    images = dict(render_batch([(row.id, row.qrCodeData, DEFAULT_BOX_SIZE) for row in rows]))
+    outbox_ids = []
+    for row in rows:
+        fields = recipient_fields(row)
+        success, message, outbox_id = queue_email(
+            row.email, template, {**context, **fields}, kind=f"bulk_{template}_qr",
+            attachments=[png_attachment(images[row.id], qr_attachment_filename(fields["customer_name"]))],
+            subject=subject
+        )
+        if success:
+            outbox_ids.append(outbox_id)
+        else:
+            skipped.append(row.id)
+    return {"recipients": len(outbox_ids), "requests": len(outbox_ids), "outbox_ids": outbox_ids, "skipped": skipped}
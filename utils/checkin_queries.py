@@ -0,0 +1,103 @@
+"""
+Shared query helpers for reading check-ins
+Check-ins are always read together with the customer name and session type
+name/price in a single joined query, never with per-row lookups.
+"""
+import base64
+from datetime import datetime, timedelta
+
+from db import db
+from models.models import CheckIn, Customer, SessionType
+
+
+def joined_checkins_query():
+    """Return a query yielding check-in rows with customer and session type columns"""
+    return db.session.query(
+        CheckIn.id,
+        CheckIn.customer_id,
+        CheckIn.session_type_id,
+        CheckIn.check_in_time,
+        CheckIn.notes,
+        Customer.firstName,
+        Customer.lastName,
+        SessionType.name.label("session_type_name"),
+        SessionType.price,
+    ).outerjoin(
+        Customer, CheckIn.customer_id == Customer.id
+    ).outerjoin(
+        SessionType, CheckIn.session_type_id == SessionType.id
+    )
+
+
+def _parse_bound(value, name):
+    """Parse an ISO date/datetime filter value"""
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"Invalid {name}: expected ISO date or datetime")
+
+
+def _parse_int(value, name):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid {name}: expected an integer")
+
+
+def apply_checkin_filters(query, args):
+    """
+    Apply the start/end/customer_id/session_type_id filters from request args
+    Raises ValueError with a user-facing message on malformed input.
+    """
+    start = args.get("start")
+    end = args.get("end")
+    customer_id = args.get("customer_id")
+    session_type_id = args.get("session_type_id")
+
+    if start:
+        query = query.filter(CheckIn.check_in_time >= _parse_bound(start, "start"))
+    if end:
+        end_at = _parse_bound(end, "end")
+        if len(end) == 10:
+            # A bare end date includes the whole day
+            query = query.filter(CheckIn.check_in_time < end_at + timedelta(days=1))
+        else:
+            query = query.filter(CheckIn.check_in_time <= end_at)
+    if customer_id:
+        query = query.filter(CheckIn.customer_id == _parse_int(customer_id, "customer_id"))
+    if session_type_id:
+        query = query.filter(CheckIn.session_type_id == _parse_int(session_type_id, "session_type_id"))
+    return query
+
+
+def encode_cursor(check_in_time, checkin_id):
+    """Encode a keyset position as an opaque URL-safe cursor"""
+    raw = f"{check_in_time.isoformat()}|{checkin_id}".encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor):
+    """Decode a cursor produced by encode_cursor into (check_in_time, id)"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        raw = base64.urlsafe_b64decode(padded.encode("ascii")).decode("utf-8")
+        time_part, id_part = raw.rsplit("|", 1)
+        return datetime.fromisoformat(time_part), int(id_part)
+    except (ValueError, UnicodeError):
+        raise ValueError("Invalid cursor")
+
+
+def serialize_checkin_row(row):
+    """Convert a joined_checkins_query row into the check-in history JSON shape"""
+    has_customer = row.firstName is not None
+    has_session_type = row.session_type_name is not None
+    return {
+        "id": row.id,
+        "customerId": row.customer_id,
+        "sessionTypeId": row.session_type_id,
+        "customerName": f"{row.firstName} {row.lastName}" if has_customer else "Unknown",
+        "sessionType": row.session_type_name if has_session_type else "Unknown",
+        "checkInTime": row.check_in_time.isoformat(),
+        "notes": row.notes,
+        "price": row.price if has_session_type else 0.0
+    }
@@ -0,0 +1,34 @@
+"""
+Per-worker concurrency lane for slow, I/O-bound endpoints
+Under the gthread worker (gunicorn.conf.py) a QuickBooks call blocks only its
+own thread, but enough slow calls at once could still take every thread in a
+worker. Endpoints wrapped with io_bound() share a lane that admits at most
+IO_LANE_MAX_CONCURRENT requests per worker, leaving the remaining threads for
+check-ins; when the lane stays full they answer 503 with Retry-After.
+"""
+import os
+from functools import wraps
+from threading import BoundedSemaphore
+
+from flask import jsonify
+
+GUNICORN_THREADS = int(os.environ.get("GUNICORN_THREADS", "8"))
+IO_LANE_MAX_CONCURRENT = int(os.environ.get("IO_LANE_MAX_CONCURRENT", str(max(1, GUNICORN_THREADS - 2))))
+IO_LANE_WAIT_SECONDS = float(os.environ.get("IO_LANE_WAIT_SECONDS", "5"))
+
+_lane = BoundedSemaphore(IO_LANE_MAX_CONCURRENT)
+
+
+def io_bound(view):
+    """Run the view in the I/O lane, or return 503 if the lane stays full"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if not _lane.acquire(timeout=IO_LANE_WAIT_SECONDS):
+            response = jsonify({"error": "Server busy with other QuickBooks/email requests; please retry"})
+            response.headers["Retry-After"] = "5"
+            return response, 503
+        try:
+            return view(*args, **kwargs)
+        finally:
+            _lane.release()
+    return wrapper
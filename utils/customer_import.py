@@ -0,0 +1,241 @@
+"""
+Bulk customer import from CSV or JSON lines
+Rows are read from the request stream and processed in chunks: each chunk is
+validated with one IN query for existing emails and one for existing QR values,
+inserted with a single multi-row INSERT, given signed QR codes where the file
+had none, and committed as its own transaction. Every rejected row is reported
+with its row number instead of failing the whole import.
+"""
+import csv
+import io
+import json
+import os
+import re
+
+from sqlalchemy import insert, update
+from sqlalchemy.exc import IntegrityError
+
+from db import db
+from models.models import Customer
+from utils.lookup_cache import invalidate_qr
+from utils.qr_payload import issue_signed_qr
+
+IMPORT_CHUNK_SIZE = int(os.environ.get("CUSTOMER_IMPORT_CHUNK_SIZE", "500"))
+IMPORT_MAX_ROWS = int(os.environ.get("CUSTOMER_IMPORT_MAX_ROWS", "10000"))
+
+# Normalized header (lowercase, letters and digits only) -> Customer column
+FIELD_ALIASES = {
+    "firstname": "firstName",
+    "first": "firstName",
+    "lastname": "lastName",
+    "last": "lastName",
+    "surname": "lastName",
+    "email": "email",
+    "emailaddress": "email",
+    "phone": "phone",
+    "phonenumber": "phone",
+    "address": "address",
+    "qrcodedata": "qrCodeData",
+    "qrcode": "qrCodeData",
+}
+REQUIRED_FIELDS = ("firstName", "lastName", "email")
+FIELD_MAX_LENGTHS = {column.name: column.type.length for column in Customer.__table__.columns
+                     if getattr(column.type, "length", None)}
+EMAIL_PATTERN = re.compile(r"^[^@\s]+@[^@\s]+\.[^@\s]+$")
+
+
+class ImportFormatError(ValueError):
+    """The upload as a whole cannot be read"""
+
+
+def _normalize_key(key):
+    return re.sub(r"[^a-z0-9]", "", str(key).lower())
+
+
+def _normalize_row(raw):
+    row = {}
+    for key, value in raw.items():
+        field = FIELD_ALIASES.get(_normalize_key(key)) if key is not None else None
+        if field is None or value is None:
+            continue
+        value = str(value).strip()
+        if value:
+            row[field] = value
+    return row
+
+
+def read_rows(stream, import_format):
+    """Yield (row_number, raw dict or error message) from a binary stream; row 1 is the first data row"""
+    text = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+    if import_format == "csv":
+        reader = csv.DictReader(text)
+        if not reader.fieldnames or not any(_normalize_key(name) in FIELD_ALIASES for name in reader.fieldnames):
+            raise ImportFormatError("CSV header must include firstName, lastName and email columns")
+        for number, raw in enumerate(reader, start=1):
+            yield number, raw
+    else:
+        number = 0
+        for line in text:
+            if not line.strip():
+                continue
+            number += 1
+            try:
+                raw = json.loads(line)
+            except ValueError:
+                yield number, "Invalid JSON"
+                continue
+            yield number, raw if isinstance(raw, dict) else "Each line must be a JSON object"
+
+
+def _validate(number, raw):
+    if isinstance(raw, str):
+        return None, raw
+    row = _normalize_row(raw)
+    missing = [field for field in REQUIRED_FIELDS if not row.get(field)]
+    if missing:
+        return None, f"Missing required fields: {', '.join(missing)}"
+    if not EMAIL_PATTERN.match(row["email"]):
+        return None, "Invalid email"
+    too_long = [field for field, value in row.items() if len(value) > FIELD_MAX_LENGTHS.get(field, len(value))]
+    if too_long:
+        return None, f"Too long: {', '.join(too_long)}"
+    return row, None
+
+
+def _import_chunk(chunk, seen_emails, seen_qr_values, dry_run):
+    """Validate and insert one chunk of (row_number, raw); returns (created, errors)"""
+    errors = []
+    candidates = []
+    for number, raw in chunk:
+        row, error = _validate(number, raw)
+        if error:
+            email = _normalize_row(raw).get("email") if isinstance(raw, dict) else None
+            errors.append({"row": number, "error": error, "email": email})
+        else:
+            candidates.append((number, row))
+
+    # One IN query each for every email and QR value in the chunk
+    emails = {row["email"] for _, row in candidates}
+    qr_values = {row["qrCodeData"] for _, row in candidates if row.get("qrCodeData")}
+    existing_emails = {
+        email for (email,) in db.session.query(Customer.email).filter(Customer.email.in_(emails))
+    } if emails else set()
+    existing_qr_values = {
+        qr for (qr,) in db.session.query(Customer.qrCodeData).filter(Customer.qrCodeData.in_(qr_values))
+    } if qr_values else set()
+
+    # Earlier chunks' values are in seen_*; this chunk's are only added once it commits
+    chunk_emails, chunk_qr_values = {}, {}
+    accepted = []
+    for number, row in candidates:
+        email = row["email"]
+        qr_value = row.get("qrCodeData")
+        first_email_row = seen_emails.get(email) or chunk_emails.get(email)
+        first_qr_row = (seen_qr_values.get(qr_value) or chunk_qr_values.get(qr_value)) if qr_value else None
+        if first_email_row:
+            error = f"Duplicate email in file (row {first_email_row})"
+        elif email in existing_emails:
+            error = "Customer with this email already exists"
+        elif first_qr_row:
+            error = f"Duplicate qrCodeData in file (row {first_qr_row})"
+        elif qr_value and qr_value in existing_qr_values:
+            error = "qrCodeData already belongs to another customer"
+        else:
+            error = None
+        if error:
+            errors.append({"row": number, "error": error, "email": email})
+            continue
+        chunk_emails[email] = number
+        if qr_value:
+            chunk_qr_values[qr_value] = number
+        accepted.append((number, row))
+
+    if dry_run or not accepted:
+        seen_emails.update(chunk_emails)
+        seen_qr_values.update(chunk_qr_values)
+        return [{"row": number, "email": row["email"], "qrCodeData": row.get("qrCodeData")}
+                for number, row in accepted], errors
+
+    values = [{
+        "firstName": row["firstName"],
+        "lastName": row["lastName"],
+        "email": row["email"],
+        "phone": row.get("phone"),
+        "address": row.get("address"),
+        "qrCodeData": row.get("qrCodeData"),
+    } for _, row in accepted]
+    # Multi-row INSERT; RETURNING gives ids in parameter order
+    ids = db.session.execute(
+        insert(Customer).returning(Customer.id, sort_by_parameter_order=True), values
+    ).scalars().all()
+
+    generated = []
+    for value, customer_id in zip(values, ids):
+        if not value["qrCodeData"]:
+            value["qrCodeData"] = issue_signed_qr(customer_id)
+            generated.append({"id": customer_id, "qrCodeData": value["qrCodeData"]})
+    if generated:
+        # ORM bulk UPDATE by primary key (executemany)
+        db.session.execute(update(Customer), generated)
+    db.session.commit()
+    seen_emails.update(chunk_emails)
+    seen_qr_values.update(chunk_qr_values)
+    invalidate_qr(*(value["qrCodeData"] for value in values))
+
+    created = [{"row": number, "id": customer_id, "email": value["email"], "qrCodeData": value["qrCodeData"]}
+               for (number, _), value, customer_id in zip(accepted, values, ids)]
+    return created, errors
+
+
+def import_customers(rows, dry_run=False):
+    """
+    Import (row_number, raw) pairs from read_rows in chunked transactions
+    Returns {"created": [...], "errors": [...], "summary": {...}}. Rows past
+    IMPORT_MAX_ROWS are not read; the summary is marked truncated.
+    """
+    created, errors = [], []
+    seen_emails, seen_qr_values = {}, {}
+    chunk = []
+    total = 0
+
+    def flush():
+        try:
+            chunk_created, chunk_errors = _import_chunk(chunk, seen_emails, seen_qr_values, dry_run)
+        except IntegrityError:
+            # A concurrent registration took an email or QR value; re-validating reports those rows
+            db.session.rollback()
+            try:
+                chunk_created, chunk_errors = _import_chunk(chunk, seen_emails, seen_qr_values, dry_run)
+            except IntegrityError:
+                # Still racing; nothing in this chunk was committed, so report its rows for a re-upload
+                db.session.rollback()
+                chunk_created, chunk_errors = [], [{
+                    "row": number,
+                    "error": "Conflicting concurrent change; this row was not imported, retry it",
+                    "email": _normalize_row(raw).get("email") if isinstance(raw, dict) else None,
+                } for number, raw in chunk]
+        created.extend(chunk_created)
+        errors.extend(chunk_errors)
+        chunk.clear()
+
+    truncated = False
+    for number, raw in rows:
+        if total == IMPORT_MAX_ROWS:
+            truncated = True
+            errors.append({"row": number, "error": f"Row limit of {IMPORT_MAX_ROWS} reached; "
+                                                  "this and later rows were not imported", "email": None})
+            break
+        total += 1
+        chunk.append((number, raw))
+        if len(chunk) >= IMPORT_CHUNK_SIZE:
+            flush()
+    if chunk:
+        flush()
+
+    errors.sort(key=lambda error: error["row"])
+    return {
+        "created": created,
+        "errors": errors,
+        "summary": {"rows": total, "created": len(created), "error": len(errors), "dryRun": dry_run,
+                    "truncated": truncated},
+    }
@@ -0,0 +1,57 @@
+"""
+Customer typeahead over the customer_search FTS5 index
+The index (name, email, phone) is created by migration 3 and kept in sync by
+triggers on the customer table, so registration, updates and bulk imports need
+no extra code. Every word typed is matched as a prefix; when all words
+together find nothing (a typo in one of them), any word may match instead.
+Results are ranked by bm25 with name matches weighted highest.
+"""
+import re
+
+from sqlalchemy import text
+
+from db import db
+
+SEARCH_DEFAULT_LIMIT = 10
+SEARCH_MAX_LIMIT = 50
+# Longest query we tokenize; front-desk lookups are a few words
+SEARCH_MAX_TERMS = 8
+
+# bm25 weights for the name, email and phone columns
+SEARCH_SQL = text("""
+SELECT customer.id, customer."firstName", customer."lastName", customer.email, customer.phone,
+       customer."qrCodeData"
+FROM customer_search JOIN customer ON customer.id = customer_search.rowid
+WHERE customer_search MATCH :match
+ORDER BY bm25(customer_search, 10.0, 2.0, 1.0), customer.id
+LIMIT :limit
+""")
+
+TERM_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+
+def match_expression(query, operator="AND"):
+    """FTS5 MATCH string with every word of query as a quoted prefix term, or None"""
+    terms = TERM_PATTERN.findall(query)[:SEARCH_MAX_TERMS]
+    if not terms:
+        return None
+    # Quoting makes FTS5 syntax characters and keywords (AND, NEAR, ...) plain text
+    return f" {operator} ".join(f'"{term}"*' for term in terms)
+
+
+def search_customers(query, limit=SEARCH_DEFAULT_LIMIT):
+    """Top matches as customer dicts, best first"""
+    match = match_expression(query)
+    if match is None:
+        return []
+    rows = db.session.execute(SEARCH_SQL, {"match": match, "limit": limit}).all()
+    if not rows and " AND " in match:
+        rows = db.session.execute(SEARCH_SQL, {"match": match_expression(query, "OR"), "limit": limit}).all()
+    return [{
+        "id": row.id,
+        "firstName": row.firstName,
+        "lastName": row.lastName,
+        "email": row.email,
+        "phone": row.phone,
+        "qrCodeData": row.qrCodeData,
+    } for row in rows]
@@ -0,0 +1,62 @@
+"""
+One-time schema and seed initialization shared by all workers
+Every gunicorn worker used to run create_all(), the migrations and the seed
+check on boot. Now the first process to start does the work while holding an
+exclusive file lock, then stamps the database with a fingerprint of the models
+and migrations in PRAGMA user_version. Later workers (and restarts) read that
+one pragma, see a matching fingerprint and skip initialization entirely; any
+model or migration change produces a new fingerprint and runs it again once.
+"""
+import fcntl
+import hashlib
+import os
+
+from sqlalchemy import text
+
+from db import db
+from utils.migrations import MIGRATIONS, run_migrations
+
+DB_INIT_LOCK_FILE = os.path.join(os.environ.get("QR_CHECKIN_DB_PATH", "/tmp/data"), "db_init.lock")
+
+
+def schema_fingerprint():
+    """Positive 31-bit hash of every table, column and migration version"""
+    parts = [
+        f"{table.name}:{','.join(column.name for column in table.columns)}"
+        for table in db.metadata.sorted_tables
+    ]
+    parts.extend(f"migration:{version}" for version, _, _ in MIGRATIONS)
+    digest = hashlib.sha1("\n".join(parts).encode("utf-8")).hexdigest()
+    return int(digest[:7], 16) or 1
+
+
+def _stamped_version():
+    with db.engine.connect() as connection:
+        return connection.execute(text("PRAGMA user_version")).scalar()
+
+
+def initialize_database(seed):
+    """
+    Create tables, migrate and seed once per schema version; call inside an app context
+    seed is called with no arguments after the schema is in place. Returns True
+    if this process did the initialization, False if it was already done.
+    """
+    fingerprint = schema_fingerprint()
+    if _stamped_version() == fingerprint:
+        return False
+    with open(DB_INIT_LOCK_FILE, "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            # Another worker may have finished while we waited for the lock
+            if _stamped_version() == fingerprint:
+                return False
+            db.create_all()
+            # create_all never alters existing tables; schema changes to them are migrations
+            run_migrations(db.engine)
+            seed()
+            with db.engine.begin() as connection:
+                connection.execute(text(f"PRAGMA user_version = {fingerprint:d}"))
+            print(f"Database initialized (schema fingerprint {fingerprint})")
+            return True
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
@@ -0,0 +1,162 @@
+"""
+Persistent email outbox with a background dispatcher
+Routes enqueue a ready-to-send SendGrid-format payload and return immediately.
+A daemon thread in each worker claims due messages with a conditional UPDATE
+(so two workers never send the same row), delivers them on a small thread pool
+through the EMAIL_TRANSPORT transport (utils/email_transports.py), and retries
+failures with exponential backoff. Callers poll the message status.
+
+Run `python -m utils.email_outbox` to dispatch from a separate process instead,
+with EMAIL_OUTBOX_DISPATCHER=0 set for the web workers.
+"""
+import json
+import os
+import random
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from threading import Event, Lock, Thread
+
+from sqlalchemy import and_, or_, update
+
+from db import db
+from models.models import EmailOutbox
+from utils.email_transports import get_transport
+
+EMAIL_OUTBOX_DISPATCHER = os.environ.get("EMAIL_OUTBOX_DISPATCHER", "1") == "1"
+EMAIL_OUTBOX_POLL_SECONDS = float(os.environ.get("EMAIL_OUTBOX_POLL_SECONDS", "2"))
+EMAIL_OUTBOX_CONCURRENCY = int(os.environ.get("EMAIL_OUTBOX_CONCURRENCY", "4"))
+EMAIL_OUTBOX_MAX_ATTEMPTS = int(os.environ.get("EMAIL_OUTBOX_MAX_ATTEMPTS", "6"))
+EMAIL_OUTBOX_BACKOFF_SECONDS = float(os.environ.get("EMAIL_OUTBOX_BACKOFF_SECONDS", "30"))
+EMAIL_OUTBOX_MAX_BACKOFF_SECONDS = float(os.environ.get("EMAIL_OUTBOX_MAX_BACKOFF_SECONDS", "3600"))
+# A claimed message whose worker died is retried after the lease runs out
+EMAIL_OUTBOX_LEASE_SECONDS = float(os.environ.get("EMAIL_OUTBOX_LEASE_SECONDS", "120"))
+
+_wake = Event()
+_started = {"thread": None}
+_start_lock = Lock()
+
+
+def _outbox_row(payload, kind):
+    personalizations = payload["personalizations"]
+    personalization = personalizations[0]
+    return EmailOutbox(
+        kind=kind,
+        # Bulk payloads carry many recipients; one row is still one mail/send request
+        to_email=personalization["to"][0]["email"] if len(personalizations) == 1 else f"{len(personalizations)} recipients",
+        subject=personalization.get("subject") or payload.get("subject"),
+        payload=json.dumps(payload)
+    )
+
+
+def enqueue_email(payload, kind):
+    """Store a SendGrid payload for background delivery and return the outbox id"""
+    message = _outbox_row(payload, kind)
+    db.session.add(message)
+    db.session.commit()
+    _wake.set()
+    print(f"[OUTBOX] Queued {kind} email {message.id} to {message.to_email}")
+    return message.id
+
+
+def enqueue_emails(payloads, kind):
+    """Store several payloads in one commit and return their outbox ids"""
+    messages = [_outbox_row(payload, kind) for payload in payloads]
+    db.session.add_all(messages)
+    db.session.commit()
+    _wake.set()
+    print(f"[OUTBOX] Queued {len(messages)} {kind} email request(s)")
+    return [message.id for message in messages]
+
+
+def backoff_delay(attempts):
+    """Exponential backoff with full jitter, capped at the configured maximum"""
+    ceiling = min(EMAIL_OUTBOX_MAX_BACKOFF_SECONDS, EMAIL_OUTBOX_BACKOFF_SECONDS * (2 ** (attempts - 1)))
+    return random.uniform(ceiling / 2, ceiling)
+
+
+def _claim_due_messages(limit):
+    now = datetime.utcnow()
+    candidates = [
+        row.id for row in db.session.query(EmailOutbox.id).filter(or_(
+            and_(EmailOutbox.status == "queued", EmailOutbox.next_attempt_at <= now),
+            and_(EmailOutbox.status == "sending", EmailOutbox.locked_until < now)
+        )).order_by(EmailOutbox.next_attempt_at).limit(limit)
+    ]
+    claimed = []
+    for message_id in candidates:
+        # Only one worker's conditional update can flip a given row to "sending"
+        result = db.session.execute(
+            update(EmailOutbox)
+            .where(EmailOutbox.id == message_id)
+            .where(or_(
+                EmailOutbox.status == "queued",
+                and_(EmailOutbox.status == "sending", EmailOutbox.locked_until < now)
+            ))
+            .values(status="sending", locked_until=now + timedelta(seconds=EMAIL_OUTBOX_LEASE_SECONDS))
+        )
+        if result.rowcount == 1:
+            claimed.append(message_id)
+    db.session.commit()
+    return claimed
+
+
+def deliver_message(app, message_id):
+    with app.app_context():
+        message = EmailOutbox.query.get(message_id)
+        if message is None or message.status != "sending":
+            return
+        success, retryable, detail = get_transport().send(json.loads(message.payload))
+        message.attempts += 1
+        message.locked_until = None
+        if success:
+            message.status = "sent"
+            message.sent_at = datetime.utcnow()
+            message.last_error = None
+        elif retryable and message.attempts < EMAIL_OUTBOX_MAX_ATTEMPTS:
+            message.status = "queued"
+            message.next_attempt_at = datetime.utcnow() + timedelta(seconds=backoff_delay(message.attempts))
+            message.last_error = detail[:1000]
+        else:
+            message.status = "failed"
+            message.last_error = detail[:1000]
+        db.session.commit()
+        print(f"[OUTBOX] Email {message_id} -> {message.status} (attempt {message.attempts}): {detail[:200]}")
+
+
+def dispatch_forever(app):
+    """Claim and deliver due messages until the process exits"""
+    executor = ThreadPoolExecutor(max_workers=EMAIL_OUTBOX_CONCURRENCY, thread_name_prefix="email-outbox")
+    while True:
+        try:
+            with app.app_context():
+                claimed = _claim_due_messages(EMAIL_OUTBOX_CONCURRENCY * 4)
+            futures = [executor.submit(deliver_message, app, message_id) for message_id in claimed]
+            for future in futures:
+                future.result()
+        except Exception as e:
+            print(f"[OUTBOX] Dispatcher error: {e}")
+            claimed = []
+        if not claimed:
+            _wake.wait(EMAIL_OUTBOX_POLL_SECONDS)
+            _wake.clear()
+
+
+def start_outbox_dispatcher(app):
+    """Start the background dispatcher thread once per process"""
+    if not EMAIL_OUTBOX_DISPATCHER:
+        return None
+    with _start_lock:
+        thread = _started["thread"]
+        if thread is None or not thread.is_alive() or _started.get("pid") != os.getpid():
+            thread = Thread(target=dispatch_forever, args=(app,), name="email-outbox-dispatcher", daemon=True)
+            thread.start()
+            _started["thread"] = thread
+            _started["pid"] = os.getpid()
+        return thread
+
+
+if __name__ == "__main__":
+    os.environ["EMAIL_OUTBOX_DISPATCHER"] = "0"
+    from main import app as flask_app
+    print("[OUTBOX] Dispatching in the foreground")
+    dispatch_forever(flask_app)
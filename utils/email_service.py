@@ -0,0 +1,225 @@
+"""
+Shared email pipeline: templates -> SendGrid-format payload -> outbox -> transport
+Email bodies live in templates/email/ and are compiled once when this module is
+imported; routes only supply the per-recipient context. Every route builds its
+payload with build_payload() and hands it to queue_email(), which stores it in
+the outbox for delivery through the configured transport.
+"""
+import base64
+import os
+import re
+
+from jinja2 import Environment, FileSystemLoader, StrictUndefined, select_autoescape
+
+from db import db
+from models.models import Customer
+from utils.email_outbox import enqueue_email, enqueue_emails
+from utils.email_transports import get_transport
+from utils.qr_render import render_qr
+
+EMAIL_TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "templates", "email")
+DEFAULT_FROM_EMAIL = "noreply@qrcheckin.app"
+# Per-recipient template fields; in bulk sends SendGrid swaps "-<field>-" for each recipient's value
+BULK_RECIPIENT_FIELDS = ("customer_name", "first_name", "qr_code_data")
+# Matched against the short "data:image/png;base64" header only, never the payload
+DATA_URL_HEADER_PATTERN = re.compile(r'data:image/(\w+);base64$')
+
+# name -> subject and body template files; each body becomes one content part
+EMAIL_TEMPLATES = {
+    "qr_welcome": {
+        "subject": "Your QR Code for Doulos Education",
+        "html": "qr_welcome.html",
+    },
+    "qr_attachment": {
+        "subject": "Your QR Code for Doulos Education Tutoring",
+        "text": "qr_attachment.txt",
+    },
+    "simple_test": {
+        "subject": "Test Email from Doulos Education",
+        "text": "simple_test.txt",
+    },
+    "registration_link": {
+        "subject": "Your Doulos Education Registration Confirmation",
+        "text": "registration_link.txt",
+    },
+    # bulk: may be sent to many customers at once via SendGrid substitutions
+    "term_start": {
+        "subject": "A new term at Doulos Education is starting",
+        "text": "term_start.txt",
+        "bulk": True,
+    },
+}
+
+_env = Environment(
+    loader=FileSystemLoader(EMAIL_TEMPLATE_DIR),
+    autoescape=select_autoescape(["html"]),
+    undefined=StrictUndefined,
+    keep_trailing_newline=True,
+)
+
+
+def _compile_templates():
+    compiled = {}
+    for name, spec in EMAIL_TEMPLATES.items():
+        compiled[name] = {
+            "subject": spec["subject"],
+            # Order matters to SendGrid: text/plain must come before text/html
+            "parts": [
+                (mime, _env.get_template(spec[key]))
+                for key, mime in (("text", "text/plain"), ("html", "text/html"))
+                if key in spec
+            ],
+        }
+    return compiled
+
+
+_compiled = _compile_templates()
+
+
+def render_email(name, **context):
+    """Render a named template; returns (subject, SendGrid content list)"""
+    template = _compiled[name]
+    content = [{"type": mime, "value": body.render(**context)} for mime, body in template["parts"]]
+    return template["subject"], content
+
+
+def is_bulk_template(name):
+    return bool(EMAIL_TEMPLATES.get(name, {}).get("bulk"))
+
+
+def substitution_key(field):
+    return f"-{field}-"
+
+
+def from_address():
+    return {"email": os.environ.get("SENDGRID_FROM_EMAIL", DEFAULT_FROM_EMAIL)}
+
+
+def build_payload(to_email, subject, content, attachments=None):
+    """SendGrid v3 mail/send payload for one recipient"""
+    payload = {
+        "personalizations": [{
+            "to": [{"email": to_email}],
+            "subject": subject
+        }],
+        "from": from_address(),
+        "content": content
+    }
+    if attachments:
+        payload["attachments"] = attachments
+    return payload
+
+
+def build_bulk_payload(recipients, subject, content):
+    """One payload with a personalization per (email, fields) recipient, at most 1000"""
+    return {
+        "personalizations": [
+            {
+                "to": [{"email": email}],
+                "subject": subject,
+                "substitutions": {substitution_key(field): str(value or "") for field, value in fields.items()}
+            }
+            for email, fields in recipients
+        ],
+        "from": from_address(),
+        "content": content
+    }
+
+
+def attachment(content_base64, mime_type, filename, content_id=None):
+    """Attachment entry; with a content_id it is inline and can be shown via cid:<content_id>"""
+    entry = {
+        "content": content_base64,
+        "type": mime_type,
+        "filename": filename,
+        "disposition": "inline" if content_id else "attachment"
+    }
+    if content_id:
+        entry["content_id"] = content_id
+    return entry
+
+
+def png_attachment(png_bytes, filename, content_id=None):
+    return attachment(base64.b64encode(png_bytes).decode("ascii"), "image/png", filename, content_id)
+
+
+def qr_attachment_filename(customer_name):
+    return f"{customer_name.replace(' ', '_')}_QRCode.png"
+
+
+def parse_image_data_url(data_url):
+    """Split a data:image/...;base64 URL into (image_type, base64_data), or None"""
+    header, separator, base64_data = data_url.partition(",")
+    match = DATA_URL_HEADER_PATTERN.match(header)
+    if not separator or not match or not base64_data:
+        return None
+    return match.group(1), base64_data
+
+
+def server_rendered_qr(customer_id=None, qr_code_data=None):
+    """
+    Cached PNG of a customer's QR code, for clients that send an id instead of an image
+    A customer_id takes its stored QR payload (and fills in name and email);
+    otherwise qr_code_data is rendered as given. Returns (png_bytes, customer)
+    with customer None for qr_code_data, or (None, None) if nothing to render.
+    """
+    customer = None
+    if customer_id is not None:
+        customer = db.session.get(Customer, customer_id)
+        if customer is None or not customer.qrCodeData:
+            return None, None
+        qr_code_data = customer.qrCodeData
+    if not qr_code_data:
+        return None, None
+    return render_qr(qr_code_data)[1], customer
+
+
+def email_configured():
+    """True if the selected transport can deliver (e.g. a SendGrid API key is set)"""
+    return get_transport().configured()
+
+
+def queue_email(to_email, template, context, kind, attachments=None, subject=None):
+    """
+    Render a template and queue it for delivery
+    Returns (success: bool, message: str, outbox_id: int or None)
+    """
+    try:
+        default_subject, content = render_email(template, **context)
+        subject = subject or default_subject
+        outbox_id = enqueue_email(build_payload(to_email, subject, content, attachments), kind=kind)
+    except Exception as e:
+        print(f"[EMAIL] Failed to queue {kind} email: {e}")
+        return False, f"Error sending email: {str(e)}", None
+    return True, f"Email queued for delivery via {get_transport().label}", outbox_id
+
+
+def render_bulk_email(template, context):
+    """Render a bulk template once, leaving per-recipient fields as substitution keys"""
+    if not is_bulk_template(template):
+        raise ValueError(f"Template {template!r} cannot be bulk sent")
+    placeholders = {field: substitution_key(field) for field in BULK_RECIPIENT_FIELDS}
+    return render_email(template, **{**context, **placeholders})
+
+
+def queue_bulk_email(template, context, recipients, kind, subject=None):
+    """
+    Render a bulk template once and queue it in requests of up to 1000 recipients
+    recipients is an iterable of (email, {field: value}) with fields from
+    BULK_RECIPIENT_FIELDS. Transports that deliver per recipient (SMTP) get one
+    request per recipient instead. Returns the list of outbox ids.
+    """
+    default_subject, content = render_bulk_email(template, context)
+    subject = subject or default_subject
+    per_request = get_transport().max_personalizations
+
+    payloads = []
+    chunk = []
+    for recipient in recipients:
+        chunk.append(recipient)
+        if len(chunk) == per_request:
+            payloads.append(build_bulk_payload(chunk, subject, content))
+            chunk = []
+    if chunk:
+        payloads.append(build_bulk_payload(chunk, subject, content))
+    return enqueue_emails(payloads, kind=kind)
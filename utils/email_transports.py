@@ -0,0 +1,172 @@
+"""
+Pluggable delivery transports for outgoing email
+Messages are always built as SendGrid v3 mail/send payloads (that is what the
+outbox stores); each transport knows how to deliver one. Pick one with
+EMAIL_TRANSPORT:
+
+- sendgrid (default): POST the payload to the SendGrid API
+- smtp: convert the payload to a MIME message and send it via SMTP_HOST
+- file: write each payload as JSON into EMAIL_FILE_SINK_DIR (local development)
+
+send() returns (success, retryable, detail), which the outbox dispatcher uses
+to decide between sent, retry with backoff, and failed. max_personalizations
+caps the recipients queued in one payload: a SendGrid request is accepted or
+rejected as a whole, but SMTP sends one message per recipient, so there every
+recipient gets its own outbox row and a retry re-mails at most that one.
+"""
+import base64
+import json
+import os
+import smtplib
+import time
+import uuid
+from email.message import EmailMessage
+from email.utils import formataddr
+
+from utils.http_clients import sendgrid_session, SENDGRID_TIMEOUT
+
+SENDGRID_URL = "https://api.sendgrid.com/v3/mail/send"
+SENDGRID_MAX_PERSONALIZATIONS = 1000
+EMAIL_TRANSPORT = os.environ.get("EMAIL_TRANSPORT", "sendgrid")
+EMAIL_FILE_SINK_DIR = os.environ.get(
+    "EMAIL_FILE_SINK_DIR", os.path.join(os.environ.get("QR_CHECKIN_DB_PATH", "/tmp/data"), "outbox_mail")
+)
+
+
+class SendGridTransport:
+    name = "sendgrid"
+    label = "SendGrid"
+    max_personalizations = SENDGRID_MAX_PERSONALIZATIONS
+
+    def configured(self):
+        return bool(os.environ.get("SENDGRID_API_KEY"))
+
+    def send(self, payload):
+        import requests
+
+        sendgrid_api_key = os.environ.get("SENDGRID_API_KEY")
+        if not sendgrid_api_key:
+            return False, True, "SendGrid API key not configured"
+        try:
+            response = sendgrid_session.post(
+                SENDGRID_URL,
+                headers={
+                    "Authorization": f"Bearer {sendgrid_api_key}",
+                    "Content-Type": "application/json"
+                },
+                json=payload,
+                timeout=SENDGRID_TIMEOUT
+            )
+        except requests.RequestException as e:
+            return False, True, f"Error sending email: {str(e)}"
+        if response.status_code in [200, 201, 202]:
+            return True, False, f"SendGrid status {response.status_code}"
+        # 4xx other than throttling means the payload itself is bad; retrying will not help
+        retryable = response.status_code == 429 or response.status_code >= 500
+        return False, retryable, f"SendGrid returned status code: {response.status_code} - {response.text}"
+
+
+def _address(entry):
+    return formataddr((entry.get("name") or "", entry["email"]))
+
+
+def _substitute(value, substitutions):
+    for key, replacement in (substitutions or {}).items():
+        value = value.replace(key, replacement)
+    return value
+
+
+def payload_to_mime(payload):
+    """Yield one MIME message per personalization in a SendGrid payload, applying substitutions"""
+    for personalization in payload["personalizations"]:
+        substitutions = personalization.get("substitutions")
+        message = EmailMessage()
+        message["From"] = _address(payload["from"])
+        message["To"] = ", ".join(_address(entry) for entry in personalization["to"])
+        message["Subject"] = _substitute(personalization.get("subject") or payload.get("subject", ""), substitutions)
+        bodies = {part["type"]: _substitute(part["value"], substitutions) for part in payload["content"]}
+        message.set_content(bodies.get("text/plain", ""))
+        if "text/html" in bodies:
+            if "text/plain" in bodies:
+                message.add_alternative(bodies["text/html"], subtype="html")
+            else:
+                message.set_content(bodies["text/html"], subtype="html")
+        for attachment in payload.get("attachments", []):
+            maintype, _, subtype = attachment.get("type", "application/octet-stream").partition("/")
+            message.add_attachment(
+                base64.b64decode(attachment["content"]),
+                maintype=maintype,
+                subtype=subtype,
+                filename=attachment.get("filename"),
+                disposition=attachment.get("disposition", "attachment"),
+                cid=f"<{attachment['content_id']}>" if attachment.get("content_id") else None
+            )
+        yield message
+
+
+class SmtpTransport:
+    name = "smtp"
+    label = "SMTP"
+    # Each personalization is a separate SMTP message; a failure partway through would
+    # resend the whole payload, so bulk mail is queued one recipient per row
+    max_personalizations = 1
+
+    def configured(self):
+        return bool(os.environ.get("SMTP_HOST"))
+
+    def send(self, payload):
+        host = os.environ.get("SMTP_HOST")
+        if not host:
+            return False, True, "SMTP_HOST not configured"
+        port = int(os.environ.get("SMTP_PORT", "587"))
+        try:
+            with smtplib.SMTP(host, port, timeout=SENDGRID_TIMEOUT[1]) as smtp:
+                if os.environ.get("SMTP_STARTTLS", "1") == "1":
+                    smtp.starttls()
+                if os.environ.get("SMTP_USERNAME"):
+                    smtp.login(os.environ["SMTP_USERNAME"], os.environ.get("SMTP_PASSWORD", ""))
+                sent = 0
+                for message in payload_to_mime(payload):
+                    smtp.send_message(message)
+                    sent += 1
+        except smtplib.SMTPResponseException as e:
+            # 4xx replies are temporary, 5xx are permanent
+            return False, 400 <= e.smtp_code < 500, f"SMTP error {e.smtp_code}: {e.smtp_error!r}"
+        except (smtplib.SMTPException, OSError) as e:
+            return False, True, f"Error sending email: {str(e)}"
+        return True, False, f"SMTP accepted {sent} message(s)"
+
+
+class FileSinkTransport:
+    name = "file"
+    label = "local file sink"
+    max_personalizations = SENDGRID_MAX_PERSONALIZATIONS
+
+    def configured(self):
+        return True
+
+    def send(self, payload):
+        os.makedirs(EMAIL_FILE_SINK_DIR, exist_ok=True)
+        path = os.path.join(EMAIL_FILE_SINK_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}.json")
+        with open(path, "w") as f:
+            json.dump(payload, f, indent=2)
+        return True, False, f"Written to {path}"
+
+
+TRANSPORTS = {
+    "sendgrid": SendGridTransport,
+    "smtp": SmtpTransport,
+    "file": FileSinkTransport,
+}
+
+_transport = {"instance": None}
+
+
+def get_transport():
+    """The transport selected by EMAIL_TRANSPORT (created once per process)"""
+    if _transport["instance"] is None:
+        transport_class = TRANSPORTS.get(EMAIL_TRANSPORT)
+        if transport_class is None:
+            raise ValueError(f"Unknown EMAIL_TRANSPORT {EMAIL_TRANSPORT!r}; expected one of {sorted(TRANSPORTS)}")
+        _transport["instance"] = transport_class()
+    return _transport["instance"]
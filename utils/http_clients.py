@@ -0,0 +1,66 @@
+"""
+Shared keep-alive HTTP clients for SendGrid and QuickBooks
+One requests.Session per upstream keeps TCP+TLS connections open between calls
+instead of paying a handshake per email or invoice. Retries at this layer only
+cover failures to connect (always safe to repeat) and, for GET requests,
+transient 5xx responses; delivery-level retries belong to the callers.
+
+requests/urllib3 are imported when a session is first used, not at app startup.
+Calls are timed per service for /metrics (see utils/metrics.py).
+"""
+import os
+from threading import Lock
+
+HTTP_POOL_MAXSIZE = int(os.environ.get("HTTP_POOL_MAXSIZE", "10"))
+HTTP_CONNECT_TIMEOUT = float(os.environ.get("HTTP_CONNECT_TIMEOUT", "3.05"))
+SENDGRID_READ_TIMEOUT = float(os.environ.get("SENDGRID_READ_TIMEOUT", "10"))
+QB_READ_TIMEOUT = float(os.environ.get("QB_READ_TIMEOUT", "30"))
+
+# (connect, read) tuples for requests' timeout argument
+SENDGRID_TIMEOUT = (HTTP_CONNECT_TIMEOUT, SENDGRID_READ_TIMEOUT)
+QB_TIMEOUT = (HTTP_CONNECT_TIMEOUT, QB_READ_TIMEOUT)
+
+
+def build_session(pool_maxsize=HTTP_POOL_MAXSIZE, connect_retries=3):
+    """Return a Session with a pooled HTTPS adapter and a conservative retry policy"""
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+
+    retry = Retry(
+        total=connect_retries,
+        connect=connect_retries,
+        read=0,
+        status=2,
+        status_forcelist=(502, 503, 504),
+        allowed_methods=frozenset({"GET"}),
+        backoff_factor=0.3,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_maxsize, max_retries=retry)
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+class LazySession:
+    """Stands in for a Session and builds it on first attribute access"""
+
+    def __init__(self, service, **options):
+        self._service = service
+        self._options = options
+        self._session = None
+        self._lock = Lock()
+
+    def __getattr__(self, name):
+        if self._session is None:
+            with self._lock:
+                if self._session is None:
+                    from utils.metrics import instrument_session
+                    self._session = instrument_session(build_session(**self._options), self._service)
+        return getattr(self._session, name)
+
+
+sendgrid_session = LazySession("sendgrid")
+quickbooks_session = LazySession("quickbooks")
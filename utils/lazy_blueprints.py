@@ -0,0 +1,40 @@
+"""
+Load rarely used blueprint groups on their first request
+Flask needs every route registered before the app serves its first request, so
+rarely used groups (QuickBooks, email) are instead served by small sub-apps
+built on demand: LazyPrefixDispatcher sits in front of the main app's WSGI
+callable and, the first time a path under a mounted prefix arrives, calls that
+prefix's factory to import the blueprints (and their dependencies) and build
+the sub-app. Worker boot only pays for check-ins, customers and sessions.
+Sub-apps get the same config as the main app and share its database engine and
+connection pool (see db.SharedEngineSQLAlchemy).
+"""
+from threading import Lock
+
+
+class LazyPrefixDispatcher:
+    def __init__(self, app, mounts):
+        """app is the main WSGI callable; mounts maps a URL prefix to a factory returning a WSGI app"""
+        self.app = app
+        self.mounts = mounts
+        self._loaded = {}
+        self._lock = Lock()
+
+    def _mounted_app(self, prefix):
+        mounted = self._loaded.get(prefix)
+        if mounted is None:
+            with self._lock:
+                mounted = self._loaded.get(prefix)
+                if mounted is None:
+                    mounted = self._loaded[prefix] = self.mounts[prefix]()
+        return mounted
+
+    def __call__(self, environ, start_response):
+        path = environ.get("PATH_INFO", "")
+        for prefix in self.mounts:
+            if path == prefix or path.startswith(prefix + "/"):
+                return self._mounted_app(prefix)(environ, start_response)
+        return self.app(environ, start_response)
+
+    def loaded_prefixes(self):
+        return sorted(self._loaded)
@@ -0,0 +1,159 @@
+"""
+In-process lookup caches for the check-in hot path
+Maps qrCodeData to customer display fields and keeps the small SessionType
+table in memory, so a scan does not need extra round trips before the insert.
+Invalidations touch an epoch file next to the database; every worker checks its
+mtime (one stat call, no query) and drops its QR entries when it changes.
+"""
+import os
+import time
+from collections import OrderedDict
+from threading import Lock
+
+from db import db
+from models.models import Customer, SessionType
+
+QR_CACHE_MAX_ENTRIES = int(os.environ.get("QR_CACHE_MAX_ENTRIES", "5000"))
+QR_CACHE_TTL_SECONDS = float(os.environ.get("QR_CACHE_TTL_SECONDS", "60"))
+SESSION_TYPE_CACHE_TTL_SECONDS = float(os.environ.get("SESSION_TYPE_CACHE_TTL_SECONDS", "300"))
+QR_CACHE_EPOCH_FILE = os.path.join(os.environ.get("QR_CHECKIN_DB_PATH", "/tmp/data"), "qr_cache.epoch")
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries expire after ttl seconds"""
+
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+qr_cache = TTLCache(QR_CACHE_MAX_ENTRIES, QR_CACHE_TTL_SECONDS)
+_session_types = {"by_id": None, "expires_at": 0.0}
+_session_types_lock = Lock()
+_qr_cache_epoch = {"mtime": None}
+
+
+def _read_epoch():
+    try:
+        return os.stat(QR_CACHE_EPOCH_FILE).st_mtime_ns
+    except OSError:
+        return None
+
+
+def _check_epoch():
+    """Clear the QR cache if another worker has invalidated entries since the last check"""
+    current = _read_epoch()
+    if current != _qr_cache_epoch["mtime"]:
+        qr_cache.clear()
+        _qr_cache_epoch["mtime"] = current
+
+
+def _bump_epoch():
+    try:
+        with open(QR_CACHE_EPOCH_FILE, "a"):
+            pass
+        os.utime(QR_CACHE_EPOCH_FILE, None)
+    except OSError as e:
+        print(f"[CACHE] Could not update QR cache epoch file: {e}")
+
+
+def customer_to_cache_entry(customer):
+    """Return the display fields cached for a customer"""
+    return {
+        "id": customer.id,
+        "firstName": customer.firstName,
+        "lastName": customer.lastName,
+        "email": customer.email,
+        "qrCodeData": customer.qrCodeData
+    }
+
+
+def resolve_customer_by_qr(qr_code_data, customer_id=None):
+    """
+    Return cached customer fields for a QR value, or None if no customer matches
+    Pass customer_id for a verified signed payload (utils.qr_payload) to look the
+    customer up by primary key; the code must still be their stored qrCodeData,
+    so a reissued or replaced code stops resolving.
+    """
+    _check_epoch()
+    entry = qr_cache.get(qr_code_data)
+    if entry is not None:
+        return entry
+    if customer_id is not None:
+        customer = db.session.get(Customer, customer_id)
+        if customer is not None and customer.qrCodeData != qr_code_data:
+            return None
+    else:
+        customer = Customer.query.filter_by(qrCodeData=qr_code_data).first()
+    if not customer:
+        return None
+    entry = customer_to_cache_entry(customer)
+    qr_cache.set(qr_code_data, entry)
+    return entry
+
+
+def invalidate_qr(*qr_values):
+    """Drop cached entries for the given QR values in this and every other worker"""
+    for qr_value in qr_values:
+        if qr_value:
+            qr_cache.delete(qr_value)
+    _bump_epoch()
+
+
+def get_session_types():
+    """Return all session types as a dict of id -> fields, reloading after the TTL"""
+    with _session_types_lock:
+        if _session_types["by_id"] is None or _session_types["expires_at"] < time.monotonic():
+            _session_types["by_id"] = {
+                st.id: {
+                    "id": st.id,
+                    "name": st.name,
+                    "duration_minutes": st.duration_minutes,
+                    "price": st.price,
+                }
+                for st in SessionType.query.all()
+            }
+            _session_types["expires_at"] = time.monotonic() + SESSION_TYPE_CACHE_TTL_SECONDS
+        return _session_types["by_id"]
+
+
+def get_session_type(session_type_id):
+    """Return cached fields for one session type, or None if it does not exist"""
+    try:
+        return get_session_types().get(int(session_type_id))
+    except (TypeError, ValueError):
+        return None
+
+
+def invalidate_session_types():
+    with _session_types_lock:
+        _session_types["by_id"] = None
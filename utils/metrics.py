@@ -0,0 +1,385 @@
+"""
+Request latency, SQL and outbound call metrics in Prometheus text format
+MetricsMiddleware wraps the outermost WSGI app (so lazily mounted QuickBooks and
+email sub-apps are covered) and times each request until its body has been
+sent, which matters for the streamed exports. SQL statements are timed with
+SQLAlchemy cursor events on every engine and attributed to the request running
+on the same thread, or to "background" for the outbox dispatcher and sync
+workers. The shared SendGrid/QuickBooks sessions time each outbound call.
+
+Each gunicorn worker keeps its own numbers and writes a snapshot to
+METRICS_DIR every METRICS_FLUSH_SECONDS; /metrics merges the snapshots of all
+live workers so a scrape does not depend on which worker answers it.
+
+With SLOW_REQUEST_MS set, requests slower than that are logged along with the
+SQL they ran.
+"""
+import json
+import os
+import time
+from threading import Lock, Thread, local
+
+from werkzeug.wsgi import ClosingIterator
+
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "1").lower() not in ("0", "false", "no")
+METRICS_DIR = os.environ.get(
+    "METRICS_DIR", os.path.join(os.environ.get("QR_CHECKIN_DB_PATH", "/tmp/data"), "metrics")
+)
+METRICS_FLUSH_SECONDS = float(os.environ.get("METRICS_FLUSH_SECONDS", "5"))
+SLOW_REQUEST_MS = float(os.environ.get("SLOW_REQUEST_MS", "0"))
+SLOW_REQUEST_MAX_STATEMENTS = int(os.environ.get("SLOW_REQUEST_MAX_STATEMENTS", "25"))
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+SQL_LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1)
+
+# Route label for requests that matched no rule, so 404 probes cannot add label values
+UNMATCHED_ENDPOINT = "unmatched"
+ENDPOINT_ENVIRON_KEY = "qrcheckin.metrics_endpoint"
+
+
+class Histogram:
+    def __init__(self, name, help_text, label_names, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        self._series = {}
+        self._lock = Lock()
+
+    def observe(self, value, *label_values):
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series["buckets"][i] += 1
+                    break
+            series["sum"] += value
+            series["count"] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return [
+                {"labels": list(labels), "buckets": list(s["buckets"]), "sum": s["sum"], "count": s["count"]}
+                for labels, s in self._series.items()
+            ]
+
+
+class Counter:
+    def __init__(self, name, help_text, label_names):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self._series = {}
+        self._lock = Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._series[label_values] = self._series.get(label_values, 0) + amount
+
+    def snapshot(self):
+        with self._lock:
+            return [{"labels": list(labels), "value": value} for labels, value in self._series.items()]
+
+
+REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds", "Request latency by route, including streaming the body",
+    ("method", "endpoint", "status"), LATENCY_BUCKETS
+)
+REQUEST_QUERIES = Histogram(
+    "http_request_sql_queries", "SQL statements issued per request",
+    ("method", "endpoint"), QUERY_COUNT_BUCKETS
+)
+SQL_DURATION = Histogram(
+    "sql_query_duration_seconds", "SQL statement execution time by route (or background)",
+    ("endpoint",), SQL_LATENCY_BUCKETS
+)
+OUTBOUND_DURATION = Histogram(
+    "outbound_request_duration_seconds", "SendGrid and QuickBooks HTTP call latency",
+    ("service", "method", "status"), LATENCY_BUCKETS
+)
+SLOW_REQUESTS = Counter(
+    "http_slow_requests_total", "Requests slower than SLOW_REQUEST_MS", ("method", "endpoint")
+)
+
+METRICS = (REQUEST_DURATION, REQUEST_QUERIES, SQL_DURATION, OUTBOUND_DURATION, SLOW_REQUESTS)
+
+_current = local()
+
+
+class _RequestStats:
+    __slots__ = ("endpoint", "queries", "statements")
+
+    def __init__(self):
+        self.endpoint = UNMATCHED_ENDPOINT
+        self.queries = 0
+        self.statements = [] if SLOW_REQUEST_MS > 0 else None
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._metrics_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, "_metrics_started", None)
+    if started is None:
+        return
+    elapsed = time.perf_counter() - started
+    stats = getattr(_current, "stats", None)
+    if stats is None:
+        SQL_DURATION.observe(elapsed, "background")
+        return
+    stats.queries += 1
+    SQL_DURATION.observe(elapsed, stats.endpoint)
+    if stats.statements is not None and len(stats.statements) < SLOW_REQUEST_MAX_STATEMENTS:
+        stats.statements.append((elapsed, " ".join(statement.split())[:300]))
+
+
+_sql_listeners = {"installed": False}
+_sql_listeners_lock = Lock()
+
+
+def instrument_sql():
+    """Time statements on every SQLAlchemy engine in this process (idempotent)"""
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+
+    with _sql_listeners_lock:
+        if _sql_listeners["installed"]:
+            return
+        event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+        _sql_listeners["installed"] = True
+
+
+def instrument_app(flask_app):
+    """Label requests handled by this Flask app with their URL rule"""
+    if not METRICS_ENABLED:
+        return
+
+    from flask import request
+
+    @flask_app.before_request
+    def _record_endpoint():
+        if request.url_rule is not None:
+            request.environ[ENDPOINT_ENVIRON_KEY] = request.url_rule.rule
+            stats = getattr(_current, "stats", None)
+            if stats is not None:
+                stats.endpoint = request.url_rule.rule
+
+
+def instrument_session(session, service):
+    """Time every call made through a requests.Session"""
+    if not METRICS_ENABLED:
+        return session
+    send = session.request
+
+    def timed_request(method, url, *args, **kwargs):
+        started = time.perf_counter()
+        status = "error"
+        try:
+            response = send(method, url, *args, **kwargs)
+            status = str(response.status_code)
+            return response
+        finally:
+            OUTBOUND_DURATION.observe(time.perf_counter() - started, service, method.upper(), status)
+
+    session.request = timed_request
+    return session
+
+
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    def __call__(self, environ, start_response):
+        stats = _RequestStats()
+        _current.stats = stats
+        started = time.perf_counter()
+        status = {"code": "500"}
+
+        def recording_start_response(status_line, headers, exc_info=None):
+            status["code"] = status_line.split(" ", 1)[0]
+            return start_response(status_line, headers, exc_info)
+
+        def finish():
+            _current.stats = None
+            elapsed = time.perf_counter() - started
+            method = environ.get("REQUEST_METHOD", "GET")
+            endpoint = environ.get(ENDPOINT_ENVIRON_KEY, UNMATCHED_ENDPOINT)
+            REQUEST_DURATION.observe(elapsed, method, endpoint, status["code"])
+            REQUEST_QUERIES.observe(stats.queries, method, endpoint)
+            if SLOW_REQUEST_MS > 0 and elapsed * 1000 >= SLOW_REQUEST_MS:
+                SLOW_REQUESTS.inc(method, endpoint)
+                _log_slow_request(environ, status["code"], elapsed, stats)
+
+        try:
+            body = self.app(environ, recording_start_response)
+        except Exception:
+            finish()
+            raise
+        return ClosingIterator(body, [finish])
+
+
+def _log_slow_request(environ, status, elapsed, stats):
+    path = environ.get("PATH_INFO", "")
+    if environ.get("QUERY_STRING"):
+        path = f"{path}?{environ['QUERY_STRING']}"
+    print(f"[METRICS] Slow request {environ.get('REQUEST_METHOD')} {path} -> {status} "
+          f"in {elapsed * 1000:.0f} ms, {stats.queries} SQL statements")
+    for statement_elapsed, statement in stats.statements or []:
+        print(f"[METRICS]   {statement_elapsed * 1000:8.2f} ms  {statement}")
+    if stats.statements is not None and stats.queries > len(stats.statements):
+        print(f"[METRICS]   ... {stats.queries - len(stats.statements)} more")
+
+
+# Cross-worker snapshots
+
+def _snapshot_path(pid):
+    return os.path.join(METRICS_DIR, f"worker-{pid}.json")
+
+
+def snapshot():
+    return {metric.name: metric.snapshot() for metric in METRICS}
+
+
+def flush_snapshot():
+    """Write this worker's metrics where /metrics in any worker can read them"""
+    os.makedirs(METRICS_DIR, exist_ok=True)
+    path = _snapshot_path(os.getpid())
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(snapshot(), f)
+    os.replace(tmp_path, path)
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _worker_snapshots():
+    own_pid = os.getpid()
+    yield snapshot()
+    try:
+        names = os.listdir(METRICS_DIR)
+    except FileNotFoundError:
+        return
+    for name in names:
+        if not (name.startswith("worker-") and name.endswith(".json")):
+            continue
+        try:
+            pid = int(name[len("worker-"):-len(".json")])
+        except ValueError:
+            continue
+        if pid == own_pid:
+            continue
+        path = os.path.join(METRICS_DIR, name)
+        if not _pid_alive(pid):
+            # Worker exited; its counters leave with it, which Prometheus treats as a reset
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            continue
+        try:
+            with open(path) as f:
+                yield json.load(f)
+        except (OSError, ValueError):
+            continue
+
+
+def _merge(snapshots):
+    merged = {metric.name: {} for metric in METRICS}
+    for worker in snapshots:
+        for name, series_list in worker.items():
+            if name not in merged:
+                continue
+            for series in series_list:
+                key = tuple(series["labels"])
+                total = merged[name].get(key)
+                if total is None:
+                    merged[name][key] = {k: (list(v) if isinstance(v, list) else v) for k, v in series.items()}
+                elif "value" in series:
+                    total["value"] += series["value"]
+                else:
+                    total["buckets"] = [a + b for a, b in zip(total["buckets"], series["buckets"])]
+                    total["sum"] += series["sum"]
+                    total["count"] += series["count"]
+    return merged
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_bound(bound):
+    return repr(float(bound))
+
+
+def render_prometheus():
+    """All workers' metrics in the Prometheus text exposition format"""
+    merged = _merge(_worker_snapshots())
+    lines = []
+    for metric in METRICS:
+        series = merged[metric.name]
+        is_histogram = isinstance(metric, Histogram)
+        lines.append(f"# HELP {metric.name} {metric.help_text}")
+        lines.append(f"# TYPE {metric.name} {'histogram' if is_histogram else 'counter'}")
+        for labels in sorted(series):
+            values = series[labels]
+            if not is_histogram:
+                lines.append(f"{metric.name}{_labels(metric.label_names, labels)} {values['value']}")
+                continue
+            cumulative = 0
+            for bound, count in zip(metric.buckets, values["buckets"]):
+                cumulative += count
+                le = f'le="{_format_bound(bound)}"'
+                lines.append(f"{metric.name}_bucket{_labels(metric.label_names, labels, le)} {cumulative}")
+            inf = 'le="+Inf"'
+            lines.append(f"{metric.name}_bucket{_labels(metric.label_names, labels, inf)} {values['count']}")
+            lines.append(f"{metric.name}_sum{_labels(metric.label_names, labels)} {values['sum']:.6f}")
+            lines.append(f"{metric.name}_count{_labels(metric.label_names, labels)} {values['count']}")
+    return "\n".join(lines) + "\n"
+
+
+_flusher = {"thread": None, "pid": None}
+_flusher_lock = Lock()
+
+
+def _flush_forever():
+    while True:
+        time.sleep(METRICS_FLUSH_SECONDS)
+        try:
+            flush_snapshot()
+        except OSError as e:
+            print(f"[METRICS] Could not write snapshot: {e}")
+
+
+def start_metrics_flusher():
+    """Start the snapshot writer thread once per process"""
+    if not METRICS_ENABLED:
+        return None
+    with _flusher_lock:
+        thread = _flusher["thread"]
+        if thread is None or not thread.is_alive() or _flusher["pid"] != os.getpid():
+            thread = Thread(target=_flush_forever, name="metrics-flusher", daemon=True)
+            thread.start()
+            _flusher["thread"] = thread
+            _flusher["pid"] = os.getpid()
+        return thread
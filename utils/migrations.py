@@ -0,0 +1,118 @@
+"""
+Versioned schema migrations
+db.create_all() only creates missing tables; it never alters existing ones.
+Changes to tables that already exist in deployed databases go here as numbered
+steps. Applied versions are recorded in the schema_migrations table, and every
+step must be safe to re-run (IF NOT EXISTS etc.) because several workers may
+start at once.
+"""
+from datetime import datetime
+
+from sqlalchemy import text
+
+
+def _add_checkin_indexes(connection):
+    connection.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_check_in_customer_time "
+        "ON check_in (customer_id, check_in_time)"
+    ))
+    connection.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_check_in_session_type_time "
+        "ON check_in (session_type_id, check_in_time)"
+    ))
+    connection.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_check_in_check_in_time "
+        "ON check_in (check_in_time)"
+    ))
+    connection.execute(text("ANALYZE check_in"))
+
+
+def _backfill_billing_rollups(connection):
+    # create_all() has created the table; fill it from check-ins recorded before it existed
+    from utils.billing_rollups import rebuild_rollups
+    rebuild_rollups(connection)
+
+
+# Phone digits only, so "5550123" finds "555-0123" and "(555) 012 3"
+_PHONE_DIGITS_SQL = (
+    "replace(replace(replace(replace(replace(replace(coalesce({row}.phone, ''), "
+    "'-', ''), ' ', ''), '(', ''), ')', ''), '.', ''), '+', '')"
+)
+_CUSTOMER_SEARCH_VALUES_SQL = (
+    "{row}.id, {row}.\"firstName\" || ' ' || {row}.\"lastName\", {row}.email, "
+    "coalesce({row}.phone, '') || ' ' || " + _PHONE_DIGITS_SQL
+)
+
+
+def _add_customer_search(connection):
+    # Full-text index over customer name, email and phone (utils/customer_search.py);
+    # rowid is customer.id, prefix indexes keep typeahead queries on 1-3 characters fast
+    connection.execute(text(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS customer_search USING fts5("
+        "name, email, phone, tokenize = 'unicode61 remove_diacritics 2', prefix = '1 2 3')"
+    ))
+    connection.execute(text(
+        "CREATE TRIGGER IF NOT EXISTS customer_search_insert AFTER INSERT ON customer BEGIN "
+        "INSERT INTO customer_search (rowid, name, email, phone) VALUES ("
+        + _CUSTOMER_SEARCH_VALUES_SQL.format(row="new") + "); END"
+    ))
+    connection.execute(text(
+        "CREATE TRIGGER IF NOT EXISTS customer_search_update "
+        "AFTER UPDATE OF \"firstName\", \"lastName\", email, phone ON customer BEGIN "
+        "DELETE FROM customer_search WHERE rowid = old.id; "
+        "INSERT INTO customer_search (rowid, name, email, phone) VALUES ("
+        + _CUSTOMER_SEARCH_VALUES_SQL.format(row="new") + "); END"
+    ))
+    connection.execute(text(
+        "CREATE TRIGGER IF NOT EXISTS customer_search_delete AFTER DELETE ON customer BEGIN "
+        "DELETE FROM customer_search WHERE rowid = old.id; END"
+    ))
+    connection.execute(text("DELETE FROM customer_search"))
+    connection.execute(text(
+        "INSERT INTO customer_search (rowid, name, email, phone) SELECT "
+        + _CUSTOMER_SEARCH_VALUES_SQL.format(row="customer") + " FROM customer"
+    ))
+
+
+# (version, description, function taking a connection inside a transaction)
+MIGRATIONS = [
+    (1, "Add indexes on check-in customer, session type and time columns", _add_checkin_indexes),
+    (2, "Backfill daily and monthly billing rollups from existing check-ins", _backfill_billing_rollups),
+    (3, "Add full-text customer search index kept in sync by triggers", _add_customer_search),
+]
+
+
+def _ensure_migrations_table(connection):
+    connection.execute(text(
+        "CREATE TABLE IF NOT EXISTS schema_migrations ("
+        "version INTEGER PRIMARY KEY, "
+        "description VARCHAR(200) NOT NULL, "
+        "applied_at DATETIME NOT NULL)"
+    ))
+
+
+def applied_versions(engine):
+    with engine.begin() as connection:
+        _ensure_migrations_table(connection)
+        return {row[0] for row in connection.execute(text("SELECT version FROM schema_migrations"))}
+
+
+def run_migrations(engine):
+    """Apply pending migrations in order, one transaction per step; returns applied versions"""
+    done = applied_versions(engine)
+    newly_applied = []
+    for version, description, migrate in MIGRATIONS:
+        if version in done:
+            continue
+        with engine.begin() as connection:
+            migrate(connection)
+            connection.execute(
+                text(
+                    "INSERT OR IGNORE INTO schema_migrations (version, description, applied_at) "
+                    "VALUES (:version, :description, :applied_at)"
+                ),
+                {"version": version, "description": description, "applied_at": datetime.utcnow()}
+            )
+        print(f"Applied migration {version}: {description}")
+        newly_applied.append(version)
+    return newly_applied
@@ -0,0 +1,186 @@
+"""
+Rate-limit-aware scheduler for QuickBooks Online API calls
+QuickBooks throttles each realm (company) separately: roughly 500 requests per
+minute, 40 batch requests per minute and 10 concurrent requests. Every QBO call
+goes through qbo_scheduler.request(), which per realm:
+
+- caps concurrent requests with a semaphore
+- paces requests with token buckets (one for all calls, one for /batch)
+- on HTTP 429, pauses the whole realm for Retry-After (or an exponential
+  backoff with jitter when the header is missing) and retries the call
+
+Limits are per process. With several gunicorn workers calling QuickBooks at the
+same time, divide the per-minute limits by the worker count.
+"""
+import os
+import random
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from threading import Lock, Semaphore
+
+# Defaults stay just under Intuit's limits: rate + burst never exceeds them in any minute
+QB_RATE_LIMIT_PER_MINUTE = float(os.environ.get("QB_RATE_LIMIT_PER_MINUTE", "490"))
+QB_RATE_LIMIT_BURST = int(os.environ.get("QB_RATE_LIMIT_BURST", "10"))
+QB_BATCH_RATE_LIMIT_PER_MINUTE = float(os.environ.get("QB_BATCH_RATE_LIMIT_PER_MINUTE", "39"))
+QB_BATCH_RATE_LIMIT_BURST = int(os.environ.get("QB_BATCH_RATE_LIMIT_BURST", "1"))
+QB_MAX_CONCURRENT_REQUESTS = int(os.environ.get("QB_MAX_CONCURRENT_REQUESTS", "10"))
+QB_THROTTLE_MAX_RETRIES = int(os.environ.get("QB_THROTTLE_MAX_RETRIES", "4"))
+QB_THROTTLE_BACKOFF_SECONDS = float(os.environ.get("QB_THROTTLE_BACKOFF_SECONDS", "2"))
+QB_THROTTLE_MAX_BACKOFF_SECONDS = float(os.environ.get("QB_THROTTLE_MAX_BACKOFF_SECONDS", "60"))
+
+
+class TokenBucket:
+    """Refills at rate_per_minute, holding at most burst tokens; callers hold the realm lock"""
+
+    def __init__(self, rate_per_minute, burst):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated_at = time.monotonic()
+
+    def refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def seconds_until_token(self):
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+
+class RealmLimiter:
+    def __init__(self):
+        self._lock = Lock()
+        self._semaphore = Semaphore(QB_MAX_CONCURRENT_REQUESTS)
+        self.requests = TokenBucket(QB_RATE_LIMIT_PER_MINUTE, QB_RATE_LIMIT_BURST)
+        self.batches = TokenBucket(QB_BATCH_RATE_LIMIT_PER_MINUTE, QB_BATCH_RATE_LIMIT_BURST)
+        self.paused_until = 0.0
+        self.waiting = 0
+        self.in_flight = 0
+        self.sent = 0
+        self.throttled = 0
+
+    def _take_tokens(self, buckets):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                wait = self.paused_until - now
+                if wait <= 0:
+                    for bucket in buckets:
+                        bucket.refill(now)
+                    wait = max(bucket.seconds_until_token() for bucket in buckets)
+                    if wait <= 0:
+                        for bucket in buckets:
+                            bucket.tokens -= 1
+                        return
+            time.sleep(wait)
+
+    @contextmanager
+    def slot(self, batch=False):
+        """Wait for a concurrency slot and a rate token, then hold the slot while sending"""
+        buckets = [self.requests, self.batches] if batch else [self.requests]
+        with self._lock:
+            self.waiting += 1
+        try:
+            self._semaphore.acquire()
+            try:
+                self._take_tokens(buckets)
+            except BaseException:
+                self._semaphore.release()
+                raise
+        finally:
+            with self._lock:
+                self.waiting -= 1
+        with self._lock:
+            self.in_flight += 1
+            self.sent += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+            self._semaphore.release()
+
+    def pause(self, seconds):
+        """Hold back every caller for this realm, e.g. after a 429"""
+        with self._lock:
+            self.throttled += 1
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+            # Do not burst the moment the pause ends
+            self.requests.tokens = min(self.requests.tokens, 0)
+            self.batches.tokens = min(self.batches.tokens, 0)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "queued": self.waiting,
+                "in_flight": self.in_flight,
+                "sent": self.sent,
+                "throttled": self.throttled,
+                "paused_for_seconds": round(max(0.0, self.paused_until - time.monotonic()), 2)
+            }
+
+
+def retry_after_seconds(response):
+    """Seconds from a Retry-After header (delta-seconds or HTTP date), or None"""
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+def throttle_delay(attempt, response):
+    """Retry-After when given, else exponential backoff; always with some jitter"""
+    ceiling = min(QB_THROTTLE_MAX_BACKOFF_SECONDS, QB_THROTTLE_BACKOFF_SECONDS * (2 ** (attempt - 1)))
+    retry_after = retry_after_seconds(response)
+    if retry_after is not None:
+        # Spread callers out so they do not all retry in the same instant
+        return retry_after + random.uniform(0, min(1.0, ceiling / 2))
+    return random.uniform(ceiling / 2, ceiling)
+
+
+class QuickBooksScheduler:
+    def __init__(self):
+        self._limiters = {}
+        self._lock = Lock()
+
+    def _limiter(self, realm_id):
+        with self._lock:
+            limiter = self._limiters.get(realm_id)
+            if limiter is None:
+                limiter = self._limiters[realm_id] = RealmLimiter()
+            return limiter
+
+    def request(self, realm_id, send, batch=False):
+        """
+        Run send() (which performs one HTTP call and returns the Response) under
+        the realm's limits, retrying on 429. Returns the last Response.
+        """
+        limiter = self._limiter(str(realm_id))
+        attempt = 0
+        while True:
+            with limiter.slot(batch=batch):
+                response = send()
+            if response.status_code != 429 or attempt >= QB_THROTTLE_MAX_RETRIES:
+                return response
+            attempt += 1
+            delay = throttle_delay(attempt, response)
+            limiter.pause(delay)
+            print(f"[QB] Throttled for realm {realm_id}; retry {attempt} in {delay:.1f}s "
+                  f"({limiter.stats()['queued']} queued)")
+
+    def stats(self):
+        """Queue depth, in-flight requests and throttle counts per realm"""
+        with self._lock:
+            limiters = dict(self._limiters)
+        return {realm_id: limiter.stats() for realm_id, limiter in limiters.items()}
+
+
+qbo_scheduler = QuickBooksScheduler()
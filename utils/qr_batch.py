@@ -0,0 +1,219 @@
+"""
+Batch QR code rendering for term-start onboarding
+PNG encoding is CPU-bound and holds the GIL, so cache misses are rendered in a
+ProcessPoolExecutor. Results are streamed into a ZIP archive as each image
+completes, or laid out on a multi-page printable PDF sheet that is also
+written page by page.
+"""
+import io
+import multiprocessing
+import os
+import re
+import zipfile
+import zlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from threading import Lock
+
+from utils.qr_render import render_cache, render_key, render_uncached, DEFAULT_BORDER
+
+QR_BATCH_WORKERS = int(os.environ.get("QR_BATCH_WORKERS", str(os.cpu_count() or 2)))
+
+# Letter paper at 300 dpi, 3 x 4 labels per page
+SHEET_DPI = 300
+SHEET_SIZE = (2550, 3300)
+SHEET_COLUMNS = 3
+SHEET_ROWS = 4
+SHEET_MARGIN = 75
+SHEET_QR_PIXELS = 600
+SHEET_LABEL_HEIGHT = 60
+
+_pool = None
+_pool_lock = Lock()
+
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # Forking a threaded gthread worker can deadlock on locks held by other threads;
+            # forkserver children start from a clean single-threaded server process
+            context = multiprocessing.get_context("forkserver")
+            # The default preload is __main__, which under "python main.py" would build a whole app
+            context.set_forkserver_preload(["utils.qr_render"])
+            _pool = ProcessPoolExecutor(max_workers=QR_BATCH_WORKERS, mp_context=context)
+        return _pool
+
+
+def _render_task(job):
+    customer_id, data, box_size = job
+    return customer_id, render_uncached(data, box_size, DEFAULT_BORDER, "png")
+
+
+def render_batch(jobs):
+    """
+    Yield (customer_id, png_bytes) for jobs of (customer_id, data, box_size)
+    Cached images are yielded immediately; misses are rendered across the
+    process pool and yielded in completion order.
+    """
+    misses = []
+    keys = {}
+    for customer_id, data, box_size in jobs:
+        key = render_key(data, box_size, DEFAULT_BORDER, "png")
+        image = render_cache.get(key)
+        if image is not None:
+            yield customer_id, image
+        else:
+            keys[customer_id] = key
+            misses.append((customer_id, data, box_size))
+
+    if not misses:
+        return
+    pool = _get_pool()
+    futures = [pool.submit(_render_task, job) for job in misses]
+    for future in as_completed(futures):
+        customer_id, image = future.result()
+        render_cache.set(keys[customer_id], image)
+        yield customer_id, image
+
+
+class _StreamSink(io.RawIOBase):
+    """Unseekable write target that hands written bytes back to a generator"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def qr_filename(customer):
+    name = re.sub(r"[^A-Za-z0-9]+", "_", f"{customer['lastName']}_{customer['firstName']}").strip("_")
+    return f"{name}_{customer['id']}_QRCode.png"
+
+
+def stream_qr_zip(customers, box_size):
+    """Yield a ZIP archive of QR PNGs chunk by chunk as each image is ready"""
+    by_id = {customer["id"]: customer for customer in customers}
+    jobs = [(customer["id"], customer["qrCodeData"], box_size) for customer in customers]
+    sink = _StreamSink()
+    # PNGs are already compressed, so entries are stored as-is
+    with zipfile.ZipFile(sink, mode="w", compression=zipfile.ZIP_STORED) as archive:
+        for customer_id, image in render_batch(jobs):
+            archive.writestr(qr_filename(by_id[customer_id]), image)
+            yield sink.drain()
+    yield sink.drain()
+
+
+def _label_font():
+    from PIL import ImageFont
+    try:
+        return ImageFont.load_default(size=40)
+    except TypeError:
+        # Pillow < 10.1 has no sized default font
+        return ImageFont.load_default()
+
+
+def _pdf_object(number, body, stream=None):
+    if stream is None:
+        return b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    return b"%d 0 obj\n%s\nstream\n%s\nendstream\nendobj\n" % (number, body, stream)
+
+
+def _pdf_page_objects(page, first_object):
+    """Image, content stream and page objects for one 1-bit page bitmap"""
+    image_number, contents_number, page_number = first_object, first_object + 1, first_object + 2
+    width_points = page.width * 72 / SHEET_DPI
+    height_points = page.height * 72 / SHEET_DPI
+    # Mode "1" rows are packed 8 pixels per byte, 1 = white, as DeviceGray expects
+    bitmap = zlib.compress(page.tobytes(), 6)
+    contents = b"q %.2f 0 0 %.2f 0 0 cm /Sheet Do Q" % (width_points, height_points)
+    return [
+        (image_number, _pdf_object(image_number, (
+            b"<< /Type /XObject /Subtype /Image /Width %d /Height %d /ColorSpace /DeviceGray "
+            b"/BitsPerComponent 1 /Filter /FlateDecode /Length %d >>" % (page.width, page.height, len(bitmap))
+        ), bitmap)),
+        (contents_number, _pdf_object(contents_number, b"<< /Length %d >>" % len(contents), contents)),
+        (page_number, _pdf_object(page_number, (
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %.2f %.2f] "
+            b"/Resources << /XObject << /Sheet %d 0 R >> >> /Contents %d 0 R >>"
+            % (width_points, height_points, image_number, contents_number)
+        ))),
+    ]
+
+
+def _render_sheet_pages(customers, images):
+    """Yield one 1-bit page image at a time in the caller's order (e.g. by class list)"""
+    from PIL import Image, ImageDraw
+
+    font = _label_font()
+    cell_width = (SHEET_SIZE[0] - 2 * SHEET_MARGIN) // SHEET_COLUMNS
+    cell_height = (SHEET_SIZE[1] - 2 * SHEET_MARGIN) // SHEET_ROWS
+    per_page = SHEET_COLUMNS * SHEET_ROWS
+
+    for offset in range(0, len(customers), per_page):
+        # 1 bit per pixel: about 1 MB per page instead of 25 MB for RGB
+        page = Image.new("1", SHEET_SIZE, 1)
+        draw = ImageDraw.Draw(page)
+        for slot, customer in enumerate(customers[offset:offset + per_page]):
+            column, row = slot % SHEET_COLUMNS, slot // SHEET_COLUMNS
+            left = SHEET_MARGIN + column * cell_width
+            top = SHEET_MARGIN + row * cell_height
+            qr_image = Image.open(io.BytesIO(images[customer["id"]])).convert("1")
+            qr_image = qr_image.resize((SHEET_QR_PIXELS, SHEET_QR_PIXELS), Image.NEAREST)
+            page.paste(qr_image, (left + (cell_width - SHEET_QR_PIXELS) // 2, top))
+            label = f"{customer['firstName']} {customer['lastName']}"
+            text_width = draw.textlength(label, font=font)
+            draw.text(
+                (left + (cell_width - text_width) / 2, top + SHEET_QR_PIXELS + SHEET_LABEL_HEIGHT / 4),
+                label, fill=0, font=font
+            )
+        yield page
+
+
+def stream_qr_sheet_pdf(customers, box_size):
+    """
+    Yield a multi-page printable PDF with one labelled QR code per cell
+    Pages are rendered and written one at a time, so memory stays at about one
+    page however many customers are on the sheet. The page tree and xref table
+    are written last, which PDF readers accept.
+    """
+    jobs = [(customer["id"], customer["qrCodeData"], box_size) for customer in customers]
+    images = dict(render_batch(jobs))
+
+    offsets = {}
+    position = 0
+    page_numbers = []
+
+    def emit(number, data):
+        nonlocal position
+        offsets[number] = position
+        position += len(data)
+        return data
+
+    header = b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n"
+    position = len(header)
+    yield header
+    # Objects 1 and 2 are the catalog and page tree, written once every page is known
+    next_object = 3
+    for page in _render_sheet_pages(customers, images):
+        objects = _pdf_page_objects(page, next_object)
+        page_numbers.append(objects[-1][0])
+        next_object += len(objects)
+        yield b"".join(emit(number, data) for number, data in objects)
+
+    kids = b" ".join(b"%d 0 R" % number for number in page_numbers)
+    yield emit(1, _pdf_object(1, b"<< /Type /Catalog /Pages 2 0 R >>")) + emit(2, _pdf_object(
+        2, b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, len(page_numbers))
+    ))
+    xref = [b"xref\n0 %d\n" % next_object, b"0000000000 65535 f \n"]
+    xref += [b"%010d 00000 n \n" % offsets[number] for number in range(1, next_object)]
+    yield b"".join(xref) + b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (next_object, position)
@@ -0,0 +1,145 @@
+"""
+Compact signed QR payloads
+A server-issued code is "DQ1-<customer id in base36>-<nonce><tag>". The nonce
+is 4 random base32 characters drawn each time a code is issued, and the tag is
+the first 40 bits of HMAC-SHA256(key, "1:<id>:<nonce>") in base32. Every
+character is in the QR alphanumeric set (digits, A-Z, "-"), so a code is at
+most 20 characters for ids below 46656 and fits a version 1 symbol.
+
+A scan is verified here, with no database access, so forged or garbled codes
+are rejected without touching the database. A verified code is then looked up
+by primary key and must still equal the customer's stored qrCodeData: issuing
+a new code (or a PUT of another value) revokes the old card.
+
+The key comes from QR_SIGNING_KEY. Outside production a key is generated once
+into a file next to the database and shared by every worker; on Railway that
+directory does not survive a redeploy, so there the app refuses to start
+without QR_SIGNING_KEY. Changing the key invalidates every signed code already
+printed. Codes in any other format (the registration page's
+CUSTOMER-<id>-<name>) are still matched against qrCodeData while
+QR_ACCEPT_UNSIGNED is on.
+"""
+import base64
+import hashlib
+import hmac
+import os
+import secrets
+from collections import namedtuple
+from threading import Lock
+
+QR_PAYLOAD_PREFIX = "DQ1-"
+QR_SIGNING_KEY_FILE = os.environ.get(
+    "QR_SIGNING_KEY_FILE", os.path.join(os.environ.get("QR_CHECKIN_DB_PATH", "/tmp/data"), "qr_signing.key")
+)
+# Railway sets RAILWAY_ENVIRONMENT; a generated key would be lost on every redeploy there
+QR_SIGNING_KEY_REQUIRED = os.environ.get(
+    "QR_SIGNING_KEY_REQUIRED", "1" if os.environ.get("RAILWAY_ENVIRONMENT") else "0"
+).lower() not in ("0", "false", "no")
+QR_ACCEPT_UNSIGNED = os.environ.get("QR_ACCEPT_UNSIGNED", "1").lower() not in ("0", "false", "no")
+
+BASE32_DIGITS = "ABCDEFGHIJKLMNOPQRSTUVWXYZ234567"
+BASE36_DIGITS = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+NONCE_LENGTH = 4
+# 40-bit tag: a forger needs about 2**39 guesses per code, each one a request
+TAG_BYTES = 5
+TAG_LENGTH = 8
+QR_VALUE_MAX_LENGTH = 255
+
+INVALID_QR_ERROR = "Invalid QR code"
+UNSIGNED_QR_ERROR = "Unsigned QR codes are no longer accepted; reissue this customer's code"
+
+# kind: "signed" (customer_id verified), "unsigned" (match qrCodeData) or "invalid" (see error);
+# value is the canonical form to look up and compare with the stored qrCodeData
+QrCheck = namedtuple("QrCheck", ["kind", "customer_id", "value", "error"])
+
+_key = {"value": None}
+_key_lock = Lock()
+
+
+class QrSigningKeyMissing(RuntimeError):
+    """QR_SIGNING_KEY is required here but not set"""
+
+
+def require_signing_key():
+    """Fail at startup, rather than on the first registration, if the key must be configured"""
+    if QR_SIGNING_KEY_REQUIRED and not os.environ.get("QR_SIGNING_KEY"):
+        raise QrSigningKeyMissing(
+            "QR_SIGNING_KEY is not set. A generated key would be lost on redeploy and every printed "
+            "QR code with it; set QR_SIGNING_KEY (or QR_SIGNING_KEY_REQUIRED=0 for development)"
+        )
+
+
+def _load_key_file():
+    """Read the shared key file, creating it if this is the first worker to need it"""
+    os.makedirs(os.path.dirname(QR_SIGNING_KEY_FILE) or ".", exist_ok=True)
+    tmp_path = f"{QR_SIGNING_KEY_FILE}.{os.getpid()}.tmp"
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "w") as f:
+        f.write(secrets.token_hex(32))
+    try:
+        # link() fails if the file exists, so racing workers all end up reading the first key
+        os.link(tmp_path, QR_SIGNING_KEY_FILE)
+        print(f"[QR] WARNING: generated a development QR signing key at {QR_SIGNING_KEY_FILE}. "
+              "Signed QR codes stop working if this file is lost; set QR_SIGNING_KEY in production")
+    except FileExistsError:
+        pass
+    finally:
+        os.unlink(tmp_path)
+    with open(QR_SIGNING_KEY_FILE) as f:
+        return f.read().strip().encode("utf-8")
+
+
+def signing_key():
+    with _key_lock:
+        if _key["value"] is None:
+            require_signing_key()
+            configured = os.environ.get("QR_SIGNING_KEY")
+            _key["value"] = configured.encode("utf-8") if configured else _load_key_file()
+        return _key["value"]
+
+
+def _to_base36(number):
+    digits = ""
+    while True:
+        number, remainder = divmod(number, 36)
+        digits = BASE36_DIGITS[remainder] + digits
+        if not number:
+            return digits
+
+
+def _tag(customer_id, nonce):
+    digest = hmac.new(signing_key(), f"1:{customer_id}:{nonce}".encode("ascii"), hashlib.sha256).digest()
+    return base64.b32encode(digest[:TAG_BYTES]).decode("ascii")
+
+
+def issue_signed_qr(customer_id):
+    """A new signed QR payload for a customer; every call returns a different code"""
+    nonce = "".join(secrets.choice(BASE32_DIGITS) for _ in range(NONCE_LENGTH))
+    return f"{QR_PAYLOAD_PREFIX}{_to_base36(customer_id)}-{nonce}{_tag(customer_id, nonce)}"
+
+
+def is_signed_payload(value):
+    return isinstance(value, str) and value[:len(QR_PAYLOAD_PREFIX)].upper() == QR_PAYLOAD_PREFIX
+
+
+def check_qr_value(value):
+    """Classify a scanned value without touching the database"""
+    if not isinstance(value, str) or not value or len(value) > QR_VALUE_MAX_LENGTH or not value.isprintable():
+        return QrCheck("invalid", None, None, INVALID_QR_ERROR)
+    if not is_signed_payload(value):
+        if QR_ACCEPT_UNSIGNED:
+            return QrCheck("unsigned", None, value, None)
+        return QrCheck("invalid", None, None, UNSIGNED_QR_ERROR)
+
+    # Scanners and keyboard wedges may change case; the format itself is uppercase
+    canonical = value.upper()
+    encoded_id, _, signature = canonical[len(QR_PAYLOAD_PREFIX):].partition("-")
+    nonce, tag = signature[:NONCE_LENGTH], signature[NONCE_LENGTH:]
+    if (not 0 < len(encoded_id) <= 12 or encoded_id.strip(BASE36_DIGITS)
+            or len(signature) != NONCE_LENGTH + TAG_LENGTH or signature.strip(BASE32_DIGITS)):
+        return QrCheck("invalid", None, None, INVALID_QR_ERROR)
+    customer_id = int(encoded_id, 36)
+    # Only the canonical spelling (no leading zeros) is issued, so only it verifies
+    if _to_base36(customer_id) != encoded_id or not hmac.compare_digest(tag, _tag(customer_id, nonce)):
+        return QrCheck("invalid", None, None, INVALID_QR_ERROR)
+    return QrCheck("signed", customer_id, canonical, None)
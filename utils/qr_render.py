@@ -0,0 +1,135 @@
+"""
+Content-addressed QR code render cache
+Rendered images are keyed on a hash of (data, box size, border, format) and the
+renderer version (qrcode and Pillow releases), kept in an in-memory LRU bounded
+by total bytes and optionally mirrored to disk, so a customer's QR code is
+encoded once and the same bytes (and ETag) are reused by the image endpoints
+and the email pipeline.
+"""
+import hashlib
+import io
+import os
+from collections import OrderedDict
+from threading import Lock
+
+QR_RENDER_CACHE_MAX_BYTES = int(os.environ.get("QR_RENDER_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+QR_RENDER_CACHE_DIR = os.environ.get("QR_RENDER_CACHE_DIR")  # unset = memory only
+
+DEFAULT_BOX_SIZE = 10
+DEFAULT_BORDER = 4
+FORMATS = {"png": "image/png", "svg": "image/svg+xml"}
+# Bump when render_uncached changes its output for the same inputs
+RENDERER_REVISION = 1
+
+_renderer_version = {"value": None}
+
+
+class RenderCache:
+    """Thread-safe LRU of rendered images bounded by total size in bytes"""
+
+    def __init__(self, max_bytes, disk_dir=None):
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self._data = OrderedDict()
+        self._size = 0
+        self._lock = Lock()
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, key)
+
+    def get(self, key):
+        with self._lock:
+            value = self._data.get(key)
+            if value is not None:
+                self._data.move_to_end(key)
+                return value
+        if self.disk_dir:
+            try:
+                with open(self._disk_path(key), "rb") as f:
+                    value = f.read()
+            except OSError:
+                return None
+            self._store(key, value)
+            return value
+        return None
+
+    def set(self, key, value):
+        self._store(key, value)
+        if self.disk_dir:
+            # Write to a temp file and rename so readers never see partial images
+            tmp_path = f"{self._disk_path(key)}.{os.getpid()}.tmp"
+            try:
+                with open(tmp_path, "wb") as f:
+                    f.write(value)
+                os.replace(tmp_path, self._disk_path(key))
+            except OSError as e:
+                print(f"[QR] Could not write render cache file: {e}")
+
+    def _store(self, key, value):
+        with self._lock:
+            if key in self._data:
+                self._size -= len(self._data.pop(key))
+            self._data[key] = value
+            self._size += len(value)
+            while self._size > self.max_bytes and len(self._data) > 1:
+                _, evicted = self._data.popitem(last=False)
+                self._size -= len(evicted)
+
+
+render_cache = RenderCache(QR_RENDER_CACHE_MAX_BYTES, QR_RENDER_CACHE_DIR)
+
+
+def renderer_version():
+    """
+    Identifies everything besides the inputs that shapes the output bytes, so a
+    qrcode or Pillow upgrade (or a change to render_uncached) gets new keys and
+    ETags instead of 304s for stale images. Read from package metadata, which
+    does not import the libraries.
+    """
+    if _renderer_version["value"] is None:
+        from importlib import metadata
+        versions = []
+        for package in ("qrcode", "pillow"):
+            try:
+                versions.append(f"{package}={metadata.version(package)}")
+            except metadata.PackageNotFoundError:
+                versions.append(f"{package}=unknown")
+        _renderer_version["value"] = f"{RENDERER_REVISION};{';'.join(versions)}"
+    return _renderer_version["value"]
+
+
+def render_key(data, box_size=DEFAULT_BOX_SIZE, border=DEFAULT_BORDER, fmt="png"):
+    """Return the cache address for a render (inputs plus renderer version); also used as the strong ETag"""
+    raw = f"{renderer_version()}\x00{fmt}\x00{box_size}\x00{border}\x00{data}".encode("utf-8")
+    return hashlib.sha256(raw).hexdigest()
+
+
+def render_uncached(data, box_size, border, fmt):
+    """Encode a QR code to image bytes without consulting the cache"""
+    # qrcode pulls in Pillow; imported on the first cache miss rather than at startup
+    import qrcode
+    import qrcode.image.svg
+
+    qr = qrcode.QRCode(version=1, box_size=box_size, border=border)
+    qr.add_data(data)
+    qr.make(fit=True)
+    buffer = io.BytesIO()
+    if fmt == "svg":
+        qr.make_image(image_factory=qrcode.image.svg.SvgPathImage).save(buffer)
+    else:
+        qr.make_image(fill_color="black", back_color="white").save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def render_qr(data, box_size=DEFAULT_BOX_SIZE, border=DEFAULT_BORDER, fmt="png"):
+    """Return (key, image bytes) for a QR code, rendering only on a cache miss"""
+    if fmt not in FORMATS:
+        raise ValueError(f"Unsupported QR format: {fmt}")
+    key = render_key(data, box_size, border, fmt)
+    image = render_cache.get(key)
+    if image is None:
+        image = render_uncached(data, box_size, border, fmt)
+        render_cache.set(key, image)
+    return key, image
@@ -0,0 +1,32 @@
+"""
+Thin helper for authenticated QuickBooks Online API calls
+All QBO data requests go through qbo_request so they share the pooled session,
+timeouts, headers and the per-realm rate limits in utils.qbo_scheduler.
+"""
+import os
+
+from utils.http_clients import quickbooks_session, QB_TIMEOUT
+from utils.qbo_scheduler import qbo_scheduler
+
+QB_MINOR_VERSION = os.environ.get("QB_MINOR_VERSION", "65")
+
+
+def qbo_request(method, api_url, token_data, path, params=None, json=None):
+    """Call /v3/company/<realm><path> and return the requests Response"""
+    params = dict(params or {})
+    params.setdefault("minorversion", QB_MINOR_VERSION)
+    headers = {
+        "Authorization": f"Bearer {token_data.get('access_token')}",
+        "Accept": "application/json"
+    }
+    if json is not None:
+        headers["Content-Type"] = "application/json"
+    realm_id = token_data.get('realm_id')
+    return qbo_scheduler.request(realm_id, lambda: quickbooks_session.request(
+        method,
+        f"{api_url}/v3/company/{realm_id}{path}",
+        headers=headers,
+        params=params,
+        json=json,
+        timeout=QB_TIMEOUT
+    ), batch=path == "/batch")
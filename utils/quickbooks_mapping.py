@@ -0,0 +1,268 @@
+"""
+Local <-> QuickBooks id mapping for customers and session types
+Invoices need a QBO CustomerRef and ItemRef. Rather than querying QuickBooks per
+invoice, mappings are stored in quickbooks_customer_map / quickbooks_item_map:
+
+- a full refresh pages through every QBO Customer and Item (1000 per query)
+- an incremental refresh asks Change Data Capture for entities changed since
+  the last refresh (CDC only looks back 30 days; older watermarks fall back
+  to a full refresh)
+
+Customers match on email, then on "First Last" display name; session types
+match on item name. The maps are held in memory, so resolving refs while
+building invoices costs no API calls and no per-row queries.
+"""
+import time
+from datetime import datetime, timedelta, timezone
+from threading import Lock
+
+from db import db
+from models.models import (
+    CheckInSync, Customer, SessionType, QuickBooksCustomerMap, QuickBooksItemMap, QuickBooksSyncState
+)
+from utils.quickbooks_api import qbo_request
+
+QBO_QUERY_PAGE_SIZE = 1000
+QBO_NAME_LOOKUP_CHUNK = 50
+CDC_MAX_LOOKBACK = timedelta(days=30)
+CDC_WATERMARK_KEY = "mapping_cdc_since"
+MAPPING_CACHE_TTL_SECONDS = 60
+
+_maps = {"customers": None, "items": None, "expires_at": 0.0}
+_maps_lock = Lock()
+
+
+class QuickBooksMappingError(Exception):
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def _check(response, what):
+    if response.status_code != 200:
+        raise QuickBooksMappingError(
+            f"QuickBooks {what} failed: {response.status_code} - {response.text[:500]}",
+            status_code=response.status_code
+        )
+    return response.json()
+
+
+def _query_all(api_url, token_data, entity, where=""):
+    """Page through every active entity of a type matching an optional where clause"""
+    results = []
+    start = 1
+    while True:
+        body = _check(qbo_request("GET", api_url, token_data, "/query", params={
+            "query": f"select * from {entity} {where} "
+                     f"STARTPOSITION {start} MAXRESULTS {QBO_QUERY_PAGE_SIZE}"
+        }), f"{entity} query")
+        page = body.get("QueryResponse", {}).get(entity, [])
+        results.extend(page)
+        if len(page) < QBO_QUERY_PAGE_SIZE:
+            return results
+        start += QBO_QUERY_PAGE_SIZE
+
+
+def _customer_keys(entity):
+    email = (entity.get("PrimaryEmailAddr") or {}).get("Address")
+    name = entity.get("DisplayName") or " ".join(
+        part for part in (entity.get("GivenName"), entity.get("FamilyName")) if part
+    )
+    return (email or "").strip().lower(), (name or "").strip().lower()
+
+
+def _apply_customers(entities, full):
+    by_email = {}
+    by_name = {}
+    deleted = set()
+    for entity in entities:
+        if entity.get("status") == "Deleted" or entity.get("Active") is False:
+            deleted.add(entity.get("Id"))
+            continue
+        email, name = _customer_keys(entity)
+        if email:
+            by_email[email] = entity
+        if name:
+            by_name[name] = entity
+
+    existing = {row.customer_id: row for row in QuickBooksCustomerMap.query.all()}
+    changed = 0
+    for customer in db.session.query(Customer.id, Customer.email, Customer.firstName, Customer.lastName):
+        entity = by_email.get((customer.email or "").lower()) or by_name.get(
+            f"{customer.firstName} {customer.lastName}".lower()
+        )
+        row = existing.get(customer.id)
+        if entity is None:
+            # On a full refresh, anything not found in QuickBooks is no longer mapped
+            if row is not None and (full or row.qbo_id in deleted):
+                db.session.delete(row)
+                changed += 1
+            continue
+        if row is None:
+            db.session.add(QuickBooksCustomerMap(
+                customer_id=customer.id, qbo_id=entity["Id"], qbo_display_name=entity.get("DisplayName")
+            ))
+            changed += 1
+        elif row.qbo_id != entity["Id"] or row.qbo_display_name != entity.get("DisplayName"):
+            row.qbo_id = entity["Id"]
+            row.qbo_display_name = entity.get("DisplayName")
+            changed += 1
+    return changed
+
+
+def _apply_items(entities, full):
+    by_name = {}
+    deleted = set()
+    for entity in entities:
+        if entity.get("status") == "Deleted" or entity.get("Active") is False:
+            deleted.add(entity.get("Id"))
+            continue
+        if entity.get("Name"):
+            by_name[entity["Name"].strip().lower()] = entity
+
+    existing = {row.session_type_id: row for row in QuickBooksItemMap.query.all()}
+    changed = 0
+    for session_type in db.session.query(SessionType.id, SessionType.name):
+        entity = by_name.get(session_type.name.lower())
+        row = existing.get(session_type.id)
+        if entity is None:
+            if row is not None and (full or row.qbo_id in deleted):
+                db.session.delete(row)
+                changed += 1
+            continue
+        if row is None:
+            db.session.add(QuickBooksItemMap(
+                session_type_id=session_type.id, qbo_id=entity["Id"], qbo_name=entity.get("Name")
+            ))
+            changed += 1
+        elif row.qbo_id != entity["Id"]:
+            row.qbo_id = entity["Id"]
+            row.qbo_name = entity.get("Name")
+            changed += 1
+    return changed
+
+
+def _quote(value):
+    return "'" + value.replace("\\", "\\\\").replace("'", "\\'") + "'"
+
+
+def _lookup_unmapped_customers(api_url, token_data):
+    """Find QBO customers for local customers added since the last full refresh"""
+    names = [
+        f"{row.firstName} {row.lastName}"
+        for row in db.session.query(Customer.firstName, Customer.lastName).filter(
+            ~Customer.id.in_(db.session.query(QuickBooksCustomerMap.customer_id))
+        )
+    ]
+    found = []
+    for start in range(0, len(names), QBO_NAME_LOOKUP_CHUNK):
+        chunk = names[start:start + QBO_NAME_LOOKUP_CHUNK]
+        found.extend(_query_all(
+            api_url, token_data, "Customer",
+            where=f"where DisplayName in ({', '.join(_quote(name) for name in chunk)})"
+        ))
+    return found
+
+
+def _get_watermark():
+    state = QuickBooksSyncState.query.get(CDC_WATERMARK_KEY)
+    if state is None or not state.value:
+        return None
+    return datetime.fromisoformat(state.value)
+
+
+def _set_watermark(value):
+    state = QuickBooksSyncState.query.get(CDC_WATERMARK_KEY)
+    if state is None:
+        state = QuickBooksSyncState(key=CDC_WATERMARK_KEY)
+        db.session.add(state)
+    state.value = value.isoformat()
+
+
+def refresh_mappings(api_url, token_data, full=False):
+    """
+    Refresh the customer and item maps; incremental via CDC unless full=True
+    Returns a summary dict. Raises QuickBooksMappingError on API failures.
+    """
+    started_at = datetime.now(timezone.utc)
+    since = None if full else _get_watermark()
+    if since is not None and started_at - since > CDC_MAX_LOOKBACK:
+        since = None
+
+    if since is None:
+        customers = _query_all(api_url, token_data, "Customer")
+        items = _query_all(api_url, token_data, "Item")
+        mode = "full"
+    else:
+        body = _check(qbo_request("GET", api_url, token_data, "/cdc", params={
+            "entities": "Customer,Item",
+            "changedSince": since.isoformat(timespec="seconds")
+        }), "CDC")
+        customers, items = [], []
+        for response in body.get("CDCResponse", []):
+            for query_response in response.get("QueryResponse", []):
+                customers.extend(query_response.get("Customer", []))
+                items.extend(query_response.get("Item", []))
+        # CDC only reports QBO-side changes; new local customers may match old QBO records
+        customers.extend(_lookup_unmapped_customers(api_url, token_data))
+        mode = "incremental"
+
+    summary = {
+        "mode": mode,
+        "qbo_customers_seen": len(customers),
+        "qbo_items_seen": len(items),
+        "customer_mappings_changed": _apply_customers(customers, full=mode == "full"),
+        "item_mappings_changed": _apply_items(items, full=mode == "full"),
+    }
+    summary["unmapped_checkins_requeued"] = 0
+    if summary["customer_mappings_changed"] or summary["item_mappings_changed"]:
+        # Parked check-ins get one more try; any still unmapped are parked again without an attempt
+        summary["unmapped_checkins_requeued"] = CheckInSync.query.filter_by(status="unmapped").update(
+            {"status": "failed"}, synchronize_session=False
+        )
+    _set_watermark(started_at)
+    db.session.commit()
+    invalidate_mapping_cache()
+    return summary
+
+
+def _load_maps():
+    with _maps_lock:
+        if _maps["customers"] is None or _maps["expires_at"] < time.monotonic():
+            _maps["customers"] = dict(db.session.query(QuickBooksCustomerMap.customer_id, QuickBooksCustomerMap.qbo_id))
+            _maps["items"] = dict(db.session.query(QuickBooksItemMap.session_type_id, QuickBooksItemMap.qbo_id))
+            _maps["expires_at"] = time.monotonic() + MAPPING_CACHE_TTL_SECONDS
+        return _maps["customers"], _maps["items"]
+
+
+def invalidate_mapping_cache():
+    with _maps_lock:
+        _maps["customers"] = None
+
+
+def qbo_customer_ref(customer_id):
+    """QBO Customer Id for a local customer, or None if unmapped"""
+    return _load_maps()[0].get(customer_id)
+
+
+def qbo_item_ref(session_type_id):
+    """QBO Item Id for a local session type, or None if unmapped"""
+    return _load_maps()[1].get(session_type_id)
+
+
+def mapping_status():
+    customers, items = _load_maps()
+    unmapped_customers = db.session.query(Customer.id).filter(
+        ~Customer.id.in_(db.session.query(QuickBooksCustomerMap.customer_id))
+    ).count()
+    unmapped_items = [
+        st.name for st in SessionType.query.all() if st.id not in items
+    ]
+    watermark = _get_watermark()
+    return {
+        "mapped_customers": len(customers),
+        "unmapped_customers": unmapped_customers,
+        "mapped_session_types": len(items),
+        "unmapped_session_types": unmapped_items,
+        "last_refresh": watermark.isoformat() if watermark else None
+    }
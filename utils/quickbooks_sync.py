@@ -0,0 +1,263 @@
+"""
+Batched QuickBooks sync for check-ins
+Each check-in becomes one Invoice (or SalesReceipt) with DocNumber "CI-<id>",
+sent through the QBO batch endpoint in groups of up to 30 operations.
+
+Progress is stored per check-in in check_in_sync. New work is found above a
+high-water mark (the largest check-in id that has a sync row, read from the
+primary key index), so a run never rescans already-synced history. Rows are
+marked "pending" and committed before their batch is sent; if a run dies
+mid-batch, the next run looks those DocNumbers up in QuickBooks first and only
+resends the ones that were never created. Check-ins without a QuickBooks
+customer or item are parked as "unmapped" until a mapping refresh changes the
+maps, so they never crowd new work out of a run.
+"""
+import fcntl
+import os
+from contextlib import contextmanager
+from datetime import datetime
+
+from sqlalchemy import func
+
+from db import db
+from models.models import CheckIn, CheckInSync
+from utils.checkin_queries import joined_checkins_query
+from utils.quickbooks_api import qbo_request
+from utils.quickbooks_mapping import qbo_customer_ref, qbo_item_ref
+
+QB_BATCH_MAX_OPERATIONS = 30
+QB_SYNC_ENTITY = os.environ.get("QB_SYNC_ENTITY", "Invoice")  # Invoice or SalesReceipt
+QB_SYNC_MAX_PER_RUN = int(os.environ.get("QB_SYNC_MAX_PER_RUN", "900"))
+QB_SYNC_MAX_ATTEMPTS = int(os.environ.get("QB_SYNC_MAX_ATTEMPTS", "5"))
+# Fallback refs for unmapped customers/session types; empty means the check-in waits for a mapping
+QB_DEFAULT_CUSTOMER_REF = os.environ.get("QB_DEFAULT_CUSTOMER_REF", "")
+QB_DEFAULT_ITEM_REF = os.environ.get("QB_DEFAULT_ITEM_REF", "")
+QB_SYNC_LOCK_FILE = os.path.join(os.environ.get("QR_CHECKIN_DB_PATH", "/tmp/data"), "qb_sync.lock")
+
+
+class QuickBooksSyncError(Exception):
+    """The whole batch request failed (auth, throttling, outage); the run stops and can resume"""
+
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class SyncAlreadyRunning(Exception):
+    """Another thread or worker holds the sync lock"""
+
+
+@contextmanager
+def sync_lock():
+    """Exclusive, non-blocking lock so only one sync runs across all workers"""
+    with open(QB_SYNC_LOCK_FILE, "a") as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            raise SyncAlreadyRunning("A QuickBooks sync is already running")
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def doc_number(checkin_id):
+    return f"CI-{checkin_id}"
+
+
+def _post_batch(api_url, token_data, operations):
+    response = qbo_request("POST", api_url, token_data, "/batch", json={"BatchItemRequest": operations})
+    if response.status_code != 200:
+        raise QuickBooksSyncError(
+            f"QuickBooks batch request failed: {response.status_code} - {response.text[:500]}",
+            status_code=response.status_code
+        )
+    return {item.get("bId"): item for item in response.json().get("BatchItemResponse", [])}
+
+
+def _batch_outcome_unknown(error):
+    """
+    A 5xx from QuickBooks or a gateway may arrive after some operations were
+    applied, and QBO does not enforce unique DocNumbers, so such a batch must
+    be reconciled rather than resent
+    """
+    return error.status_code is None or error.status_code >= 500
+
+
+def customer_ref_for(row):
+    """QuickBooks CustomerRef for a check-in row, from the in-memory mapping"""
+    return qbo_customer_ref(row.customer_id) or QB_DEFAULT_CUSTOMER_REF or None
+
+
+def item_ref_for(row):
+    """QuickBooks ItemRef for a check-in row, from the in-memory mapping"""
+    return qbo_item_ref(row.session_type_id) or QB_DEFAULT_ITEM_REF or None
+
+
+def build_transaction(row):
+    """Build the Invoice/SalesReceipt body for one joined check-in row"""
+    customer_name = f"{row.firstName} {row.lastName}"
+    return {
+        "DocNumber": doc_number(row.id),
+        "TxnDate": row.check_in_time.date().isoformat(),
+        "CustomerRef": {"value": customer_ref_for(row)},
+        "Line": [{
+            "Amount": row.price,
+            "DetailType": "SalesItemLineDetail",
+            "Description": f"{row.session_type_name} - {customer_name} - {row.check_in_time.strftime('%Y-%m-%d %H:%M')}",
+            "SalesItemLineDetail": {
+                "ItemRef": {"value": item_ref_for(row)},
+                "Qty": 1,
+                "UnitPrice": row.price
+            }
+        }],
+        "PrivateNote": f"Check-in {row.id}"
+    }
+
+
+def _reconcile_pending(api_url, token_data, summary):
+    """Resolve rows left "pending" by an interrupted run by looking up their DocNumbers"""
+    pending = CheckInSync.query.filter_by(status="pending").order_by(CheckInSync.checkin_id).all()
+    for start in range(0, len(pending), QB_BATCH_MAX_OPERATIONS):
+        chunk = pending[start:start + QB_BATCH_MAX_OPERATIONS]
+        numbers = ", ".join(f"'{sync.doc_number}'" for sync in chunk)
+        results = _post_batch(api_url, token_data, [{
+            "bId": "reconcile",
+            "Query": f"select Id, DocNumber from {QB_SYNC_ENTITY} where DocNumber in ({numbers})"
+        }])
+        reconcile = results.get("reconcile", {})
+        if "QueryResponse" not in reconcile:
+            # Without an answer nothing is known to be absent; resending could duplicate invoices
+            errors = reconcile.get("Fault", {}).get("Error", [{}])
+            raise QuickBooksSyncError("QuickBooks did not answer the reconcile query: " + "; ".join(
+                f"{e.get('Message', 'Unknown error')}: {e.get('Detail', '')}" for e in errors
+            )[:500])
+        found = {
+            entity["DocNumber"]: entity["Id"]
+            for entity in reconcile["QueryResponse"].get(QB_SYNC_ENTITY, [])
+        }
+        for sync in chunk:
+            if sync.doc_number in found:
+                sync.status = "synced"
+                sync.qbo_entity = QB_SYNC_ENTITY
+                sync.qbo_id = found[sync.doc_number]
+                summary["reconciled"] += 1
+            else:
+                # Never reached QuickBooks; eligible for resend
+                sync.status = "failed"
+                sync.last_error = "Interrupted before QuickBooks confirmed the batch"
+        db.session.commit()
+
+
+def _select_work(limit):
+    """Retryable failures first, then new check-ins above the high-water mark"""
+    retry_rows = joined_checkins_query().join(
+        CheckInSync, CheckInSync.checkin_id == CheckIn.id
+    ).filter(
+        CheckInSync.status == "failed", CheckInSync.attempts < QB_SYNC_MAX_ATTEMPTS
+    ).order_by(CheckIn.id).limit(limit).all()
+
+    remaining = limit - len(retry_rows)
+    if remaining <= 0:
+        return retry_rows
+    high_water_mark = db.session.query(func.max(CheckInSync.checkin_id)).scalar() or 0
+    new_rows = joined_checkins_query().filter(
+        CheckIn.id > high_water_mark
+    ).order_by(CheckIn.id).limit(remaining).all()
+    return retry_rows + new_rows
+
+
+def _mark_pending(rows, summary):
+    """Record every selected row before sending; rows that cannot be billed are skipped"""
+    existing = {
+        sync.checkin_id: sync
+        for sync in CheckInSync.query.filter(CheckInSync.checkin_id.in_([row.id for row in rows])).all()
+    }
+    sendable = []
+    for row in rows:
+        sync = existing.get(row.id)
+        if sync is None:
+            sync = CheckInSync(checkin_id=row.id, doc_number=doc_number(row.id), attempts=0)
+            db.session.add(sync)
+        if row.firstName is None or row.session_type_name is None:
+            sync.status = "skipped"
+            sync.last_error = "Customer or session type no longer exists"
+            summary["skipped"] += 1
+            continue
+        if customer_ref_for(row) is None or item_ref_for(row) is None:
+            # Not an attempt and not retried: refresh_mappings re-queues these once a mapping changes
+            sync.status = "unmapped"
+            sync.last_error = "No QuickBooks customer or item mapped; refresh mappings"
+            summary["unmapped"] += 1
+            continue
+        sync.status = "pending"
+        sendable.append((row, sync))
+    db.session.commit()
+    return sendable
+
+
+def run_sync(api_url, token_data, max_checkins=QB_SYNC_MAX_PER_RUN):
+    """
+    Push unsynced check-ins to QuickBooks in batches of 30
+    Returns a summary dict. Stops early (leaving later rows for the next run)
+    if QuickBooks rejects a whole batch request.
+    """
+    summary = {"synced": 0, "failed": 0, "skipped": 0, "unmapped": 0, "reconciled": 0, "batches": 0, "error": None}
+    try:
+        _reconcile_pending(api_url, token_data, summary)
+        rows = _select_work(max_checkins)
+        for start in range(0, len(rows), QB_BATCH_MAX_OPERATIONS):
+            chunk = _mark_pending(rows[start:start + QB_BATCH_MAX_OPERATIONS], summary)
+            if not chunk:
+                continue
+            operations = [
+                {"bId": str(row.id), "operation": "create", QB_SYNC_ENTITY: build_transaction(row)}
+                for row, _ in chunk
+            ]
+            try:
+                results = _post_batch(api_url, token_data, operations)
+            except QuickBooksSyncError as e:
+                for _, sync in chunk:
+                    sync.attempts += 1
+                    sync.last_error = str(e)[:1000]
+                    if not _batch_outcome_unknown(e):
+                        # QuickBooks rejected the request itself, so nothing in it was created
+                        sync.status = "failed"
+                # Otherwise the rows stay "pending" and are looked up by DocNumber next run
+                db.session.commit()
+                raise
+            summary["batches"] += 1
+            for row, sync in chunk:
+                result = results.get(str(row.id), {})
+                sync.attempts += 1
+                if QB_SYNC_ENTITY in result:
+                    sync.status = "synced"
+                    sync.qbo_entity = QB_SYNC_ENTITY
+                    sync.qbo_id = result[QB_SYNC_ENTITY].get("Id")
+                    sync.last_error = None
+                    summary["synced"] += 1
+                else:
+                    errors = result.get("Fault", {}).get("Error", [{}])
+                    sync.status = "failed"
+                    sync.last_error = "; ".join(
+                        f"{e.get('Message', 'Unknown error')}: {e.get('Detail', '')}" for e in errors
+                    )[:1000]
+                    summary["failed"] += 1
+            db.session.commit()
+    except QuickBooksSyncError as e:
+        summary["error"] = str(e)
+        summary["status_code"] = e.status_code
+    except Exception as e:
+        # Network errors etc.: rows already marked pending are reconciled next run
+        db.session.rollback()
+        summary["error"] = f"Sync interrupted: {str(e)}"
+    summary["finished_at"] = datetime.utcnow().isoformat()
+    return summary
+
+
+def sync_status_counts():
+    """Return counts of check-ins by sync status, including never-attempted ones"""
+    counts = dict(db.session.query(CheckInSync.status, func.count()).group_by(CheckInSync.status).all())
+    high_water_mark = db.session.query(func.max(CheckInSync.checkin_id)).scalar() or 0
+    counts["unsynced"] = db.session.query(func.count(CheckIn.id)).filter(CheckIn.id > high_water_mark).scalar()
+    return counts
@@ -0,0 +1,156 @@
+"""
+Duplicate-scan suppression for check-ins
+A phone held up to the camera is scanned several times a second. Within
+CHECKIN_DEDUPE_SECONDS of a check-in, further scans for the same customer and
+session type return that check-in instead of inserting another one.
+
+Repeats are answered from an in-process cache, then from the recent_scan table
+(one read, no write transaction), which every worker shares. The recent_scan
+row is also the guard against two workers racing on the first scan: a new
+check-in only commits if a conditional upsert on the (customer, session type)
+primary key claims the row, and SQLite runs one writer at a time.
+"""
+import os
+from datetime import datetime, timedelta
+
+from sqlalchemy import text
+
+from db import db
+from utils.lookup_cache import TTLCache
+
+CHECKIN_DEDUPE_SECONDS = float(os.environ.get("CHECKIN_DEDUPE_SECONDS", "60"))
+CHECKIN_DEDUPE_CACHE_MAX_ENTRIES = int(os.environ.get("CHECKIN_DEDUPE_CACHE_MAX_ENTRIES", "5000"))
+
+# Entries only need to outlive the window; each hit still checks the check-in's age
+recent_scans = TTLCache(CHECKIN_DEDUPE_CACHE_MAX_ENTRIES, max(CHECKIN_DEDUPE_SECONDS, 1))
+
+RECENT_SCAN_SQL = text("""
+SELECT check_in.id, check_in.customer_id, check_in.session_type_id, check_in.check_in_time, check_in.notes
+FROM recent_scan JOIN check_in ON check_in.id = recent_scan.checkin_id
+WHERE recent_scan.customer_id = :customer_id AND recent_scan.session_type_id = :session_type_id
+  AND recent_scan.check_in_time > :window_start
+""")
+
+# Only takes over the row when its check-in is older than the window
+CLAIM_SCAN_SQL = text("""
+INSERT INTO recent_scan (customer_id, session_type_id, checkin_id, check_in_time)
+VALUES (:customer_id, :session_type_id, :checkin_id, :check_in_time)
+ON CONFLICT (customer_id, session_type_id) DO UPDATE SET
+    checkin_id = excluded.checkin_id,
+    check_in_time = excluded.check_in_time
+WHERE recent_scan.check_in_time <= :window_start
+""")
+
+
+# Batch scans carry their own times and may arrive out of order; keep the newest
+RECORD_SCAN_SQL = text("""
+INSERT INTO recent_scan (customer_id, session_type_id, checkin_id, check_in_time)
+VALUES (:customer_id, :session_type_id, :checkin_id, :check_in_time)
+ON CONFLICT (customer_id, session_type_id) DO UPDATE SET
+    checkin_id = excluded.checkin_id,
+    check_in_time = excluded.check_in_time
+WHERE recent_scan.check_in_time < excluded.check_in_time
+""")
+
+
+def dedupe_enabled():
+    return CHECKIN_DEDUPE_SECONDS > 0
+
+
+def _db_time(value):
+    """check_in_time as SQLAlchemy's DateTime type stores it in SQLite"""
+    return value.isoformat(" ", "microseconds")
+
+
+def _window_start(now):
+    return now - timedelta(seconds=CHECKIN_DEDUPE_SECONDS)
+
+
+def checkin_payload(checkin_id, customer_id, session_type_id, check_in_time, notes):
+    return {
+        "id": checkin_id,
+        "customer_id": customer_id,
+        "session_type_id": session_type_id,
+        "check_in_time": check_in_time.isoformat(),
+        "notes": notes
+    }
+
+
+def _fetch_recent(customer_id, session_type_id, now):
+    row = db.session.execute(RECENT_SCAN_SQL, {
+        "customer_id": customer_id,
+        "session_type_id": session_type_id,
+        "window_start": _db_time(_window_start(now)),
+    }).first()
+    if row is None:
+        return None
+    check_in_time = row.check_in_time
+    if isinstance(check_in_time, str):
+        check_in_time = datetime.fromisoformat(check_in_time)
+    return check_in_time, checkin_payload(row.id, row.customer_id, row.session_type_id, check_in_time, row.notes)
+
+
+def recent_checkin(customer_id, session_type_id, now):
+    """The check-in this scan duplicates, as a response payload, or None"""
+    if not dedupe_enabled():
+        return None
+    key = (customer_id, session_type_id)
+    cached = recent_scans.get(key)
+    if cached is not None and cached[0] > _window_start(now):
+        return cached[1]
+    found = _fetch_recent(customer_id, session_type_id, now)
+    if found is None:
+        return None
+    recent_scans.set(key, found)
+    return found[1]
+
+
+def claim_scan(checkin):
+    """
+    Record a flushed, uncommitted check-in as the latest scan for its customer
+    and session type. Returns None if it was claimed; if another check-in inside
+    the window got there first, returns that check-in's payload and the caller
+    should roll back.
+    """
+    if not dedupe_enabled():
+        return None
+    result = db.session.execute(CLAIM_SCAN_SQL, {
+        "customer_id": checkin.customer_id,
+        "session_type_id": checkin.session_type_id,
+        "checkin_id": checkin.id,
+        "check_in_time": _db_time(checkin.check_in_time),
+        "window_start": _db_time(_window_start(checkin.check_in_time)),
+    })
+    if result.rowcount:
+        return None
+    found = _fetch_recent(checkin.customer_id, checkin.session_type_id, checkin.check_in_time)
+    return found[1] if found else None
+
+
+def record_scans(checkins, now):
+    """
+    Record already inserted check-ins (e.g. a synced offline batch) as the latest
+    scans for their customer and session type, in the caller's transaction
+    checkins: iterable of (checkin_id, customer_id, session_type_id, check_in_time).
+    Only check-ins still inside the window are written.
+    """
+    if not dedupe_enabled():
+        return
+    window_start = _window_start(now)
+    latest = {}
+    for checkin_id, customer_id, session_type_id, check_in_time in checkins:
+        key = (customer_id, session_type_id)
+        if check_in_time > window_start and (key not in latest or check_in_time > latest[key][1]):
+            latest[key] = (checkin_id, check_in_time)
+    if latest:
+        db.session.execute(RECORD_SCAN_SQL, [
+            {"customer_id": customer_id, "session_type_id": session_type_id,
+             "checkin_id": checkin_id, "check_in_time": _db_time(check_in_time)}
+            for (customer_id, session_type_id), (checkin_id, check_in_time) in latest.items()
+        ])
+
+
+def remember_scan(payload, check_in_time):
+    """Cache a committed check-in so this worker answers its repeats without a query"""
+    if dedupe_enabled():
+        recent_scans.set((payload["customer_id"], payload["session_type_id"]), (check_in_time, payload))
@@ -0,0 +1,78 @@
+"""
+SQLite engine profile for running under several gunicorn workers
+The "production" profile switches the database to WAL, relaxes fsyncs to
+synchronous=NORMAL, waits on locks instead of failing with "database is locked",
+and sizes the page cache and mmap window. Every value can be overridden from the
+environment; SQLITE_PROFILE=default keeps SQLite's stock behaviour.
+"""
+import os
+import weakref
+
+from sqlalchemy import event
+from sqlalchemy.pool import NullPool, QueuePool
+
+SQLITE_PROFILE = os.environ.get("SQLITE_PROFILE", "production")
+
+PROFILE_SETTINGS = {
+    "journal_mode": os.environ.get("SQLITE_JOURNAL_MODE", "WAL"),
+    "synchronous": os.environ.get("SQLITE_SYNCHRONOUS", "NORMAL"),
+    "busy_timeout_ms": int(os.environ.get("SQLITE_BUSY_TIMEOUT_MS", "5000")),
+    "mmap_size": int(os.environ.get("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024))),
+    # Negative cache_size is in KiB rather than pages
+    "cache_size_kb": int(os.environ.get("SQLITE_CACHE_SIZE_KB", "20000")),
+    "pool": os.environ.get("SQLITE_POOL", "queue"),
+    "pool_size": int(os.environ.get("SQLITE_POOL_SIZE", "5")),
+    # Room for every gthread request thread plus the outbox dispatcher threads
+    "max_overflow": int(os.environ.get("SQLITE_MAX_OVERFLOW", "10")),
+}
+
+# Engines are shared by the main app and the lazy sub-apps; register the hook once
+_configured_engines = weakref.WeakSet()
+
+
+def sqlite_engine_options(profile=None):
+    """Return SQLALCHEMY_ENGINE_OPTIONS for the given profile"""
+    profile = profile or SQLITE_PROFILE
+    if profile != "production":
+        return {"pool_pre_ping": True}
+
+    settings = PROFILE_SETTINGS
+    options = {
+        "connect_args": {
+            # The driver-level timeout is the busy timeout used while connecting
+            "timeout": settings["busy_timeout_ms"] / 1000.0,
+            "check_same_thread": False,
+        }
+    }
+    if settings["pool"] == "null":
+        # A fresh connection per checkout; useful when workers fork after startup
+        options["poolclass"] = NullPool
+    else:
+        # Local file connections cannot go stale, so no pre-ping round trip
+        options["poolclass"] = QueuePool
+        options["pool_size"] = settings["pool_size"]
+        options["max_overflow"] = settings["max_overflow"]
+    return options
+
+
+def apply_sqlite_pragmas(engine, profile=None):
+    """Register a connect hook that applies the profile's pragmas to each new connection"""
+    profile = profile or SQLITE_PROFILE
+    if profile != "production" or engine.dialect.name != "sqlite" or engine in _configured_engines:
+        return
+    _configured_engines.add(engine)
+
+    settings = PROFILE_SETTINGS
+
+    @event.listens_for(engine, "connect")
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            cursor.execute(f"PRAGMA journal_mode={settings['journal_mode']}")
+            cursor.execute(f"PRAGMA synchronous={settings['synchronous']}")
+            cursor.execute(f"PRAGMA busy_timeout={settings['busy_timeout_ms']:d}")
+            cursor.execute(f"PRAGMA mmap_size={settings['mmap_size']:d}")
+            cursor.execute(f"PRAGMA cache_size={-settings['cache_size_kb']:d}")
+            cursor.execute("PRAGMA temp_store=MEMORY")
+        finally:
+            cursor.close()
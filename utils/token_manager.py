@@ -0,0 +1,133 @@
+"""
+In-memory QuickBooks token cache with proactive, single-flight refresh
+The token file is only re-read when its mtime changes, so routes can ask for
+the token on every request without touching disk. A daemon thread refreshes
+the access token shortly before it expires. Refreshes are single-flight:
+a thread lock covers this worker and an fcntl lock next to the token file
+covers other gunicorn workers; whoever gets the lock second re-reads the file
+and finds the token already refreshed.
+"""
+import fcntl
+import os
+from datetime import datetime, timedelta
+from threading import Lock, Thread, Event
+
+from utils.http_clients import quickbooks_session, QB_TIMEOUT
+from utils.qbo_scheduler import qbo_scheduler
+from utils.token_storage import TOKEN_FILE, load_token_from_file, save_token_to_file, is_token_valid
+
+QB_TOKEN_REFRESH_MARGIN_SECONDS = int(os.environ.get("QB_TOKEN_REFRESH_MARGIN_SECONDS", "600"))
+QB_TOKEN_CHECK_INTERVAL_SECONDS = int(os.environ.get("QB_TOKEN_CHECK_INTERVAL_SECONDS", "60"))
+
+
+class TokenManager:
+    def __init__(self, token_url, client_id, client_secret):
+        self.token_url = token_url
+        self.client_id = client_id
+        self.client_secret = client_secret
+        # Same file that load_token_from_file/save_token_to_file use
+        self.token_file = TOKEN_FILE
+        self.lock_file = f"{TOKEN_FILE}.lock"
+        self._token = None
+        self._file_stamp = None
+        self._lock = Lock()
+        self._refresh_lock = Lock()
+        self._refresher = None
+        self._stop = Event()
+
+    def _stamp(self):
+        try:
+            stat = os.stat(self.token_file)
+            return stat.st_mtime_ns, stat.st_size
+        except OSError:
+            return None
+
+    def get_token(self):
+        """Return the cached token dict (or None), re-reading the file only if it changed"""
+        self._ensure_refresher()
+        stamp = self._stamp()
+        with self._lock:
+            if stamp != self._file_stamp:
+                self._token = load_token_from_file() if stamp else None
+                self._file_stamp = stamp
+            return self._token
+
+    def needs_refresh(self, token_data):
+        if not token_data or not token_data.get("refresh_token"):
+            return False
+        margin = timedelta(seconds=QB_TOKEN_REFRESH_MARGIN_SECONDS)
+        return datetime.utcnow() + margin >= token_data["expires_at"]
+
+    def get_valid_token(self):
+        """Return a token that is not expired, refreshing first if it is about to expire"""
+        token_data = self.get_token()
+        if self.needs_refresh(token_data):
+            token_data = self.refresh() or token_data
+        return token_data if token_data and is_token_valid(token_data) else None
+
+    def refresh(self):
+        """Refresh the access token once across threads and workers; returns the new token"""
+        with self._refresh_lock:
+            with open(self.lock_file, "a") as lock_handle:
+                fcntl.flock(lock_handle, fcntl.LOCK_EX)
+                try:
+                    # Another worker may have refreshed while we waited for the lock
+                    token_data = self.get_token()
+                    if not self.needs_refresh(token_data):
+                        return token_data
+                    return self._refresh_from_api(token_data)
+                finally:
+                    fcntl.flock(lock_handle, fcntl.LOCK_UN)
+
+    def _refresh_from_api(self, token_data):
+        print(f"[QB] Refreshing access token for realm {token_data.get('realm_id')}")
+        try:
+            response = qbo_scheduler.request("oauth", lambda: quickbooks_session.post(
+                self.token_url,
+                headers={
+                    "Accept": "application/json",
+                    "Content-Type": "application/x-www-form-urlencoded"
+                },
+                auth=(self.client_id, self.client_secret),
+                data={
+                    "grant_type": "refresh_token",
+                    "refresh_token": token_data["refresh_token"]
+                },
+                timeout=QB_TIMEOUT
+            ))
+        except Exception as e:
+            print(f"[QB] Token refresh failed: {e}")
+            return None
+        if response.status_code != 200:
+            print(f"[QB] Token refresh rejected: {response.status_code} - {response.text[:200]}")
+            return None
+        tokens = response.json()
+        save_token_to_file(
+            tokens.get("access_token"),
+            # Intuit may rotate the refresh token; keep the old one if not
+            tokens.get("refresh_token") or token_data["refresh_token"],
+            token_data.get("realm_id"),
+            tokens.get("expires_in", 3600)
+        )
+        return self.get_token()
+
+    def invalidate(self):
+        with self._lock:
+            self._file_stamp = None
+            self._token = None
+
+    def _ensure_refresher(self):
+        if self._refresher is not None and self._refresher.is_alive():
+            return
+        with self._lock:
+            if self._refresher is None or not self._refresher.is_alive():
+                self._refresher = Thread(target=self._refresh_loop, name="qb-token-refresher", daemon=True)
+                self._refresher.start()
+
+    def _refresh_loop(self):
+        while not self._stop.wait(QB_TOKEN_CHECK_INTERVAL_SECONDS):
+            try:
+                if self.needs_refresh(self.get_token()):
+                    self.refresh()
+            except Exception as e:
+                print(f"[QB] Background token refresh error: {e}")